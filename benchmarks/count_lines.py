@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time fyrd.run.count_lines on plain, gzipped and bzipped text.
+
+Compares the old implementation (a cat | wc -l | awk pipeline through
+run.cmd, or a text mode block read with force_blocks) with the native
+counter, single threaded and at several thread counts, and prints the
+seconds taken and the throughput in uncompressed MB/s. Every count is checked
+against the others.
+
+By default files of random tab separated records are generated in a
+temporary directory. Use --input to count real files instead, e.g.:
+
+    python benchmarks/count_lines.py --input reads.fastq reads.fastq.gz -t 1 8
+"""
+from __future__ import print_function
+import os
+import sys
+import bz2
+import time
+import gzip
+import shutil
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from fyrd import run
+
+
+def make_input(path, megabytes):
+    """Write about megabytes of records to path, compressed by extension."""
+    rows = ['{0}\tgene{1}\t{2:.6f}\t{3}\n'.format(
+        i, random.randint(0, 20000), random.random(),
+        ''.join(random.choice('ACGT') for _ in range(60))
+    ) for i in range(20000)]
+    block = ''.join(rows).encode()
+    if path.endswith('.gz'):
+        fout = gzip.open(path, 'wb', 6)
+    elif path.endswith('.bz2'):
+        fout = bz2.BZ2File(path, 'wb')
+    else:
+        fout = open(path, 'wb')
+    with fout:
+        for _ in range(max(1, megabytes*1024*1024//len(block))):
+            fout.write(block)
+
+
+def old_count_lines(infile, force_blocks=False):
+    """The count_lines from before the native counter."""
+    if run.which('wc') and not force_blocks:
+        if infile.endswith('.gz'):
+            cat = 'zcat'
+        elif infile.endswith('.bz2'):
+            cat = 'bzcat'
+        else:
+            cat = 'cat'
+        command = "{cat} {infile} | wc -l | awk '{{print $1}}'".format(
+            cat=cat, infile=infile
+        )
+        return int(run.cmd(command)[1])
+    with run.open_zipped(infile) as fin:
+        return sum(bl.count("\n") for bl in run.block_read(fin))
+
+
+def main(argv=None):
+    """Parse arguments and print the table."""
+    if not argv:
+        argv = sys.argv[1:]
+
+    parser  = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-i', '--input', nargs='+',
+                        help="Files to count, default generated")
+    parser.add_argument('-m', '--megabytes', type=int, default=200,
+                        help="Uncompressed size of the generated files")
+    parser.add_argument('-t', '--threads', type=int, nargs='+',
+                        help="Thread counts to try, default 1 and all cores")
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+                        help="Take the best of this many runs")
+
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp(prefix='fyrd_bench.')
+    threads = args.threads if args.threads else sorted(
+        set([1, multiprocessing.cpu_count()])
+    )
+    try:
+        infiles = args.input
+        if not infiles:
+            infiles = [os.path.join(tmpdir, 'records.txt' + i)
+                       for i in ['', '.gz', '.bz2']]
+            for infile in infiles:
+                print('Writing {0} MB to {1}'.format(args.megabytes, infile))
+                make_input(infile, args.megabytes)
+        print('{0:<16} {1:<14} {2:>12} {3:>10} {4:>10}'.format(
+            'file', 'count_lines', 'lines', 'seconds', 'MB/s'
+        ))
+        for infile in infiles:
+            with run.open_zipped(infile, 'rb') as fin:
+                size = sum([len(i) for i in run.block_read(fin, 1024*1024)])
+            runs = [('old wc', lambda: old_count_lines(infile)),
+                    ('old blocks', lambda: old_count_lines(infile, True)),
+                    ('new blocks', lambda: run.count_lines(infile, True))]
+            if not infile.endswith(('.gz', '.bz2')):
+                runs += [('threads={0}'.format(i),
+                          lambda i=i: run.count_lines(infile, threads=i))
+                         for i in threads]
+            else:
+                runs.append(('new', lambda: run.count_lines(infile)))
+            counts = set()
+            for name, counter in runs:
+                took = None
+                for _ in range(args.repeats):
+                    start = time.time()
+                    counts.add(counter())
+                    took = min(took, time.time() - start) if took else (
+                        time.time() - start
+                    )
+                print('{0:<16} {1:<14} {2:>12} {3:>10.2f} {4:>10.1f}'.format(
+                    os.path.basename(infile)[-16:], name, max(counts), took,
+                    size/1024./1024/took
+                ))
+            if len(counts) != 1:
+                print('Counts differ: {0}'.format(sorted(counts)))
+                return 1
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__' and '__file__' in globals():
+    sys.exit(main())
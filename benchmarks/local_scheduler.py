@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Simulate the local queue scheduling policies on a synthetic workload.
+
+Runs the same `fyrd.batch_systems.local.Scheduler` that the local job_runner
+uses against simulated time, so thousands of jobs take seconds. Reports
+throughput, core utilization, and wait times for each policy.
+
+The default workload is a steady stream of short single core jobs with an
+occasional job that needs every core, the case where first-fit scheduling
+starves the wide jobs.
+"""
+from __future__ import print_function
+import os
+import sys
+import heapq
+import random
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fyrd.batch_systems import local
+
+
+def make_workload(jobs, cores, wide_fraction, high_fraction, interval,
+                  seed=1):
+    """Return a list of job dictionaries sorted by arrival time."""
+    rand = random.Random(seed)
+    workload = []
+    arrival = 0.0
+    for jobno in range(jobs):
+        arrival += rand.expovariate(1.0/interval)
+        if rand.random() < wide_fraction:
+            threads = cores
+            runtime = rand.expovariate(1.0/300)
+        else:
+            threads = 1
+            runtime = rand.expovariate(1.0/60)
+        runtime = max(runtime, 1)
+        workload.append({
+            'jobno': jobno, 'arrival': arrival, 'threads': threads,
+            'runtime': runtime,
+            # Users overestimate, the time keyword is a limit
+            'estimate': int(runtime*rand.uniform(1, 3)) + 1,
+            'priority': 100 if rand.random() < high_fraction else 0,
+        })
+    return workload
+
+
+def simulate(workload, cores, policy):
+    """Run workload through a Scheduler, return a dict of statistics."""
+    sched  = local.Scheduler(cores, policy=policy)
+    jobs   = {j['jobno']: j for j in workload}
+    waits  = {}
+    ends   = []  # heap of (end, jobno)
+    todo   = list(workload)
+    now    = 0.0
+    busy   = 0.0
+    while todo or ends or sched.queued:
+        times = []
+        if todo:
+            times.append(todo[0]['arrival'])
+        if ends:
+            times.append(ends[0][0])
+        if not times:
+            raise RuntimeError('Jobs queued but nothing can ever start')
+        now = min(times)
+        while ends and ends[0][0] <= now:
+            sched.finish(heapq.heappop(ends)[1])
+        while todo and todo[0]['arrival'] <= now:
+            job = todo.pop(0)
+            sched.queue(job['jobno'], job['threads'], priority=job['priority'],
+                        runtime=job['estimate'], now=now)
+        for jobno in sched.schedule(now=now):
+            job = jobs[jobno]
+            waits[jobno] = now - job['arrival']
+            busy += job['threads']*job['runtime']
+            heapq.heappush(ends, (now + job['runtime'], jobno))
+    wide = [waits[j['jobno']] for j in workload if j['threads'] == cores]
+    high = [waits[j['jobno']] for j in workload if j['priority']]
+    allw = sorted(waits.values())
+    return {
+        'policy': policy,
+        'makespan': now,
+        'throughput': len(workload)/now*3600,
+        'utilization': busy/(cores*now),
+        'mean_wait': sum(allw)/len(allw),
+        'p95_wait': allw[int(len(allw)*0.95)],
+        'wide_mean': sum(wide)/len(wide) if wide else 0,
+        'wide_max': max(wide) if wide else 0,
+        'high_mean': sum(high)/len(high) if high else 0,
+    }
+
+
+def main(argv=None):
+    """Parse arguments and print a table of results."""
+    if not argv:
+        argv = sys.argv[1:]
+
+    parser  = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-j', '--jobs', type=int, default=5000,
+                        help="Number of jobs to simulate")
+    parser.add_argument('-c', '--cores', type=int, default=16,
+                        help="Cores on the simulated machine")
+    parser.add_argument('-w', '--wide', type=float, default=0.02,
+                        help="Fraction of jobs that use every core")
+    parser.add_argument('-p', '--high', type=float, default=0.05,
+                        help="Fraction of jobs with high priority")
+    parser.add_argument('-i', '--interval', type=float, default=12,
+                        help="Mean seconds between job arrivals")
+    parser.add_argument('-s', '--seed', type=int, default=1,
+                        help="Random seed")
+    parser.add_argument('--policies', nargs='+', default=local.POLICIES,
+                        choices=local.POLICIES, help="Policies to compare")
+
+    args = parser.parse_args(argv)
+
+    workload = make_workload(args.jobs, args.cores, args.wide, args.high,
+                             args.interval, args.seed)
+    cols = ['policy', 'makespan', 'throughput', 'utilization', 'mean_wait',
+            'p95_wait', 'wide_mean', 'wide_max', 'high_mean']
+    print('Times in simulated seconds, throughput in jobs/hour')
+    print(''.join([c.rjust(12) for c in cols]))
+    for policy in args.policies:
+        stats = simulate(workload, args.cores, policy)
+        row = [stats['policy'].rjust(12)]
+        for col in cols[1:]:
+            row.append('{0:.2f}'.format(stats[col]).rjust(12))
+        print(''.join(row))
+
+
+if __name__ == '__main__' and '__file__' in globals():
+    sys.exit(main())
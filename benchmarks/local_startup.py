@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time a cold start of the local queue daemon.
+
+Each trial runs in a fresh python process with the daemon stopped, and
+times (after importing fyrd) how long it takes to get a working server
+connection and how long until a trivial job has finished. The daemon is
+stopped again at the end of each trial.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+TRIAL = r"""
+import sys, json, time
+sys.path.insert(0, {root!r})
+import fyrd
+from fyrd.batch_systems import local
+local.kill_queue()
+start = time.time()
+server = local.get_server()
+server.get([])
+connected = time.time() - start
+job = fyrd.Job('true', qtype='local', clean_files=True,
+               clean_outputs=True).submit()
+job.wait()
+done = time.time() - start
+local.daemon_manager('stop')
+print(json.dumps({{'connected': connected, 'first_job': done}}))
+"""
+
+
+def trial():
+    """Run one cold start in a new process, return the timings."""
+    out = subprocess.check_output(
+        [sys.executable, '-c', TRIAL.format(root=ROOT)],
+        stderr=open(os.devnull, 'w')
+    )
+    return json.loads(out.decode().strip().split('\n')[-1])
+
+
+def main(argv=None):
+    """Parse arguments and print the timings."""
+    if not argv:
+        argv = sys.argv[1:]
+
+    parser  = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-n', '--trials', type=int, default=5,
+                        help="Number of cold starts to time")
+
+    args = parser.parse_args(argv)
+
+    results = [trial() for _ in range(args.trials)]
+    for key in ['connected', 'first_job']:
+        times = sorted([r[key] for r in results])
+        print('{0:>10}: min {1:.3f}s  median {2:.3f}s  max {3:.3f}s'.format(
+            key, times[0], times[len(times)//2], times[-1]
+        ))
+
+
+if __name__ == '__main__' and '__file__' in globals():
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the function job serializers on typical parapply payloads.
+
+For every serializer in fyrd.serialize.SERIALIZERS, each payload is written
+with fyrd.serialize.dump() and read back with load(), both in-band and with
+out-of-band buffer files. Prints the best round trip time of several repeats
+and the total bytes written (pickle plus buffers).
+
+Payloads:
+    shard : (function, (DataFrame shard,), kwargs), a parapply input
+    frame : a DataFrame, a parapply output
+    array : a float numpy array
+    records : a list of small dicts, plain python data
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+from fyrd import serialize
+from fyrd import helpers
+
+
+def make_payloads(rows):
+    """Return an ordered list of (name, payload)."""
+    frame = pd.DataFrame({
+        'a': np.arange(rows), 'b': np.random.random(rows),
+        'c': np.random.random(rows), 'd': np.arange(rows) % 7
+    })
+    return [
+        ('shard', (helpers._run_apply, (frame, sum), {'pandas_kwds': {}})),
+        ('frame', frame),
+        ('array', np.random.random(rows*4)),
+        ('records', [{'id': i, 'name': 'gene{0}'.format(i), 'score': i/3.}
+                     for i in range(rows//10)]),
+    ]
+
+
+def roundtrip(obj, path, serializer, buffer_dir, repeats):
+    """Return best round trip seconds, bytes written and serializer used."""
+    best = None
+    for _ in range(repeats):
+        start = time.time()
+        buffers = serialize.dump(obj, path, buffer_dir=buffer_dir,
+                                 serializer=serializer)
+        serialize.load(path)
+        took = time.time() - start
+        best = took if best is None else min(best, took)
+        size = os.path.getsize(path) + sum(
+            [os.path.getsize(i) for i in buffers]
+        )
+        with open(path, 'rb') as fin:
+            used = serialize.read_header(fin)['serializer']
+        serialize.remove(path)
+    return best, size, used
+
+
+def main(argv=None):
+    """Parse arguments and print the table."""
+    if not argv:
+        argv = sys.argv[1:]
+
+    parser  = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-r', '--rows', type=int, default=1000000,
+                        help="Rows in the DataFrame payloads")
+    parser.add_argument('-n', '--repeats', type=int, default=3,
+                        help="Repeats of each round trip, best is kept")
+
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp(prefix='fyrd_bench.')
+    path = os.path.join(tmpdir, 'payload.pickle')
+    modes = [('in-band', None)]
+    if serialize.OOB:
+        modes.append(('oob', tmpdir))
+    print('{0:<8} {1:<12} {2:<8} {3:>10} {4:>12}  {5}'.format(
+        'payload', 'serializer', 'mode', 'seconds', 'bytes', 'used'))
+    try:
+        for name, payload in make_payloads(args.rows):
+            for serializer in serialize.SERIALIZERS:
+                for mode, buffer_dir in modes:
+                    took, size, used = roundtrip(
+                        payload, path, serializer, buffer_dir, args.repeats
+                    )
+                    print('{0:<8} {1:<12} {2:<8} {3:>10.4f} {4:>12}  {5}'
+                          .format(name, serializer, mode, took, size, used))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__' and '__file__' in globals():
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time fyrd.run.split_file on a gzipped text file.
+
+Compares the old single threaded split (python gzip in, a line at a time,
+python gzip out) with split_file at several thread counts, and prints the
+seconds taken and the throughput in uncompressed MB/s.
+
+By default a file of random tab separated records is generated in a temporary
+directory. Use --input to split a real file instead, the 10-100 GB inputs this
+is meant for are best given this way, e.g.:
+
+    python benchmarks/split.py --input reads.fastq.gz --parts 200 -t 1 8 32
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import gzip
+import shutil
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from fyrd import run
+
+
+def make_input(path, megabytes):
+    """Write about megabytes of gzipped records to path."""
+    rows = ['{0}\tgene{1}\t{2:.6f}\t{3}\n'.format(
+        i, random.randint(0, 20000), random.random(),
+        ''.join(random.choice('ACGT') for _ in range(60))
+    ) for i in range(20000)]
+    block = ''.join(rows).encode()
+    with gzip.open(path, 'wb', 6) as fout:
+        for _ in range(max(1, megabytes*1024*1024//len(block))):
+            fout.write(block)
+
+
+def old_split(infile, parts, outpath):
+    """The line by line split_file from before the parallel writer."""
+    num_lines = int(run.count_lines(infile)/int(parts)) + 1
+    ext = infile.split('.')[-1]
+    name = os.path.join(outpath, os.path.basename(infile))
+    cnt = 0
+    currjob = 1
+    outfiles = ['{0}.split_{1}.{2}'.format(name, str(currjob).zfill(4), ext)]
+    with run.open_zipped(infile) as fin:
+        sfile = run.open_zipped(outfiles[-1], 'w')
+        for line in fin:
+            cnt += 1
+            sfile.write(line)
+            if cnt == num_lines:
+                sfile.close()
+                currjob += 1
+                outfiles.append('{0}.split_{1}.{2}'.format(
+                    name, str(currjob).zfill(4), ext
+                ))
+                sfile = run.open_zipped(outfiles[-1], 'w')
+                cnt = 0
+        sfile.close()
+    return outfiles
+
+
+def main(argv=None):
+    """Parse arguments and print the table."""
+    if not argv:
+        argv = sys.argv[1:]
+
+    parser  = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-i', '--input',
+                        help="A gzipped file to split, default generated")
+    parser.add_argument('-m', '--megabytes', type=int, default=200,
+                        help="Uncompressed size of the generated file")
+    parser.add_argument('-p', '--parts', type=int, default=20,
+                        help="Number of split files")
+    parser.add_argument('-t', '--threads', type=int, nargs='+',
+                        help="Thread counts to try, default 1 and all cores")
+    parser.add_argument('--skip-old', action='store_true',
+                        help="Do not time the old line by line split")
+
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp(prefix='fyrd_bench.')
+    threads = args.threads if args.threads else sorted(
+        set([1, multiprocessing.cpu_count()])
+    )
+    try:
+        infile = args.input
+        if not infile:
+            infile = os.path.join(tmpdir, 'records.txt.gz')
+            print('Writing {0} MB to {1}'.format(args.megabytes, infile))
+            make_input(infile, args.megabytes)
+        size = 0
+        with gzip.open(infile, 'rb') as fin:
+            for block in iter(lambda: fin.read(1024*1024), b''):
+                size += len(block)
+        print('{0}: {1:.1f} MB compressed, {2:.1f} MB uncompressed'.format(
+            infile, os.path.getsize(infile)/1024./1024, size/1024./1024
+        ))
+        outpath = os.path.join(tmpdir, 'splits')
+        os.mkdir(outpath)
+        runs = [] if args.skip_old else [('old', None)]
+        runs += [('threads={0}'.format(i), i) for i in threads]
+        print('{0:<12} {1:>10} {2:>10}'.format('split', 'seconds', 'MB/s'))
+        for name, count in runs:
+            start = time.time()
+            if count is None:
+                files = old_split(infile, args.parts, outpath)
+            else:
+                files = run.split_file(infile, args.parts, outpath,
+                                       threads=count)
+            took = time.time() - start
+            print('{0:<12} {1:>10.2f} {2:>10.1f}'.format(
+                name, took, size/1024./1024/took
+            ))
+            for fl in files:
+                os.remove(fl)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__' and '__file__' in globals():
+    sys.exit(main())
@@ -165,6 +165,7 @@ from . import job
 from . import helpers
 from . import batch_systems
 from . import conf
+from . import cache
 from .run import check_pid as _check_pid
 
 from .queue import Queue
@@ -182,6 +183,7 @@ from .basic import wait
 from .basic import get
 
 from .helpers import jobify
+from .helpers import mapreduce
 
 from .conf import set_profile
 from .conf import get_profile
@@ -192,5 +194,6 @@ option_help = batch_systems.options.option_help
 #  import fyrd.batch_system as batch_system
 
 __all__ = ['Job', 'Queue', 'wait', 'get', 'submit', 'submit_file', 'jobify',
-           'make_job_file', 'clean', 'clean_dir', 'check_queue', 'option_help',
-           'set_profile', 'get_profile', 'get_profiles', 'conf', 'helpers']
+           'mapreduce', 'make_job_file', 'clean', 'clean_dir', 'check_queue',
+           'option_help', 'set_profile', 'get_profile', 'get_profiles', 'conf',
+           'helpers', 'cache']
@@ -1098,7 +1098,8 @@ def command_line_parser():
     clean.add_argument('-s', '--suffix',
                        default=fyrd.conf.get_option('jobs', 'suffix'),
                        help="Suffix to use for cleaning")
-    clean.add_argument('-q', '--qtype', choices=('torque', 'slurm', 'local'),
+    clean.add_argument('-q', '--qtype', choices=('torque', 'slurm', 'local',
+                                                   'inline'),
                        help="Limit deletions to this qtype")
 
     # We store this as false as the question is a negative
@@ -24,6 +24,7 @@ get
     Get results of jobs when they complete.
 """
 import os  as _os
+import re  as _re
 import sys as _sys
 from time import sleep as _sleep
 from subprocess import CalledProcessError as _CalledProcessError
@@ -37,6 +38,7 @@ from . import run   as _run
 from . import conf  as _conf
 from . import queue as _queue
 from . import logme as _logme
+from . import serialize as _serialize
 from . import batch_systems as _batch
 from . import ClusterError as _ClusterError
 from .job import Job
@@ -281,6 +283,9 @@ def clean_dir(directory=None, suffix=None, qtype=None, confirm=False,
                  _func.<suffix>.py.pickle.in
                  _func.<suffix>.py.pickle.out
 
+    Plus the .buf out-of-band buffer files and .blob links of any of the
+    pickle files, and any unused blobs in the .fyrd_blobs store.
+
     .. note:: This function will change in the future to use batch system
               defined paths.
 
@@ -320,7 +325,7 @@ def clean_dir(directory=None, suffix=None, qtype=None, confirm=False,
                        '.' + suffix + '.job']
 
     if qtype:
-        if qtype == 'local':
+        if qtype in ('local', 'inline'):
             extensions.append('.' + suffix)
         elif qtype == 'slurm':
             extensions += ['.' + suffix + '.sbatch', '.' + suffix + '.script']
@@ -341,9 +346,12 @@ def clean_dir(directory=None, suffix=None, qtype=None, confirm=False,
 
     deleted = []
     for f in files:
+        # Out-of-band buffers and blob links are <pickle file>.<id>.buf|blob
+        name = _re.sub(r'\.[^.]+\.(buf|blob)$', '', f)
         for extension in extensions:
-            if f.endswith(extension):
+            if name.endswith(extension):
                 deleted.append(f)
+                break
 
     deleted = sorted(deleted)
     delete  = False
@@ -370,7 +378,11 @@ def clean_dir(directory=None, suffix=None, qtype=None, confirm=False,
 
     if delete and deleted:
         for f in deleted:
-            _os.remove(f)
+            # Buffers may already be gone with their pickle file
+            _serialize.remove(f)
+        deleted += _serialize.clean_blobs(
+            _os.path.join(directory, _serialize.BLOB_DIR)
+        )
         if confirm:
             _sys.stdout.write('Done\n')
 
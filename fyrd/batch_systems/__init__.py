@@ -12,6 +12,10 @@ To add new systems, create a new batch system with identical function and
 classes names and return/yield values to those in an existing definition. You
 will also need to update the options.py script to include keywords for your
 system and the get_cluster_environment() function to include autodetection.
+
+The 'inline' system is never autodetected, it runs jobs in a thread pool in
+the current process and must be requested explicitly with the queue_type
+option or by passing qtype='inline'.
 """
 from importlib import import_module as _import
 
@@ -19,7 +23,7 @@ from .. import run as _run
 from .. import logme as _logme
 from .. import ClusterError as _ClusterError
 
-DEFINED_SYSTEMS = {'torque', 'slurm', 'local'}
+DEFINED_SYSTEMS = {'torque', 'slurm', 'local', 'inline'}
 
 MODE = None
 
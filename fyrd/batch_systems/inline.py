@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+Run jobs in a thread pool inside the current python process.
+
+This batch system is intended for testing and for very small workloads. There
+is no daemon, no database and no inter-process communication: every job
+script is run with bash by a `concurrent.futures.ThreadPoolExecutor` worker,
+and the job table lives in this module. Jobs do not survive the end of the
+python process that submitted them, and are only visible to that process.
+
+Because the scripts are run as subprocesses, the threads spend their time
+waiting and a thread pool gives true parallelism, the number of workers is set
+by max_jobs in the [inline] section of the config.
+
+Like the local queue, `parse_strange_options()` strips all keyword arguments,
+the only arguments we pay attention to are:
+    outfile : STDOUT goes here
+    errfile : STDERR goes here
+    runpath : The directory to run in
+    depends : Job dependencies
+
+Dependent jobs start once all of their dependencies completed successfully.
+If a dependency fails or is killed, the dependent job is killed too.
+
+cores is recorded but each job uses exactly one worker.
+"""
+import os as _os
+import getpass as _getpass
+import socket as _socket
+import threading as _threading
+import subprocess as _sub
+import multiprocessing as _mp
+from itertools import count as _count
+
+try:
+    from concurrent import futures as _futures
+except ImportError:  # python2 without the futures backport
+    _futures = None
+
+from six import text_type as _txt
+from six import string_types as _str
+
+from .. import conf as _conf
+from .. import logme as _logme
+from .. import ClusterError as _ClusterError
+from .. import script_runners as _scrpts
+from .. import submission_scripts as _sscrpt
+from . import options as _options
+_Script = _sscrpt.Script
+
+
+PREFIX = ''
+SUFFIX = 'job'
+
+# Default number of workers, can be overriden in the config file
+MAX_JOBS = _mp.cpu_count()
+
+# All access to the job table holds this lock
+_LOCK = _threading.RLock()
+
+# {jobno: InlineJob}
+_JOBS = {}
+
+# {jobno: [jobnos of the pending jobs that depend on it]}
+_DEPENDENTS = {}
+
+_JOBNOS = _count(1)
+
+_EXECUTOR = None
+
+
+class InlineJob(object):
+
+    """A record for every job submitted in this process.
+
+    Attributes
+    ----------
+    jobno : int
+    name : str
+    command : list
+        The command passed to subprocess
+    threads : int
+        The requested number of cores
+    state : {'pending', 'running', 'completed', 'failed', 'killed'}
+    exitcode : int
+        The exit code of the job if state in {'completed', 'failed'}
+    depends : list of int
+        Jobs that must complete before this job can start
+    runpath : str, optional
+        Path to the directory to run in
+    outfile, errfile : str, optional
+        Paths to the output files
+    """
+
+    def __init__(self, jobno, name, command, threads=1, depends=None,
+                 runpath=None, outfile=None, errfile=None):
+        """Set attributes, all jobs start pending."""
+        self.jobno    = jobno
+        self.name     = name
+        self.command  = command
+        self.threads  = threads
+        self.state    = 'pending'
+        self.exitcode = None
+        self.depends  = depends if depends else []
+        self.runpath  = runpath
+        self.outfile  = outfile
+        self.errfile  = errfile
+        self.future   = None
+        self.process  = None
+
+    @property
+    def done(self):
+        """True if the job will not run again."""
+        return self.state in ['completed', 'failed', 'killed']
+
+    def __repr__(self):
+        """Display summary."""
+        return 'InlineJob<{0}:{1};state:{2};exitcode:{3}>'.format(
+            self.jobno, self.name, self.state, self.exitcode
+        )
+
+
+###############################################################################
+#                                  Execution                                  #
+###############################################################################
+
+
+def get_executor():
+    """Return the module thread pool, creating it if needed."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        max_jobs = _conf.get_option('inline', 'max_jobs')
+        max_jobs = int(max_jobs) if max_jobs else MAX_JOBS
+        # Split jobs wait on their children from inside a worker, so we need
+        # room for both, as in the local queue
+        _EXECUTOR = _futures.ThreadPoolExecutor(max_workers=max(max_jobs, 4))
+    return _EXECUTOR
+
+
+def shutdown(wait=True):
+    """Shut down the thread pool, the next submission creates a new one."""
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=wait)
+        _EXECUTOR = None
+
+
+def _run_job(job):
+    """Run job in the current thread, called by the executor."""
+    with _LOCK:
+        if job.state != 'pending':
+            return
+        job.state = 'running'
+    stdout = open(job.outfile, 'w') if job.outfile else None
+    stderr = open(job.errfile, 'w') if job.errfile else None
+    try:
+        # kill() holds the lock too, so it either sees the process or we see
+        # that the job was killed while starting
+        with _LOCK:
+            if job.state == 'running':
+                job.process = _sub.Popen(
+                    job.command, stdout=stdout, stderr=stderr,
+                    cwd=job.runpath if job.runpath else None
+                )
+        code = job.process.wait() if job.process else None
+    except OSError as err:
+        _logme.log('Inline job {0} failed to start: {1}'
+                   .format(job.jobno, err), 'error')
+        code = 127
+    finally:
+        for fle in [stdout, stderr]:
+            if fle:
+                fle.close()
+    with _LOCK:
+        if job.state == 'running':
+            job.exitcode = code
+            job.state = 'completed' if code == 0 else 'failed'
+        _start_ready(_DEPENDENTS.pop(job.jobno, []))
+
+
+def _start_ready(jobnos):
+    """Start the pending jobs in jobnos if their dependencies completed.
+
+    Jobs with a failed or killed dependency are killed, and so are their own
+    dependents. Jobs still waiting on a dependency are left pending.
+    """
+    with _LOCK:
+        jobnos = list(jobnos)
+        while jobnos:
+            job = _JOBS[jobnos.pop(0)]
+            if job.state != 'pending' or job.future is not None:
+                continue
+            states = [_JOBS[i].state for i in job.depends]
+            if 'failed' in states or 'killed' in states:
+                _logme.log('Inline job {0} killed as a dependency did not '
+                           'complete'.format(job.jobno), 'warn')
+                job.state = 'killed'
+                jobnos += _DEPENDENTS.pop(job.jobno, [])
+            elif all([i == 'completed' for i in states]):
+                job.future = get_executor().submit(_run_job, job)
+
+
+###############################################################################
+#                             Functionality Test                              #
+###############################################################################
+
+
+def queue_test(warn=True):
+    """Check that this batch system can be used.
+
+    Parameters
+    ----------
+    warn : bool
+        log a warning on fail
+
+    Returns
+    -------
+    batch_system_functional : bool
+    """
+    if _futures is None:
+        log_level = 'error' if warn else 'debug'
+        _logme.log('concurrent.futures is not available, install the '
+                   'futures package to use the inline batch system',
+                   log_level)
+        return False
+    return True
+
+
+###############################################################################
+#                           Normalization Functions                           #
+###############################################################################
+
+
+def normalize_job_id(job_id):
+    """Convert the job id into job_id, array_id."""
+    return str(int(job_id)), None
+
+
+def normalize_state(state):
+    """Convert state into standardized (slurm style) state."""
+    state = state.lower()
+    if state == 'queued':
+        state = 'pending'
+    return state
+
+
+###############################################################################
+#                               Job Submission                                #
+###############################################################################
+
+
+def gen_scripts(job_object, command, args, precmd, modstr):
+    """Build the submission script objects.
+
+    Parameters
+    ---------
+    job_object : fyrd.job.Job
+    command : str
+        Command to execute
+    args : list
+        List of additional arguments, not used in this script.
+    precmd : str
+        String from options_to_string() to add at the top of the file, should
+        contain batch system directives
+    modstr : str
+        String to add after precmd, should contain module directives.
+
+    Returns
+    -------
+    fyrd.script_runners.Script
+        The submission script
+    None
+        Would be the exec_script, not used here.
+    """
+    scrpt = _os.path.join(
+        job_object.scriptpath,
+        '{0}.{1}.{2}'.format(job_object.name, job_object.suffix, SUFFIX)
+    )
+
+    sub_script = _scrpts.CMND_RUNNER_TRACK.format(
+        precmd=precmd, usedir=job_object.runpath, name=job_object.name,
+        command=command
+    )
+    return _Script(script=sub_script, file_name=scrpt), None
+
+
+def submit(file_name, dependencies=None, job=None, args=None, kwds=None):
+    """Submit any file with dependencies.
+
+    .. note:: this function can only use the following fyrd keywords:
+        cores, name, outfile, errfile, runpath
+
+    We get those in the following order:
+        1. Job object
+        2. args
+        3. kwds
+
+    Parameters
+    ----------
+    file_name : str
+        Path to an existing file
+    dependencies : list
+        List of dependencies
+    job : fyrd.job.Job, optional
+        A job object for the calling job, used to get cores, outfile, errfile,
+        runpath, and name if available
+    args : list, optional
+        A list of additional arguments, only parsed if list of tuple in the
+        format `[(key, value)]`. Comes from output of `parse_strange_options()`
+    kwds : dict or str, optional
+        A dictionary of keyword arguments to parse with options_to_string, or
+        a string of option:value,option,option:value,....
+        Used to get any of cores, outfile, errfile, runpath, or name
+
+    Returns
+    -------
+    job_id : str
+
+    Raises
+    ------
+    ClusterError
+        If the file does not exist or a dependency is not a job submitted in
+        this process
+    """
+    params = {}
+    needed_params = ['cores', 'outfile', 'errfile', 'runpath', 'name']
+    if job:
+        params['cores'] = job.cores
+        params['outfile'] = job.outfile
+        params['errfile'] = job.errfile
+        params['runpath'] = job.runpath
+        params['name'] = job.name
+    if kwds:
+        if not isinstance(kwds, dict):
+            kwds = {k: v for k, v in [i.split(':') for i in kwds.split(',')]}
+        _, extra_args = _options.options_to_string(kwds, qtype='inline')
+        for k, v in extra_args:
+            if k in needed_params:
+                params[k] = v
+    if args and isinstance(args[0], (list, tuple)):
+        for k, v in args:
+            if k in needed_params:
+                params[k] = v
+    if not params.get('cores'):
+        params['cores'] = 1
+    if not params.get('name'):
+        params['name'] = _os.path.basename(file_name)
+    if not _os.path.isfile(file_name):
+        raise _ClusterError('File {0} does not exist, cannot submit'
+                            .format(file_name))
+    depends = []
+    with _LOCK:
+        for dep in dependencies if dependencies else []:
+            dep = int(dep)
+            if dep not in _JOBS:
+                raise _ClusterError('Invalid dependency {0}, inline jobs can '
+                                    'only depend on other inline jobs'
+                                    .format(dep))
+            depends.append(dep)
+        jobno = next(_JOBNOS)
+        _JOBS[jobno] = InlineJob(
+            jobno, params['name'], ['bash', _os.path.abspath(file_name)],
+            threads=int(params['cores']), depends=depends,
+            runpath=params.get('runpath'), outfile=params.get('outfile'),
+            errfile=params.get('errfile')
+        )
+        # Only jobs that are still to finish release this one
+        for dep in depends:
+            if not _JOBS[dep].done:
+                _DEPENDENTS.setdefault(dep, []).append(jobno)
+        _start_ready([jobno])
+    return str(jobno)
+
+
+###############################################################################
+#                               Job Management                                #
+###############################################################################
+
+
+def kill(job_ids):
+    """Terminate all jobs in job_ids.
+
+    Parameters
+    ----------
+    job_ids : list or str
+        A list of valid job ids or a single valid job id
+
+    Returns
+    -------
+    success : bool
+    """
+    if isinstance(job_ids, (_str, _txt, int)):
+        job_ids = [job_ids]
+    good = True
+    released = []
+    with _LOCK:
+        for job_id in job_ids:
+            job = _JOBS.get(int(job_id))
+            if not job:
+                _logme.log('Job {0} does not exist'.format(job_id), 'error')
+                good = False
+                continue
+            if job.done:
+                continue
+            if job.state == 'running' and job.process:
+                job.process.terminate()
+            job.state = 'killed'
+            released += _DEPENDENTS.pop(job.jobno, [])
+        _start_ready(released)
+    return good
+
+
+###############################################################################
+#                                Queue Parsing                                #
+###############################################################################
+
+
+def queue_parser(user=None, partition=None):
+    """Iterator for queue parsing.
+
+    Simply ignores user and partition requests.
+
+    Parameters
+    ----------
+    user : str, NOT IMPLEMENTED
+    partition : str, NOT IMPLEMENTED
+
+    Yields
+    ------
+    job_id : str
+    array_id : str or None
+    name : str
+    userid : str
+    partition : str
+    state :str
+    nodelist : list
+    numnodes : int
+    cntpernode : int or None
+    exit_code : int or Nonw
+    """
+    user = _getpass.getuser()
+    host = _socket.gethostname()
+    with _LOCK:
+        jobs = list(_JOBS.values())
+    for job in jobs:
+        yield (str(job.jobno), None, job.name, user, None,
+               normalize_state(job.state), [host], 1, job.threads,
+               job.exitcode)
+
+
+def parse_strange_options(option_dict):
+    """Parse all options that cannot be handled by the regular function.
+
+    Parameters
+    ----------
+    option_dict : dict
+        All keyword arguments passed by the user that are not already defined
+        in the Job object
+
+    Returns
+    -------
+    list
+        An empty list
+    dict
+        An empty dictionary
+    list
+        A list of options that can be used by `submit()`
+        Ends up in the `args` parameter of the submit function
+    """
+    outlist = []
+    good_items = ['outfile', 'cores', 'errfile', 'runpath']
+    for opt, var in option_dict.items():
+        if opt in good_items:
+            outlist.append((opt, var))
+    return [], {}, outlist
@@ -16,6 +16,9 @@ keyword arguments, the only arguments we pay attention to are:
     outfile : STDERR goes here
     errfile : STDERR goes here
     cores : Sets the number of threads per process
+    mem : Memory in MB, only used if max_mem is set in the [local] config
+    time : Walltime, used as a runtime estimate for backfilling
+    priority, qos : Set the priority of the job, qos can be low/normal/high
     depends : Job dependencies
 
 All others are ignored (although note that many others are actually handled by
@@ -25,13 +28,22 @@ from __future__ import print_function
 import os as _os
 import sys
 import errno as _errno
+import select as _select
 #  import atexit as _atexit
 import signal as _signal
 import socket as _socket    # Used to get hostname
 import getpass as _getpass  # Used to get usernames for queue
+import sqlite3 as _sqlite3
 import argparse as _argparse
+import threading as _threading
+try:
+    import resource as _resource
+except ImportError:  # Windows
+    _resource = None
 import subprocess
 import multiprocessing as mp
+from time import time as _time
+from uuid import uuid4 as _uuid
 from time import sleep as _sleep
 from datetime import datetime as _dt
 from datetime import timedelta as _td
@@ -50,8 +62,6 @@ import psutil as _psutil
 
 import Pyro4
 
-from sqlalchemy.exc import InvalidRequestError
-
 from sqlalchemy import create_engine as _create_engine
 from sqlalchemy import Column as _Column
 from sqlalchemy import String as _String
@@ -91,10 +101,23 @@ SLEEP_LEN = 0.1
 # Time in seconds to wait for QueueManager to terminate
 STOP_WAIT = 5
 
+# Time in seconds to wait for a new daemon to report it is ready
+START_TIMEOUT = 30
+
 # Number of days to wait before cleaning out old jobs, obtained from the
 # config file, this just sets the default
 CLEAN_OLDER_THAN = 7
 
+# Seconds between background cleans of old jobs, run by the housekeeper
+CLEAN_INTERVAL = 3600
+
+# Seconds between writes of job state changes to the database
+FLUSH_INTERVAL = 0.5
+
+# Number of deleted job ids to remember for delta updates, clients that are
+# further behind than this get a full job list instead
+MAX_REMOVED = 10000
+
 # Default max jobs, can be overriden by config file or QueueManager init
 MAX_JOBS = mp.cpu_count()-1
 MAX_JOBS = MAX_JOBS if MAX_JOBS >= 0 else 1
@@ -104,6 +127,10 @@ MAX_JOBS = MAX_JOBS if MAX_JOBS >= 0 else 1
 ############################
 _WE_ARE_A_SERVER = False
 
+# The write end of the pipe _start() waits on, set in the daemon only. Forked
+# children close it, so the pipe reaches EOF if the daemon dies.
+_READY_FD = None
+
 # Fyrd file prefix, we don't use file commands so this is empty
 PREFIX = ''
 # This will be appended to job submission scripts
@@ -153,6 +180,8 @@ class Job(Base):
         The current state of the job
     threads : int
         The requested number of cores
+    mem : int
+        The requested memory in MB
     exitcode : int
         The exit code of the job if state in {'completed', 'failed'}
     pid : int
@@ -161,6 +190,9 @@ class Job(Base):
         Path to the directory to run in
     outfile, errfile : str, optional
         Paths to the output files
+    change_seq : int
+        The QueueManager change sequence number of the last update, used to
+        provide delta updates to clients
     """
 
     __tablename__ = 'jobs'
@@ -168,14 +200,16 @@ class Job(Base):
     jobno       = _Column(_Integer, primary_key=True, index=True)
     name        = _Column(_String, nullable=False)
     command     = _Column(_String, nullable=False)
-    submit_time = _Column(_DateTime, nullable=False)
+    submit_time = _Column(_DateTime, nullable=False, index=True)
     threads     = _Column(_Integer, nullable=False)
+    mem         = _Column(_Integer)
     state       = _Column(_String, nullable=False, index=True)
     exitcode    = _Column(_Integer)
     pid         = _Column(_Integer)
     runpath     = _Column(_String)
     outfile     = _Column(_String)
     errfile     = _Column(_String)
+    change_seq  = _Column(_Integer, index=True)
 
     def __repr__(self):
         """Display summary."""
@@ -184,6 +218,20 @@ class Job(Base):
         )
 
 
+# The schema version is stored in the sqlite user_version pragma, databases
+# created before versioning are version 0. To change the schema, add the
+# statements that upgrade from the previous version here and update the Job
+# class, which is used to create new databases.
+SCHEMA_VERSION = 3
+_MIGRATIONS = {
+    1: ['ALTER TABLE jobs ADD COLUMN change_seq INTEGER',
+        'CREATE INDEX IF NOT EXISTS ix_jobs_change_seq ON jobs (change_seq)'],
+    2: ['CREATE INDEX IF NOT EXISTS ix_jobs_state ON jobs (state)',
+        'CREATE INDEX IF NOT EXISTS ix_jobs_submit_time ON jobs (submit_time)'],
+    3: ['ALTER TABLE jobs ADD COLUMN mem INTEGER'],
+}
+
+
 class LocalQueue(object):
 
     """A database to hold job information.
@@ -202,6 +250,8 @@ class LocalQueue(object):
         )
         if not _os.path.isfile(self.db_file):
             self.create_database(confirm=False)
+        else:
+            self.migrate()
 
     ##########################################################################
     #                           Basic Connectivity                           #
@@ -298,8 +348,66 @@ class LocalQueue(object):
         if _os.path.exists(self.db_file):
             _os.remove(self.db_file)
         Base.metadata.create_all(self.engine)
+        self.schema_version = SCHEMA_VERSION
         _logme.log('Done', 'info', also_write='stderr')
 
+    @property
+    def schema_version(self):
+        """The schema version of the database file."""
+        conn = _sqlite3.connect(self.db_file)
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        conn.close()
+        return version
+
+    @schema_version.setter
+    def schema_version(self, version):
+        """Set the schema version of the database file."""
+        conn = _sqlite3.connect(self.db_file)
+        conn.execute('PRAGMA user_version = {0}'.format(int(version)))
+        conn.close()
+
+    def migrate(self):
+        """Upgrade a database made by an older fyrd to SCHEMA_VERSION.
+
+        Each step runs in its own transaction along with the version bump, so
+        an interrupted migration is picked up where it stopped.
+
+        Returns
+        -------
+        version : int
+            The schema version before migration
+        """
+        conn = _sqlite3.connect(self.db_file)
+        try:
+            start = conn.execute('PRAGMA user_version').fetchone()[0]
+            if not conn.execute('PRAGMA table_info(jobs)').fetchall():
+                conn.close()
+                Base.metadata.create_all(self.engine)
+                self.schema_version = SCHEMA_VERSION
+                return start
+            if start > SCHEMA_VERSION:
+                raise QueueError(
+                    'Local queue database {0} has schema version {1}, which '
+                    'is newer than this version of fyrd supports ({2})'
+                    .format(self.db_file, start, SCHEMA_VERSION)
+                )
+            columns = [i[1] for i in conn.execute('PRAGMA table_info(jobs)')]
+            for version in range(start+1, SCHEMA_VERSION+1):
+                _logme.log('Migrating local queue database to version {0}'
+                           .format(version), 'debug')
+                with conn:
+                    for statement in _MIGRATIONS[version]:
+                        # Columns may already exist if the database was
+                        # created from the Job class before versioning
+                        if statement.startswith('ALTER TABLE') and \
+                                statement.split()[5] in columns:
+                            continue
+                        conn.execute(statement)
+                    conn.execute('PRAGMA user_version = {0}'.format(version))
+        finally:
+            conn.close()
+        return start
+
     ##########################################################################
     #                               Internals                                #
     ##########################################################################
@@ -322,6 +430,43 @@ class LocalQueue(object):
         return self.__repr__()
 
 
+# The QueueManager does not use the ORM, these are the raw statements it uses,
+# sqlite3 caches the prepared statements on the connection.
+_FIELDS = ('jobno', 'name', 'command', 'submit_time', 'threads', 'mem',
+           'state', 'exitcode', 'pid', 'runpath', 'outfile', 'errfile',
+           'change_seq')
+_SQL_SELECT = 'SELECT {0} FROM jobs'.format(', '.join(_FIELDS))
+_SQL_INSERT = 'INSERT INTO jobs ({0}) VALUES ({1})'.format(
+    ', '.join(_FIELDS[1:]), ', '.join(['?']*(len(_FIELDS)-1))
+)
+_SQL_UPDATE = ('UPDATE jobs SET state = ?, exitcode = ?, pid = ?, '
+               'change_seq = ? WHERE jobno = ?')
+_SQL_DELETE = 'DELETE FROM jobs WHERE jobno = ?'
+_SQL_OLDER  = 'SELECT jobno FROM jobs WHERE submit_time < ?'
+
+# The format SQLAlchemy uses for DateTime columns in sqlite, sorts as a string
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def _connect(db_file):
+    """Return a raw sqlite3 connection in WAL mode.
+
+    WAL allows readers during a write and with synchronous=NORMAL commits
+    do not wait for an fsync, the database is still never corrupted.
+    """
+    conn = _sqlite3.connect(db_file, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def _job_tuple(job):
+    """Return the tuple sent to clients for a job dictionary."""
+    return (job['jobno'], job['name'], job['command'], job['state'],
+            job['threads'], job['exitcode'], job['runpath'], job['outfile'],
+            job['errfile'])
+
+
 ###############################################################################
 #                            Management Functions                             #
 ###############################################################################
@@ -370,12 +515,10 @@ def start_server():
     -------
     pid : int
     """
-    _logme.log('Starting local queue server with 2 second sleep', 'info')
-    _sleep(2)
-    #  subprocess.check_call([sys.executable, us, 'start'])
+    _logme.log('Starting local queue server', 'info')
+    # Blocks until the daemon is ready or has failed
     if not server_running():
         daemon_manager('start')
-    _sleep(1)
     if not server_running():
         _logme.log('Cannot start server', 'critical')
         raise QueueError('Cannot start server')
@@ -492,29 +635,55 @@ class QueueManager(object):
 
     Actual job execution done by the job_runner process, which forks.
 
+    The job table is held in memory, which is the source of truth while the
+    daemon is running. New jobs are written to the database immediately, but
+    state changes are only marked dirty and are written in one transaction
+    every `FLUSH_INTERVAL` seconds by a background thread. If the daemon
+    dies, any job that was not finished in the database is marked as killed
+    on the next start.
+
     .. note:: This class should not be accessed directly, it is intended to
         run as a daemon. Use `get_queue_manager()` to get the client class.
 
     Attributes
     ----------
     jobs : dict
-        Dictionary of running jobs
+        Dictionary of all jobs, {jobno: {column: value}}
     max_jobs : int
         The maximum number of jobs to run at one time. Defaults to current
         CPUs - 1
+    max_mem : int or None
+        The total memory in MB that running jobs can request, None means
+        memory is not tracked
+    change_seq : int
+        Incremented on every change to the job table, every changed row is
+        tagged with the new value, allowing `get_changes()` to return only
+        the jobs changed since a client last looked.
+    epoch : str
+        Random for every start of the daemon. Numbers given out after the
+        last flush before a restart are given out again, so tokens from an
+        earlier start are never trusted.
     """
 
     jobs = {}
-    all_jobs = []
+    all_jobs = set()
     max_jobs = None
+    max_mem  = None
+    change_seq = 0
+    epoch = None
     inqueue  = mp.Queue()
     outqueue = mp.Queue()
 
+    uri = None
+
     _job_runner = None
 
     def __init__(self, daemon, max_jobs=None):
         """Create the QueueManager
 
+        The job_runner is not started until `check_runner()` is called,
+        which must be after the object is registered and `uri` is set.
+
         Paramenters
         -----------
         max_jobs : int, optional
@@ -532,25 +701,52 @@ class QueueManager(object):
         # jobs, so we hard code 4 as the minimum
         if self.max_jobs < 4:
             self.max_jobs = 4
+        self.max_mem = get_max_mem()
+        self.enforce_mem = bool(_conf.get_option('local', 'enforce_mem'))
+        self.policy = _conf.get_option('local', 'scheduler')
+        if self.policy not in POLICIES:
+            raise QueueError('scheduler in the [local] config must be one of '
+                             '{0}, not {1}'.format(POLICIES, self.policy))
+        # Creates and migrates the database if needed
         self.db = LocalQueue(DATABASE)
         self.daemon = daemon
-        self.all_jobs = [i[0] for i in self.db.query(Job.jobno).all()]
-        self.check_runner()
+        # All access to the job table and the connection holds this lock
+        self._lock = _threading.RLock()
+        self._conn = _connect(DATABASE)
+        self.jobs = _OD()
+        for row in self._conn.execute(_SQL_SELECT + ' ORDER BY change_seq'):
+            self.jobs[row[0]] = dict(zip(_FIELDS, row))
+        self.all_jobs = set(self.jobs)
+        self._dirty = set()
+        self._removed = []  # [(change_seq, jobno)]
+        # Job numbers ordered by change_seq, oldest first
+        self._changes = _OD(
+            (i, j['change_seq'] or 0) for i, j in self.jobs.items()
+        )
+        self.change_seq = max(self._changes.values()) if self._changes else 0
+        # Deletions from before this point are unknown, clients older than
+        # this must get the whole table
+        self._min_seq = self.change_seq
+        self.epoch = _uuid().hex[:8]
+        self._last_clean = None
         # Set all existing to disappeared, as they must be dead if we are
         # starting again
-        session = self.db.get_session()
-        q = session.query(Job).filter(
-            Job.state.in_(['running', 'pending', 'queued'])
-        )
         bad = []
-        for job in q.all():
-            bad.append(str(job.jobno))
-            job.state = 'killed'
-        session.commit()
-        session.close()
+        with self._lock:
+            for jobno, job in self.jobs.items():
+                if job['state'] in ['running', 'pending', 'queued']:
+                    bad.append(str(jobno))
+                    self._set(jobno, state='killed')
+        self.flush()
         if bad:
             _logme.log('Jobs {0} were marked as killed as we are restarting'
                        .format(','.join(bad)), 'warn')
+        self._stop_flushing = _threading.Event()
+        self._flusher = _threading.Thread(target=self._flush_loop)
+        self._flusher.daemon = True
+        self._flusher.start()
+        # Set by the job_runner once it is running
+        self.runner_ready = mp.Event()
 
 
     ##########################################################################
@@ -559,7 +755,8 @@ class QueueManager(object):
 
     @Pyro4.expose
     def submit(self, command, name, threads=1, dependencies=None,
-               stdout=None, stderr=None, runpath=None):
+               stdout=None, stderr=None, runpath=None, mem=None,
+               walltime=None, priority=None, qos=None, parent=None):
         """Submit a job and add it to the database.
 
         Parameters
@@ -576,6 +773,16 @@ class QueueManager(object):
             A path to a file to write STDOUT and STDERR to respectively
         runpath : str, optional
             A path to execute the command in
+        mem : int, optional
+            The memory required by the job in MB
+        walltime : str, optional
+            The expected runtime in [D-]HH:MM:SS, used for backfilling
+        priority : int, optional
+            Jobs with a higher priority start first
+        qos : {'low', 'normal', 'high'}, optional
+            Adds QOS_PRIORITY[qos] to the priority
+        parent : int, optional
+            The job number this job was submitted from, if any
 
         Returns
         -------
@@ -586,8 +793,16 @@ class QueueManager(object):
         QueueError
             If a dependency is not in the job db already or command is invalid
         """
-        session = self.db.get_session()
         threads = int(threads)
+        mem = int(mem) if mem else None
+        priority = int(priority) if priority else 0
+        if qos:
+            if qos in QOS_PRIORITY:
+                priority += QOS_PRIORITY[qos]
+            else:
+                _logme.log('qos {0} not recognized by the local queue, must '
+                           'be one of {1}'.format(qos, list(QOS_PRIORITY)),
+                           'warn')
         if not isinstance(command, (_str, _txt)):
             raise ValueError('command is {0}, type{1}, cannot continue'
                              .format(command, type(command)))
@@ -598,38 +813,41 @@ class QueueManager(object):
                 if not self.check_jobno(dep):
                     raise QueueError('Invalid dependencies')
                 depends.append(dep)
-        job = Job(name=name, command=command, threads=threads, state='pending',
-                  submit_time=_dt.now())
-        if stdout:
-            job.outfile = stdout
-        if stderr:
-            job.errfile = stderr
-        if runpath:
-            job.runpath = runpath
-        try:
-            session.add(job)
-        except InvalidRequestError:
-            # In case open in another thread
-            local_job = session.merge(job)
-            other_session = session.object_session(job)
-            session.add(local_job)
-            session.commit()
-            other_session.close()
-        session.flush()
-        jobno = int(job.jobno)
-        session.commit()
-        session.close()
+        job = {
+            'jobno': None, 'name': name, 'command': command,
+            'submit_time': _dt.now().strftime(_TIME_FORMAT),
+            'threads': threads, 'mem': mem, 'state': 'pending',
+            'exitcode': None,
+            'pid': None, 'runpath': runpath if runpath else None,
+            'outfile': stdout if stdout else None,
+            'errfile': stderr if stderr else None, 'change_seq': None
+        }
+        # New jobs are written immediately, the job number must be durable
+        # before we hand it to the client
+        with self._lock:
+            job['change_seq'] = self._next_seq()
+            with self._conn:
+                cursor = self._conn.execute(
+                    _SQL_INSERT, [job[i] for i in _FIELDS[1:]]
+                )
+            jobno = int(cursor.lastrowid)
+            job['jobno'] = jobno
+            self.jobs[jobno] = job
+            self._changes[jobno] = job['change_seq']
+            self.all_jobs.add(jobno)
         self.check_runner()
         self.inqueue.put(
             ('queue',
-             (jobno, command, threads, depends, stdout, stderr, runpath))
+             {'jobno': jobno, 'command': command, 'threads': threads,
+              'mem': mem, 'depends': depends, 'stdout': stdout,
+              'stderr': stderr, 'runpath': runpath, 'priority': priority,
+              'runtime': time_to_seconds(walltime),
+              'nested': parent is not None})
         )
-        self.jobs[jobno] = job
-        self.all_jobs.append(jobno)
         return jobno
 
     @Pyro4.expose
-    def get(self, jobs=None, preclean=True):
+    def get(self, jobs=None, preclean=False):
         """Return a list of updated jobs.
 
         Parameters
@@ -637,7 +855,8 @@ class QueueManager(object):
         jobs : list of int, optional
             A list of job numbers, a single job number is also fine
         preclean : bool
-            If True run `clean()` first to remove old jobs
+            If True run `clean()` first to remove old jobs, not necessary
+            as cleaning is done periodically by `housekeeping()`
 
         Returns
         -------
@@ -647,27 +866,61 @@ class QueueManager(object):
         """
         if preclean:
             self.clean()
-        session = self.db.get_session()
-        # Pyro cannot serialize Job objects, so we get a tuple instead
-        q = session.query(
-            Job.jobno, Job.name, Job.command, Job.state, Job.threads,
-            Job.exitcode, Job.runpath, Job.outfile, Job.errfile
-        )
-        if jobs:
-            jobs = [jobs] if isinstance(jobs, (_int, _str, _txt)) else jobs
-            jobs = [int(j) for j in jobs]
-            q = q.filter(Job.jobno.in_(jobs))
-        res = q.all()
-        session.close()
-        return res
+        with self._lock:
+            if jobs:
+                jobs = [jobs] if isinstance(jobs, (_int, _str, _txt)) else jobs
+                jobs = [int(j) for j in jobs]
+                return [_job_tuple(self.jobs[j]) for j in jobs
+                        if j in self.jobs]
+            return [_job_tuple(j) for j in self.jobs.values()]
+
+    @Pyro4.expose
+    def get_changes(self, since=None):
+        """Return only the jobs that changed since change sequence `since`.
+
+        Parameters
+        ----------
+        since : tuple, optional
+            The token returned by the last call to this function, if None or
+            from an earlier start of the daemon, all jobs are returned
+
+        Returns
+        -------
+        token : tuple
+            (epoch, change_seq), the current change sequence number of this
+            start of the daemon, pass it as `since` next time
+        full : bool
+            True if jobs is the whole table rather than just the changes
+        removed : list of int
+            Job numbers deleted from the table since `since`
+        jobs : list of tuple
+            [(jobno, name, command, state, threads,
+              exitcode, runpath, outfile, errfile)]
+        """
+        with self._lock:
+            change_seq = self.change_seq
+            token = (self.epoch, change_seq)
+            # Pyro may send tuples as lists, other tokens are from old clients
+            if isinstance(since, (list, tuple)) and since[0] == self.epoch:
+                since = since[1]
+            else:
+                since = None
+            if since is None or not self._min_seq <= since <= change_seq:
+                return (token, True, [],
+                        [_job_tuple(j) for j in self.jobs.values()])
+            res = []
+            # Newest changes are last, so stop at the first old one
+            for jobno in reversed(self._changes):
+                if self._changes[jobno] <= since:
+                    break
+                res.append(_job_tuple(self.jobs[jobno]))
+            removed = [j for s, j in self._removed if s > since]
+        return token, False, removed, res
 
     @Pyro4.expose
     def clean(self, days=None):
         """Delete all jobs in the queue older than days days.
 
-        Very fast if no jobs are older than the cutoff as the query returns
-        an empty set.
-
         Parameters
         ----------
         days : int, optional
@@ -680,23 +933,24 @@ class QueueManager(object):
                 'local', 'local_clean_days',CLEAN_OLDER_THAN
             ))
         current_time = _dt.now()
-        cutoff = current_time - _td(days=clean_days)
-        jobs = self.db.query().filter(Job.submit_time < cutoff).all()
-        if not jobs:
-            return
-        session = self.db.get_session()
-        for job in jobs:
-            try:
-                session.delete(job)
-            except InvalidRequestError:
-                # In case open in another thread
-                local_job = session.merge(job)
-                other_session = session.object_session(job)
-                session.delete(local_job)
-                session.commit()
-                other_session.close()
-        session.commit()
-        session.close()
+        cutoff = (current_time - _td(days=clean_days)).strftime(_TIME_FORMAT)
+        with self._lock:
+            # All jobs are in the db from submit, so use the submit_time index
+            jobs = [i[0] for i in self._conn.execute(_SQL_OLDER, (cutoff,))]
+            if not jobs:
+                return
+            with self._conn:
+                self._conn.executemany(_SQL_DELETE, [(i,) for i in jobs])
+            change_seq = self._next_seq()
+            for jobno in jobs:
+                self.jobs.pop(jobno, None)
+                self._changes.pop(jobno, None)
+                self._dirty.discard(jobno)
+                self._removed.append((change_seq, jobno))
+                self.all_jobs.discard(jobno)
+            if len(self._removed) > MAX_REMOVED:
+                self._min_seq = self._removed[-MAX_REMOVED-1][0]
+                self._removed = self._removed[-MAX_REMOVED:]
 
     @Pyro4.expose
     def kill(self, jobs):
@@ -717,11 +971,11 @@ class QueueManager(object):
                 jobs = [jobs]
         for job in jobs:
             self.check_jobno(job)
-            self.inqueue.put('kill', int(job))
+            self.inqueue.put(('kill', int(job)))
         jobs = self.get(jobs)
         ok_states = ['killed', 'completed', 'failed']
         for job in jobs:
-            if job.state not in ok_states:
+            if job[3] not in ok_states:
                 return False
         return True
 
@@ -739,30 +993,75 @@ class QueueManager(object):
 
     @Pyro4.expose
     def update_job(self, jobno, state=None, exitcode=None, pid=None):
-        """Update either the state or the exitcode of a job in the DB."""
-        session = self.db.get_session()
-        job = session.query(Job).filter(Job.jobno == int(jobno)).first()
+        """Update either the state or the exitcode of a job.
+
+        Only the in-memory table is changed, the database is updated by the
+        next `flush()`.
+        """
+        kwargs = {}
         if state:
-            job.state = state
+            kwargs['state'] = state
         if isinstance(exitcode, int):
-            job.exitcode = exitcode
+            kwargs['exitcode'] = exitcode
         if isinstance(pid, int):
-            job.pid = pid
-        session.flush()
-        session.commit()
-        session.close()
-
-    #  def _housekeeping(self):
-        #  """Run by Pyro4, update all_jobs, db cache, and clean up."""
-        #  self.clean()
-        #  all_jobs = []
-        #  cache    = {}
-        #  session = self.db.get_session()
-        #  for job in session.query(Job).all():
-            #  all_jobs.append(job.id)
-            #  cache[job.id] = job
-        #  self.all_jobs = all_jobs
-        #  self._cache   = cache
+            kwargs['pid'] = pid
+        with self._lock:
+            self._set(int(jobno), **kwargs)
+
+    def _set(self, jobno, **kwargs):
+        """Change a job in memory and mark it for writing, hold self._lock."""
+        job = self.jobs[jobno]
+        job.update(kwargs)
+        job['change_seq'] = self._next_seq()
+        self._changes.pop(jobno, None)
+        self._changes[jobno] = job['change_seq']
+        self._dirty.add(jobno)
+
+    def _next_seq(self):
+        """Increment and return the change sequence, hold self._lock."""
+        self.change_seq += 1
+        return self.change_seq
+
+    def flush(self):
+        """Write all changed jobs to the database in a single transaction."""
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = []
+            for jobno in self._dirty:
+                job = self.jobs[jobno]
+                rows.append((job['state'], job['exitcode'], job['pid'],
+                             job['change_seq'], jobno))
+            with self._conn:
+                self._conn.executemany(_SQL_UPDATE, rows)
+            self._dirty = set()
+
+    def _flush_loop(self):
+        """Run `flush()` every FLUSH_INTERVAL seconds until stopped."""
+        while not self._stop_flushing.wait(FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception as err:
+                _logme.log('Local queue flush failed with {0}'.format(err),
+                           'error')
+        self.flush()
+
+    def housekeeping(self):
+        """Run periodically by the Pyro4 daemon, cleans out old jobs.
+
+        Cleaning used to be done on every `get()`, it is now done at most
+        once every `CLEAN_INTERVAL` seconds.
+        """
+        now = _dt.now()
+        if self._last_clean and \
+                (now - self._last_clean).total_seconds() < CLEAN_INTERVAL:
+            return
+        self._last_clean = now
+        try:
+            self.clean()
+        except Exception as err:
+            _logme.log('Local queue clean failed with {0}'.format(err),
+                       'error')
 
     ##########################################################################
     #                                Shutdown                                #
@@ -772,6 +1071,7 @@ class QueueManager(object):
     def shutdown_jobs(self):
         """Kill all jobs and terminate."""
         result = None
+        self._stop_flushing.set()
         if not self.inqueue._closed:
             self.inqueue.put('stop')
             print('waiting for jobs to terminate gracefully')
@@ -789,6 +1089,9 @@ class QueueManager(object):
             self.outqueue.close()
         except AttributeError:
             pass
+        self._flusher.join(STOP_WAIT)
+        self.flush()
+        self._conn.close()
         self.daemon.shutdown()
         if result is None:
             return None
@@ -813,7 +1116,8 @@ class QueueManager(object):
             return self._job_runner
         runner = mp.Process(
             target=job_runner,
-            args=(self.inqueue, self.outqueue, self.max_jobs)
+            args=(self.inqueue, self.outqueue, self.max_jobs, self.max_mem,
+                  self.enforce_mem, self.policy, self.uri, self.runner_ready)
         )
         runner.start()
         self._job_runner = runner
@@ -877,8 +1181,271 @@ class QueueManager(object):
         #  )
 
 
-def job_runner(inqueue, outqueue, max_jobs):
-    """Run jobs with dependency tracking.
+###############################################################################
+#                                 Scheduling                                  #
+###############################################################################
+
+
+# Scheduling policies, set with scheduler in the [local] section of the config
+#   fifo: start every job that fits, in submission order
+#   priority: start every job that fits, highest priority first
+#   backfill: highest priority first, the first job that does not fit gets a
+#             reservation and later jobs only start if they fit and will not
+#             delay it, judged by their time keyword (EASY backfilling)
+POLICIES = ['fifo', 'priority', 'backfill']
+
+# Priority added to a job by the qos keyword
+QOS_PRIORITY = {'low': -100, 'normal': 0, 'high': 100}
+
+# A waiting job gains one priority point every this many seconds, so low
+# priority jobs do not wait forever
+PRIORITY_AGE = 600
+
+# Set in the environment of every running job, jobs submitted from within a
+# running job are never held back by a reservation, as the running job may
+# be waiting on them
+PARENT_VAR = 'FYRD_LOCAL_JOBNO'
+
+
+class SchedJob(object):
+
+    """The resources and estimates of a single job known to the Scheduler."""
+
+    __slots__ = ['jobno', 'threads', 'mem', 'priority', 'runtime', 'depends',
+                 'nested', 'submitted', 'started']
+
+    def __init__(self, jobno, threads=1, mem=0, priority=0, runtime=None,
+                 depends=None, nested=False, submitted=None):
+        """Set attributes, runtime is the expected runtime in seconds."""
+        self.jobno     = jobno
+        self.threads   = int(threads)
+        self.mem       = int(mem) if mem else 0
+        self.priority  = int(priority) if priority else 0
+        self.runtime   = runtime
+        self.depends   = list(depends) if depends else []
+        self.nested    = nested
+        self.submitted = submitted
+        self.started   = None
+
+    def __repr__(self):
+        """Display summary."""
+        return 'SchedJob<{0}:cores:{1};mem:{2};priority:{3}>'.format(
+            self.jobno, self.threads, self.mem, self.priority
+        )
+
+
+class Scheduler(object):
+
+    """Decide when queued jobs start, used by `job_runner()`.
+
+    Only knows about resources and times, not processes, so the same policy
+    can be run by a simulator (see benchmarks/local_scheduler.py).
+
+    Attributes
+    ----------
+    cores : int
+        Total cores available
+    mem : int or None
+        Total memory available in MB, None if not tracked
+    policy : str
+        One of POLICIES
+    free_cores, free_mem : int
+        Currently unused resources
+    queued : OrderedDict
+        {jobno: SchedJob} in submission order
+    running : dict
+        {jobno: SchedJob}
+    done : set
+        All finished job numbers, used for dependency tracking
+    """
+
+    def __init__(self, cores, mem=None, policy='backfill'):
+        """Create an empty scheduler for cores and mem MB."""
+        if policy not in POLICIES:
+            raise QueueError('scheduler policy must be one of {0}, not {1}'
+                             .format(POLICIES, policy))
+        self.cores      = int(cores)
+        self.mem        = int(mem) if mem else None
+        self.policy     = policy
+        self.free_cores = self.cores
+        self.free_mem   = self.mem if self.mem else 0
+        self.queued     = _OD()
+        self.running    = {}
+        self.done       = set()
+
+    def queue(self, jobno, threads=1, mem=0, priority=0, runtime=None,
+              depends=None, nested=False, now=None):
+        """Add a job to the queue.
+
+        Parameters
+        ----------
+        jobno : int
+        threads : int, optional
+            Cores required, clamped to the total
+        mem : int, optional
+            Memory required in MB, clamped to the total
+        priority : int, optional
+            Higher runs first
+        runtime : int, optional
+            Expected runtime in seconds, jobs without one can only be
+            backfilled into resources the reserved job does not need
+        depends : list of int, optional
+            Jobs that must be done first
+        nested : bool, optional
+            Job was submitted by a running job, never wait on a reservation
+        now : float, optional
+            Time of submission, defaults to the current time
+        """
+        job = SchedJob(jobno, threads, mem, priority, runtime, depends, nested,
+                       _now(now))
+        job.threads = min(job.threads, self.cores)
+        job.mem = min(job.mem, self.mem) if self.mem else 0
+        self.queued[jobno] = job
+        return job
+
+    def remove(self, jobno):
+        """Drop a queued or running job, it will never be done."""
+        self.queued.pop(jobno, None)
+        if jobno in self.running:
+            self._free(self.running.pop(jobno))
+
+    def finish(self, jobno):
+        """Mark a running job done and free its resources."""
+        if jobno in self.running:
+            self._free(self.running.pop(jobno))
+        self.done.add(jobno)
+
+    def schedule(self, now=None):
+        """Start all jobs that can run now under the policy.
+
+        Returns
+        -------
+        jobnos : list of int
+            The jobs to start, they are now counted as running
+        """
+        now = _now(now)
+        ready = [j for j in self.queued.values()
+                 if all([i in self.done for i in j.depends])]
+        if self.policy != 'fifo':
+            # Stable, so equal priorities stay in submission order
+            ready.sort(key=lambda j: -self.priority(j, now))
+        started = []
+        shadow = None  # When the reserved job is expected to start
+        extra_cores = extra_mem = 0
+        for job in ready:
+            fits = self._fits(job, self.free_cores, self.free_mem)
+            if shadow is None or job.nested:
+                if fits:
+                    self._start(job, now)
+                    started.append(job.jobno)
+                elif self.policy == 'backfill' and not job.nested:
+                    shadow, extra_cores, extra_mem = self._reserve(job, now)
+                continue
+            # Backfilling, must not delay the reserved job
+            if not fits:
+                continue
+            if job.runtime is not None and now + job.runtime <= shadow:
+                pass
+            elif job.threads <= extra_cores and \
+                    (not self.mem or job.mem <= extra_mem):
+                extra_cores -= job.threads
+                extra_mem   -= job.mem
+            else:
+                continue
+            self._start(job, now)
+            started.append(job.jobno)
+        return started
+
+    def priority(self, job, now=None):
+        """The priority of a job, including the bonus for waiting."""
+        return job.priority + (_now(now) - job.submitted)/float(PRIORITY_AGE)
+
+    def _reserve(self, job, now):
+        """Find when job can start if running jobs end as expected.
+
+        Jobs without a runtime estimate, or past it, are expected to end now.
+
+        Returns
+        -------
+        shadow : float
+            Time the job is expected to be able to start
+        extra_cores, extra_mem : int
+            Resources free at that time that the job will not use
+        """
+        ends = sorted(
+            (max(r.started + r.runtime, now) if r.runtime is not None
+             else now, r.jobno) for r in self.running.values()
+        )
+        cores, mem = self.free_cores, self.free_mem
+        shadow = now
+        for end, jobno in ends:
+            if self._fits(job, cores, mem):
+                break
+            cores += self.running[jobno].threads
+            mem   += self.running[jobno].mem
+            shadow = end
+        return shadow, cores - job.threads, mem - job.mem
+
+    def _fits(self, job, cores, mem):
+        """True if job fits in cores and mem."""
+        return job.threads <= cores and (not self.mem or job.mem <= mem)
+
+    def _start(self, job, now):
+        """Move job from queued to running."""
+        self.queued.pop(job.jobno)
+        job.started = now
+        self.running[job.jobno] = job
+        self.free_cores -= job.threads
+        self.free_mem   -= job.mem
+
+    def _free(self, job):
+        """Return the resources of a running job."""
+        self.free_cores += job.threads
+        self.free_mem   += job.mem
+
+    def __repr__(self):
+        """Display summary."""
+        return 'Scheduler<{0};queued:{1};running:{2};free_cores:{3}>'.format(
+            self.policy, len(self.queued), len(self.running), self.free_cores
+        )
+
+
+def _now(now=None):
+    """Return now if set, else the current time in seconds."""
+    return _time() if now is None else now
+
+
+def time_to_seconds(walltime):
+    """Convert a time string like the time keyword into seconds.
+
+    Parameters
+    ----------
+    walltime : str
+        [D-]HH:MM:SS or a fragment of that (e.g. MM:SS)
+
+    Returns
+    -------
+    seconds : int or None
+        None if walltime is empty or cannot be parsed
+    """
+    if not walltime:
+        return None
+    try:
+        days = 0
+        if '-' in walltime:
+            days, walltime = walltime.split('-')
+        secs = 0
+        for i in walltime.split(':'):
+            secs = secs*60 + int(i)
+        return int(days)*86400 + secs
+    except ValueError:
+        _logme.log('Cannot parse time {0}'.format(walltime), 'warn')
+        return None
+
+
+def job_runner(inqueue, outqueue, max_jobs, max_mem=None, enforce_mem=False,
+               policy='backfill', uri=None, ready=None):
+    """Run jobs with dependency and resource tracking.
 
     Terminate by sending 'stop' to inqueue
 
@@ -890,8 +1457,9 @@ def job_runner(inqueue, outqueue, max_jobs):
             `('queue', job_info)` : queue and run this job
             `('kill', jobno)` : immediately kill this job
             `('available_cores')` : put available core count in outqueue
-        job_info must be in the form:
-            `(int(jobno), str(command), int(threads), list(dependencies))`
+        job_info must be a dictionary with the keys:
+            `jobno, command, threads, mem, depends, stdout, stderr, runpath,
+             priority, runtime, nested`
     outqueue : multiprocessing.Queue
         job information available_cores if argument was available_cores
     max_jobs : int
@@ -900,6 +1468,18 @@ def job_runner(inqueue, outqueue, max_jobs):
         and is enforced, so a machine with only 2 cores will still end up with
         4 jobs running. This is required to avoid hangs on some kinds of fyrd
         jobs, where a split job is created from a child process.
+    max_mem : int, optional
+        The total memory in MB that running jobs may request, if set, jobs
+        only start when their mem fits in what is left. Jobs asking for more
+        than max_mem are run alone.
+    enforce_mem : bool, optional
+        Limit the address space of each job to its mem with setrlimit
+    policy : str, optional
+        The scheduling policy, one of POLICIES, see `Scheduler`
+    uri : str, optional
+        The URI of the QueueManager, looked up from the URI_FILE if not set
+    ready : multiprocessing.Event, optional
+        Set once we are ready to take jobs
 
     Returns
     -------
@@ -914,27 +1494,25 @@ def job_runner(inqueue, outqueue, max_jobs):
     """
     if not _WE_ARE_A_SERVER:
         return
-    tries = 5
-    while tries:
-        qserver = get_server()
-        if qserver:
-            break
-        _sleep(1)
-        tries -= 1
-        continue
-    if not qserver:
+    _close_ready_fd()
+    # The proxy only connects on first use, by which time the daemon is
+    # serving requests
+    if uri:
+        qserver = Pyro4.Proxy(uri)
+    else:
         qserver = get_server(raise_on_error=True)
     max_jobs = int(max_jobs)
     if max_jobs < mp.cpu_count():
         max_jobs = mp.cpu_count()
     if max_jobs < 4:
         max_jobs = 4
-    available_cores = max_jobs
+    scheduler = Scheduler(max_jobs, max_mem, policy)
     running = {}     # {jobno: Process}
-    queued  = _OD()  # {jobno: {'command': command, 'depends': depends, ...}
-    done    = {}     # {jobno: Process}
-    jobs    = []     # [jobno, ...]
+    queued  = {}     # {jobno: job_info}
+    jobs    = set()  # {jobno, ...}
     put_core_info = False
+    if ready is not None:
+        ready.set()
     while True:
         # Get everything from the input queue first, queue everything
         while True:
@@ -952,7 +1530,7 @@ def job_runner(inqueue, outqueue, max_jobs):
                         job.terminate()
                 if queued:
                     good = False
-                    for jobno, job in queued.items():
+                    for jobno in queued:
                         qserver.update_job(jobno, state='killed')
                 for pid in pids:
                     if _pid_exists(pid):
@@ -965,21 +1543,21 @@ def job_runner(inqueue, outqueue, max_jobs):
             if info[0] == 'kill':
                 jobno = int(info[1])
                 if jobno in running:
-                    running[jobno].terminate()
+                    running.pop(jobno).terminate()
                     qserver.update_job(jobno, state='killed')
-                    running.pop(jobno)
                 if jobno in queued:
                     queued.pop(jobno)
                     qserver.update_job(jobno, state='killed')
+                scheduler.remove(jobno)
                 continue
             if info[0] != 'queue':
                 raise QueueError('Invalid argument: {0}'.format(info[0]))
-            jobno, command, threads, depends, stdout, stderr, runpath = info[1]
-            if not command:
+            info = info[1]
+            if not info['command']:
                 raise QueueError('Job command is {0}, cannot continue'
-                                 .format(type(command)))
-            jobno = int(jobno)
-            threads = int(threads)
+                                 .format(type(info['command'])))
+            jobno = int(info['jobno'])
+            threads = int(info['threads'])
             # Run anyway
             if threads >= max_jobs:
                 threads = max_jobs-1
@@ -987,13 +1565,15 @@ def job_runner(inqueue, outqueue, max_jobs):
             if jobno in jobs:
                 # This should never happen
                 raise QueueError('Job already submitted!')
-            jobs.append(jobno)
-            queued[jobno] = {'command': command, 'threads': threads,
-                             'depends': depends, 'stdout': stdout,
-                             'stderr': stderr, 'runpath': runpath}
-            qserver.update_job(jobno, state='pending')
+            jobs.add(jobno)
+            # Already pending in the database from QueueManager.submit()
+            queued[jobno] = info
+            scheduler.queue(
+                jobno, threads, info['mem'], info['priority'],
+                info['runtime'], info['depends'], info['nested']
+            )
         # Update running and done queues
-        for jobno, process in running.items():
+        for jobno, process in list(running.items()):
             if process.is_alive():
                 continue
             # Completed
@@ -1001,56 +1581,74 @@ def job_runner(inqueue, outqueue, max_jobs):
             code = process.exitcode
             state = 'completed' if code == 0 else 'failed'
             qserver.update_job(jobno, state=state, exitcode=code)
-            done[jobno] = process
-        # Remove completed jobs from running
-        for jobno in done:
-            if jobno in running:
-                p = running.pop(jobno)
-                available_cores += p.cores
-        # Start jobs if can run
-        if available_cores > max_jobs:
-            available_cores = max_jobs
-        if available_cores < 0:  # Shouldn't happen
-            available_cores = 0
+            running.pop(jobno)
+            scheduler.finish(jobno)
         if put_core_info:
-            outqueue.put(available_cores)
+            outqueue.put(scheduler.free_cores)
             put_core_info = False
-        for jobno, info in queued.items():
-            if info['depends']:
-                not_done = []
-                for dep_id in info['depends']:
-                    if dep_id not in done:
-                        not_done.append(dep_id)
-                if not_done:
-                    continue
-            if info['threads'] <= available_cores:
-                if info['runpath']:
-                    curpath = _os.path.abspath('.')
-                    _os.chdir(info['runpath'])
-                p = mp.Process(
-                    target=_run.cmd,
-                    args=(info['command'],),
-                    kwargs={
-                        'stdout': info['stdout'],
-                        'stderr': info['stderr'],
-                    }
-                )
-                p.daemon = True
-                p.start()
-                running[jobno] = p
-                available_cores -= info['threads']
-                p.cores = info['threads']
-                if info['runpath']:
-                    _os.chdir(curpath)
+        # Start jobs if can run
+        for jobno in scheduler.schedule():
+            info = queued.pop(jobno)
+            if info['runpath']:
+                curpath = _os.path.abspath('.')
+                _os.chdir(info['runpath'])
+            p = mp.Process(
+                target=_run_job,
+                args=(info['command'],),
+                kwargs={
+                    'stdout': info['stdout'],
+                    'stderr': info['stderr'],
+                    'mem': info['mem'] if enforce_mem else None,
+                    'jobno': jobno,
+                }
+            )
+            p.daemon = True
+            p.start()
+            running[jobno] = p
+            if info['runpath']:
+                _os.chdir(curpath)
             qserver.update_job(jobno, state='running', pid=p.pid)
-        # Clear running jobs from queue
-        for jobno in running:
-            if jobno in queued:
-                queued.pop(jobno)
         # Block for a moment to avoid running at 100% cpu
         _sleep(SLEEP_LEN)
 
 
+def _run_job(command, stdout=None, stderr=None, mem=None, jobno=None):
+    """Run command with `fyrd.run.cmd`, limiting memory to mem MB if set.
+
+    The limit is on address space (RLIMIT_AS), which is inherited by the
+    command. Some programs reserve much more address space than they use,
+    so this is only done if `enforce_mem` is set in the config.
+    """
+    if jobno is not None:
+        _os.environ[PARENT_VAR] = str(jobno)
+    if mem and _resource:
+        limit = int(mem)*1024*1024
+        _resource.setrlimit(_resource.RLIMIT_AS, (limit, limit))
+    return _run.cmd(command, stdout=stdout, stderr=stderr)
+
+
+def get_max_mem():
+    """Return the memory in MB available to local jobs from the config.
+
+    Returns
+    -------
+    max_mem : int or None
+        None if memory should not be tracked, the total system memory if
+        max_mem is 'auto'.
+    """
+    max_mem = _conf.get_option('local', 'max_mem')
+    if not max_mem:
+        return None
+    if isinstance(max_mem, (_str, _txt)):
+        if max_mem.lower() != 'auto':
+            raise QueueError(
+                'max_mem in the [local] config must be an integer number of '
+                'MB or "auto", it is {0}'.format(max_mem)
+            )
+        return int(_psutil.virtual_memory().total/1024/1024)
+    return int(max_mem)
+
+
 ###############################################################################
 #                  Daemon Creation and Management Functions                   #
 ###############################################################################
@@ -1108,8 +1706,18 @@ def _test_uri(uri):
         return 'disconnect'
 
 
-def daemonizer():
-    """Create the server daemon."""
+def daemonizer(ready_fd=None):
+    """Create the server daemon.
+
+    Parameters
+    ----------
+    ready_fd : int, optional
+        A file descriptor to write to and close once the daemon is listening
+        and the job_runner has started, used by `_start()` to avoid waiting
+        for a fixed time.
+    """
+    global _READY_FD
+    _READY_FD = ready_fd
     # Get pre-configured URI if available
     curi = _conf.get_option('local', 'server_uri')
     utest = _test_uri(curi) if curi else None
@@ -1129,17 +1737,39 @@ def daemonizer():
     with Pyro4.Daemon(**args) as daemon:
         queue_manager = QueueManager(daemon)
         uri = daemon.register(queue_manager, objectId=objId)
-        #  daemon.housekeeping = queue_manager._housekeeping
+        daemon.housekeeping = queue_manager.housekeeping
+        queue_manager.uri = str(uri)
 
         with open(PID_FILE, 'w') as fout:
             fout.write(str(_os.getpid()))
         with open(URI_FILE, 'w') as fout:
             fout.write(str(uri))
 
+        # The daemon socket is already listening, so connections made before
+        # requestLoop() starts just wait in the backlog
+        queue_manager.check_runner()
+        if not queue_manager.runner_ready.wait(START_TIMEOUT):
+            raise QueueError('job_runner did not start')
+        if ready_fd is not None:
+            _os.write(ready_fd, b'1')
+            _close_ready_fd()
+
         print("Ready. Object uri =", uri)
         daemon.requestLoop()
 
 
+def _close_ready_fd():
+    """Close the ready pipe of `daemonizer()` in this process, if open."""
+    global _READY_FD
+    if _READY_FD is None:
+        return
+    try:
+        _os.close(_READY_FD)
+    except OSError:  # Closed already
+        pass
+    _READY_FD = None
+
+
 def shutdown_queue():
     """Kill the server and queue gracefully."""
     good = True
@@ -1216,7 +1846,11 @@ def daemon_manager(mode):
     return 1
 
 def _start():
-    """Start the daemon process as a fork."""
+    """Start the daemon process as a fork.
+
+    Blocks until the daemon writes to a pipe to say it is ready, or closes
+    it by dying, for at most START_TIMEOUT seconds.
+    """
     if _os.path.isfile(PID_FILE):
         with open(PID_FILE) as fin:
             pid = fin.read().strip()
@@ -1225,13 +1859,26 @@ def _start():
                        .format(pid), 'info')
             return 1
         _os.remove(PID_FILE)
+    read_fd, write_fd = _os.pipe()
     pid = _os.fork()
     if pid == 0: # The first child.
-        daemonizer()
+        _os.close(read_fd)
+        code = 0
+        try:
+            daemonizer(write_fd)
+        except Exception as err:
+            _logme.log('Local queue daemon failed with {0}'.format(err),
+                       'critical')
+            code = 1
+        # Never return into the code that started us
+        _os._exit(code)
     else:
+        _os.close(write_fd)
         _logme.log('Local queue starting', 'info')
-        _sleep(1)
-        if server_running():
+        readable = _select.select([read_fd], [], [], START_TIMEOUT)[0]
+        ready = _os.read(read_fd, 1) if readable else b''
+        _os.close(read_fd)
+        if ready and server_running():
             return 0
         _logme.log('Server failed to start', 'critical')
         return 1
@@ -1350,7 +1997,7 @@ def submit(file_name, dependencies=None, job=None, args=None, kwds=None):
     """Submit any file with dependencies.
 
     .. note:: this function can only use the following fyrd keywords:
-        cores, name, outfile, errfile, runpath
+        cores, mem, time, priority, qos, name, outfile, errfile, runpath
 
     We get those in the following order:
         1. Job object
@@ -1387,7 +2034,8 @@ def submit(file_name, dependencies=None, job=None, args=None, kwds=None):
     job_id : str
     """
     params = {}
-    needed_params = ['cores', 'outfile', 'errfile', 'runpath', 'name']
+    needed_params = ['cores', 'mem', 'time', 'priority', 'qos', 'outfile',
+                     'errfile', 'runpath', 'name']
     if job:
         params['cores'] = job.cores
         params['outfile'] = job.outfile
@@ -1421,7 +2069,10 @@ def submit(file_name, dependencies=None, job=None, args=None, kwds=None):
     jobno = server.submit(
         command, params['name'], threads=params['cores'],
         dependencies=dependencies, stdout=params['outfile'],
-        stderr=params['errfile'], runpath=params['runpath']
+        stderr=params['errfile'], runpath=params['runpath'],
+        mem=params['mem'], walltime=params['time'],
+        priority=params['priority'], qos=params['qos'],
+        parent=_os.environ.get(PARENT_VAR)
     )
     return str(jobno)
 
@@ -1481,18 +2132,58 @@ def queue_parser(user=None, partition=None):
     user = _getpass.getuser()
     host = _socket.gethostname()
     for job in server.get():  # Get all jobs in the database
-        job_id     = str(job[0])
-        array_id   = None
-        name       = job[1]
-        userid     = user
-        partition  = None
-        state      = normalize_state(job[3])
-        nodelist   = [host]
-        numnodes   = 1
-        cntpernode = job[4]
-        exit_code  = job[5]
-        yield (job_id, array_id, name, userid, partition, state, nodelist,
-               numnodes, cntpernode, exit_code)
+        yield _parse_job(job, user, host)
+
+
+def queue_changes(since=None, user=None, partition=None):
+    """Return only the jobs that changed since the last call.
+
+    Optional batch system function, used by `fyrd.queue.Queue` in preference
+    to `queue_parser()` if it exists.
+
+    Parameters
+    ----------
+    since : tuple, optional
+        The token returned by the previous call, None gets all jobs
+    user : str, NOT IMPLEMENTED
+    partition : str, NOT IMPLEMENTED
+
+    Returns
+    -------
+    token : tuple
+        Pass this as `since` on the next call
+    full : bool
+        True if jobs contains every job, not just the changed ones, any job
+        not in the list has disappeared
+    removed : list of str
+        Job IDs that have been removed from the queue
+    jobs : list of tuple
+        Same tuples as yielded by `queue_parser()`
+    """
+    server = get_server(start=True)
+    user = _getpass.getuser()
+    host = _socket.gethostname()
+    token, full, removed, jobs = server.get_changes(since)
+    return (
+        tuple(token), full, [str(i) for i in removed],
+        [_parse_job(job, user, host) for job in jobs]
+    )
+
+
+def _parse_job(job, user, host):
+    """Convert a QueueManager job tuple into a queue_parser tuple."""
+    job_id     = str(job[0])
+    array_id   = None
+    name       = job[1]
+    userid     = user
+    partition  = None
+    state      = normalize_state(job[3])
+    nodelist   = [host]
+    numnodes   = 1
+    cntpernode = job[4]
+    exit_code  = job[5]
+    return (job_id, array_id, name, userid, partition, state, nodelist,
+            numnodes, cntpernode, exit_code)
 
 
 def parse_strange_options(option_dict):
@@ -1518,7 +2209,8 @@ def parse_strange_options(option_dict):
         Ends up in the `args` parameter of the submit function
     """
     outlist = []
-    good_items = ['outfile', 'cores', 'errfile', 'runpath']
+    good_items = ['outfile', 'cores', 'mem', 'time', 'priority', 'qos',
+                  'errfile', 'runpath']
     for opt, var in option_dict.items():
         if opt in good_items:
             outlist.append((opt, var))
@@ -78,6 +78,12 @@ COMMON  = _OD([
     ('syspaths',
      {'help': 'Paths to add to _sys.path for submitted functions',
       'default': None, 'type': list}),
+    ('serializer',
+     {'help': 'How to pickle functions: dill, pickle, cloudpickle or arrow',
+      'default': None, 'type': str}),
+    ('cache',
+     {'help': 'Reuse cached outputs of function jobs, see fyrd.cache',
+      'default': None, 'type': bool}),
     ('scriptpath',
      {'help': 'Folder to write cluster script files to, must be accessible ' +
               'to the compute nodes.',
@@ -152,7 +158,12 @@ CLUSTER_OPTS = _OD([
 #  from: adaptivecomputing.com/torque/4-0-2/Content/topics/commands/qsub.htm  #
 ###############################################################################
 
-TORQUE = _OD()
+TORQUE = _OD([
+    ('priority',
+     {'help': 'Job priority, higher runs first (-1024 to 1023), also local',
+      'default': None, 'type': int,
+      'torque': '-p {}'}),
+])
 
 #####################################################
 #                   SLURM Options                   #
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+A persistent cache of function job results.
+
+If caching is enabled (the enabled option in the [cache] section of the config
+or the cache keyword), `Job.submit()` looks up the job in the cache first and,
+on a hit, becomes a completed job holding the cached output without writing or
+submitting anything. Successful outputs are added to the cache when they are
+fetched.
+
+Results are keyed by a hash of the function and its arguments. Functions are
+hashed by their code rather than their name, so editing a function invalidates
+its results:
+
+    - The bytecode and constants of the function and any nested functions
+    - Its defaults and closure
+    - Every function from the same module that it calls, recursively, and the
+      value of any simple (number, string or tuple) module level constant it
+      uses
+
+Functions passed as arguments (e.g. the function given to parapply) are hashed
+the same way. Arguments are pickled with dill and the bytes hashed, so
+arguments that pickle differently each time (like sets of strings in different
+processes) just miss.
+
+The cache is a directory (location in the config) of fyrd pickle files, large
+buffers are written as sidecar files so that cached arrays are memory mapped
+on a hit. An sqlite database in the same directory records the size and last
+use of every entry and the hit, miss and eviction counts. Once the cache is
+larger than max_size MB, the least recently used entries are deleted.
+"""
+import os as _os
+import time as _time
+import types as _types
+import sqlite3 as _sqlite3
+import hashlib as _hashlib
+import threading as _threading
+from uuid import uuid4 as _uuid
+from contextlib import contextmanager as _contextmanager
+
+from . import conf as _conf
+from . import logme as _logme
+from . import serialize as _serialize
+
+__all__ = ['ResultCache', 'get_cache', 'make_key', 'function_hash', 'stats',
+           'clear']
+
+# Module level constants of these types are part of a function's hash
+_CONSTANT_TYPES = (bool, int, float, complex, str, bytes, tuple, type(None))
+
+# One ResultCache per location
+_CACHES = {}
+_LOCK = _threading.Lock()
+
+
+###############################################################################
+#                                   Hashing                                   #
+###############################################################################
+
+
+def function_hash(function, _seen=None):
+    """Return a hex digest of the code of function and its dependencies.
+
+    Parameters
+    ----------
+    function : function
+        A python function, not a builtin.
+
+    Returns
+    -------
+    digest : str
+    """
+    seen = _seen if _seen is not None else {}
+    name = getattr(function, '__qualname__', function.__name__)
+    if id(function) in seen:
+        # Recursion, the caller is already hashing this function
+        return seen[id(function)] or 'recursive:{0}'.format(name)
+    seen[id(function)] = None
+    digest = _hashlib.sha256()
+    module = function.__module__
+    digest.update('{0}.{1}'.format(module, name).encode())
+    names = set()
+    _code_digest(function.__code__, digest, names)
+    closure = [i.cell_contents for i in function.__closure__ or []]
+    digest.update(_pickle_digest(
+        (function.__defaults__, getattr(function, '__kwdefaults__', None),
+         closure), seen
+    ).encode())
+    env = function.__globals__
+    for gname in sorted(names):
+        if gname not in env:
+            continue
+        value = env[gname]
+        if isinstance(value, _types.FunctionType):
+            if value.__module__ == module:
+                digest.update(function_hash(value, seen).encode())
+        elif isinstance(value, _CONSTANT_TYPES):
+            digest.update('{0}={1!r}'.format(gname, value).encode())
+    seen[id(function)] = digest.hexdigest()
+    return seen[id(function)]
+
+
+def _code_digest(code, digest, names):
+    """Add code and its nested code objects to digest, collect global names."""
+    digest.update(code.co_code)
+    kwonly = getattr(code, 'co_kwonlyargcount', 0)
+    digest.update(repr((code.co_argcount, kwonly, code.co_flags,
+                        code.co_names)).encode())
+    names.update(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, _types.CodeType):
+            _code_digest(const, digest, names)
+        else:
+            digest.update(repr(const).encode())
+
+
+def _pickle_digest(obj, seen):
+    """Return a hex digest of obj pickled with functions replaced by hashes."""
+    def persistent_id(item):
+        """Pickle functions as their hash."""
+        if isinstance(item, _types.FunctionType):
+            return function_hash(item, seen)
+        return None
+
+    _, data, buffers = _serialize._serialize(
+        obj, 'dill', 0 if _serialize.OOB else None, persistent_id
+    )
+    digest = _hashlib.sha256(data.getvalue())
+    for raw in buffers:
+        digest.update(raw)
+    return digest.hexdigest()
+
+
+def make_key(function, args=None, kwargs=None):
+    """Return the cache key for function(*args, **kwargs).
+
+    Raises
+    ------
+    Exception
+        Anything raised by pickling the arguments.
+    """
+    return _pickle_digest(
+        (function, tuple(args) if args else (), kwargs if kwargs else {}), {}
+    )
+
+
+###############################################################################
+#                                  The Cache                                  #
+###############################################################################
+
+
+class ResultCache(object):
+
+    """A directory of cached function outputs with LRU eviction.
+
+    Attributes
+    ----------
+    location : str
+        The cache directory
+    max_size : int
+        The maximum size of the cache in MB, None or 0 for no limit
+    db : str
+        The index database
+    """
+
+    def __init__(self, location, max_size=None):
+        """Create the cache directory and database if needed."""
+        self.location = _os.path.abspath(_os.path.expanduser(location))
+        self.max_size = max_size
+        self.db = _os.path.join(self.location, 'index.db')
+        if not _os.path.isdir(self.location):
+            _os.makedirs(self.location)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, '
+                'size INTEGER, created REAL, last_used REAL, hits INTEGER)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS counts '
+                '(name TEXT PRIMARY KEY, value INTEGER)'
+            )
+            for name in ['hits', 'misses', 'evictions']:
+                conn.execute(
+                    'INSERT OR IGNORE INTO counts VALUES (?, 0)', (name,)
+                )
+
+    @_contextmanager
+    def _connect(self):
+        """Yield a connection to the index, commit and close on exit."""
+        conn = _sqlite3.connect(self.db, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, conn, name, number=1):
+        """Add number to the count called name."""
+        conn.execute('UPDATE counts SET value = value + ? WHERE name = ?',
+                     (number, name))
+
+    def path(self, key):
+        """Return the file for key."""
+        return _os.path.join(self.location, key[:2], key + '.pickle')
+
+    def get(self, key):
+        """Look up key, counting a hit or a miss.
+
+        Returns
+        -------
+        found : bool
+        output : any
+            The cached output, None on a miss.
+        """
+        path = self.path(key)
+        with self._connect() as conn:
+            row = conn.execute('SELECT key FROM entries WHERE key = ?',
+                               (key,)).fetchone()
+            if row and not _os.path.isfile(path):
+                _logme.log('Cache file {0} is missing'.format(path), 'warn')
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                row = None
+            if not row:
+                self._count(conn, 'misses')
+                return False, None
+            conn.execute('UPDATE entries SET last_used = ?, hits = hits + 1 '
+                         'WHERE key = ?', (_time.time(), key))
+            self._count(conn, 'hits')
+        return True, _serialize.load(path)
+
+    def put(self, key, output):
+        """Store output under key and evict old entries if needed.
+
+        Returns
+        -------
+        added : bool
+            False if key was already cached.
+        """
+        path = self.path(key)
+        with self._connect() as conn:
+            if conn.execute('SELECT key FROM entries WHERE key = ?',
+                            (key,)).fetchone():
+                return False
+        folder = _os.path.dirname(path)
+        if not _os.path.isdir(folder):
+            _os.makedirs(folder)
+        # Write under a temporary name so readers never see a partial file
+        tmp = '{0}.{1}.tmp'.format(path, str(_uuid()).split('-')[0])
+        buffers = _serialize.dump(output, tmp, buffer_dir=folder)
+        _os.rename(tmp, path)
+        size = _os.path.getsize(path) + sum(
+            [_os.path.getsize(i) for i in buffers]
+        )
+        now = _time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, 0)',
+                (key, size, now, now)
+            )
+        _logme.log('Cached {0} bytes as {1}'.format(size, key), 'debug')
+        if self.max_size:
+            self.evict()
+        return True
+
+    def evict(self, max_size=None):
+        """Delete least recently used entries until below max_size.
+
+        Parameters
+        ----------
+        max_size : int, optional
+            Size in MB, defaults to self.max_size.
+
+        Returns
+        -------
+        evicted : list
+            The keys deleted.
+        """
+        max_size = max_size if max_size is not None else self.max_size
+        if max_size is None:
+            return []
+        limit = max_size*1024*1024
+        evicted = []
+        with self._connect() as conn:
+            total = conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM entries'
+            ).fetchone()[0]
+            if total <= limit:
+                return []
+            for key, size in conn.execute(
+                    'SELECT key, size FROM entries ORDER BY last_used'
+            ).fetchall():
+                if total <= limit:
+                    break
+                _serialize.remove(self.path(key))
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= size
+                evicted.append(key)
+            self._count(conn, 'evictions', len(evicted))
+        _logme.log('Evicted {0} cached results'.format(len(evicted)), 'debug')
+        return evicted
+
+    def stats(self):
+        """Return a dictionary of cache statistics.
+
+        Returns
+        -------
+        stats : dict
+            hits, misses, evictions, entries, size (in bytes) and hit_rate
+        """
+        with self._connect() as conn:
+            stats = dict(conn.execute('SELECT name, value FROM counts'))
+            stats['entries'], stats['size'] = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+            ).fetchone()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = float(stats['hits'])/lookups if lookups else None
+        return stats
+
+    def clear(self, reset_stats=False):
+        """Delete every cached result.
+
+        Parameters
+        ----------
+        reset_stats : bool, optional
+            Also zero the hit, miss and eviction counts.
+        """
+        with self._connect() as conn:
+            for (key,) in conn.execute('SELECT key FROM entries').fetchall():
+                _serialize.remove(self.path(key))
+            conn.execute('DELETE FROM entries')
+            if reset_stats:
+                conn.execute('UPDATE counts SET value = 0')
+
+    def __len__(self):
+        """Return the number of entries."""
+        return self.stats()['entries']
+
+    def __repr__(self):
+        """Display location and size."""
+        return 'ResultCache<{0}:{1}MB>'.format(self.location, self.max_size)
+
+
+###############################################################################
+#                                Module Access                                #
+###############################################################################
+
+
+def get_cache():
+    """Return the ResultCache at the location in the config."""
+    location = _os.path.abspath(_os.path.expanduser(
+        _conf.get_option('cache', 'location')
+    ))
+    with _LOCK:
+        if location not in _CACHES:
+            _CACHES[location] = ResultCache(location)
+        cache = _CACHES[location]
+    cache.max_size = _conf.get_option('cache', 'max_size')
+    return cache
+
+
+def stats():
+    """Return the statistics of the configured cache, see ResultCache.stats."""
+    return get_cache().stats()
+
+
+def clear(reset_stats=False):
+    """Empty the configured cache, see ResultCache.clear."""
+    return get_cache().clear(reset_stats)
@@ -89,6 +89,12 @@ DEFAULTS = {
         'suffix':          'cluster',
         'auto_submit':     True,
         'generic_python':  False,
+        'result_transport': 'file',
+        'shm_max_age':     24,
+        'out_of_band':     True,
+        'serializer':      'dill',
+        'compression':     None,
+        'dedup':           True,
         'profile_file':    _os.path.join(
             CONFIG_PATH, 'profiles.txt'
         )
@@ -108,6 +114,26 @@ DEFAULTS = {
         'server_uri':      None,
         'max_jobs':        None,
         'local_clean_days': 7,
+        'max_mem':         None,
+        'enforce_mem':     False,
+        'scheduler':       'backfill',
+    },
+    'inline': {
+        'max_jobs':        None,
+    },
+    'cache': {
+        'enabled':         False,
+        'location':        _os.path.join(CONFIG_PATH, 'cache'),
+        'max_size':        10000,
+    },
+    'split': {
+        'target_runtime':  900,
+        'pilot_size':      1000,
+        'max_jobs':        None,
+        'straggler_factor': 3.0,
+        'speculate_after':  0.75,
+        'speculate_factor': 2.0,
+        'fan_in':           8,
     }
 }
 
@@ -192,6 +218,37 @@ CONF_HELP = {
         generic_python : bool
             Use /usr/bin/env python instead of the current executable, not
             advised, but sometimes necessary.
+        result_transport : {'file', 'shm'}
+            How local and inline function jobs return large numpy and pandas
+            results. 'shm' writes their buffers to /dev/shm and maps them
+            into the calling process without copying, 'file' (the default)
+            writes them to the output directory (see out_of_band).
+        shm_max_age : int
+            Hours after which result buffers left in /dev/shm, e.g. by killed
+            jobs or results that were never fetched, are deleted. Checked the
+            first time a process uses the shm transport, None to never delete
+            them.
+        out_of_band : bool
+            Write numpy and pandas buffers of 1 MB or more in function
+            arguments and outputs to separate files next to the pickle files
+            (pickle protocol 5). The runner and the caller memory map them
+            instead of reading and copying them.
+        serializer : {'dill', 'pickle', 'cloudpickle', 'arrow'}
+            How to pickle function jobs, can be overridden with the serializer
+            keyword. 'pickle' is much faster for plain data but functions must
+            be importable, 'arrow' writes DataFrames as Arrow IPC streams and
+            needs pyarrow. Anything a serializer cannot write uses dill.
+        compression : {None, 'auto', 'zstd', 'lz4', 'gzip'}
+            Compress function pickles of 64 KB or more, useful when shared
+            filesystems are slower than the CPU. 'auto' picks zstd, then lz4
+            (if installed), then gzip. Compressed pickles have no out-of-band
+            buffers.
+        dedup : bool
+            Store function bodies and arguments that pickle to 64 KB or more
+            once, in a content addressed store in the script path
+            (.fyrd_blobs), instead of once per job. Each job pickle gets a hard
+            link to the blobs it uses, and a blob is deleted with its last
+            link.
         profile_file : str
             the config file where profiles are defined.
         """
@@ -245,6 +302,84 @@ CONF_HELP = {
         local_clean_days : int, optional
             The number of days to keep jobs in the local queue. Any jobs older
             than this will be purged from the database
+        max_mem : int or 'auto', optional
+            Total memory in MB that running local jobs can request with the
+            mem keyword, jobs wait until their memory is free. 'auto' uses
+            all of the system memory. By default memory is not tracked.
+        enforce_mem : bool, optional
+            Limit the address space of each local job to its mem with
+            setrlimit, jobs that exceed it get memory errors.
+        scheduler : {'backfill', 'priority', 'fifo'}, optional
+            How the local queue picks jobs to start. 'fifo' starts any job
+            that fits in submission order, 'priority' does the same highest
+            priority first. 'backfill' (the default) reserves resources for
+            the highest priority job that does not fit, other jobs only jump
+            ahead of it if their time keyword says they will finish first.
+        """
+    ),
+    'inline': _dnt(
+        """
+        [inline]
+        Set options just for the inline batch system, which runs jobs in a
+        thread pool inside the submitting python process.
+
+        Options
+        -------
+        max_jobs : int, optional
+            Set the number of worker threads, defaults to the number of cores.
+        """
+    ),
+    'cache': _dnt(
+        """
+        [cache]
+        A persistent cache of function job results, see fyrd.cache.
+
+        Options
+        -------
+        enabled : bool
+            Look up function jobs in the cache before submitting them and
+            cache their outputs. A job whose function code and arguments are
+            unchanged is not run again. Can be overridden with the cache
+            keyword.
+        location : str
+            The cache directory, must be accessible from the submitting
+            machine only.
+        max_size : int
+            The maximum size of the cache in MB, least recently used results
+            are deleted past this. 0 for no limit.
+        """
+    ),
+    'split': _dnt(
+        """
+        [split]
+        How parapply and splitrun pick the number of jobs when jobs='auto',
+        deal with stragglers and combine results on the cluster.
+
+        Options
+        -------
+        target_runtime : int
+            Seconds of work to aim for in every job. The job count is the
+            total work measured by the pilot job divided by this, or more if
+            the queue has free slots and the jobs would still take longer than
+            their overhead.
+        pilot_size : int
+            Rows or records run in the pilot job that measures the cost of
+            the work, at most a twentieth of the input.
+        max_jobs : int
+            The most jobs jobs='auto' will use, default no limit beyond the
+            number of rows or records.
+        straggler_factor : float
+            With steal=True, a parapply job still running after this many
+            times its expected runtime is split further.
+        speculate_after : float
+            With speculate=True, the fraction of jobs that must be done
+            before stragglers are run again.
+        speculate_factor : float
+            With speculate=True, a job still running after this many times
+            the median runtime of the finished jobs is run again.
+        fan_in : int
+            How many job results every combine job merges when parapply runs
+            on files.
         """
     )
 }
@@ -10,8 +10,23 @@ parapply_summary
     Run parapply and merge the results (don't concatenate).
 splitrun
     Split a file, run a command in parallel, return result.
+mapreduce
+    Run a map and a reduce step by key as one set of dependent jobs.
+
+Classes
+-------
+Reducer
+    An associative summary that parapply_summary merges with a tree of jobs.
 """
 import os as _os
+import json as _json
+import math as _math
+import time as _time
+import heapq as _heapq
+import hashlib as _hashlib
+import multiprocessing as _mp
+from uuid import uuid4 as _uuid
+from glob import glob as _glob
 from six import text_type as _txt
 from six import string_types as _str
 from six import integer_types as _int
@@ -23,8 +38,12 @@ from six import integer_types as _int
 from . import run as _run
 from . import conf as _conf
 from . import logme as _logme
+from . import cache as _cache
+from . import serialize as _serialize
 from . import batch_systems as _batch
+from . import ClusterError as _ClusterError
 from .job import Job as _Job
+from .queue import Queue as _Queue
 
 _options = _batch.options
 
@@ -38,7 +57,22 @@ try:
 except ImportError:
     _logme.log('Could not import numpy and pandas for helpers', 'debug')
 
-__all__ = ['jobify', 'parapply', 'parapply_summary', 'splitrun']
+try:
+    import pyarrow as _pa
+    from pyarrow import feather as _feather
+    from pyarrow import parquet as _parquet
+except ImportError:
+    _pa = None
+
+# Ways to hand DataFrame shards to parapply jobs, all but pickle need pyarrow
+SHARD_FORMATS = ['pickle', 'feather', 'parquet']
+
+# Extensions of the files parapply can read without loading them locally
+FILE_FORMATS = {'parquet': 'parquet', 'pq': 'parquet', 'csv': 'csv',
+                'tsv': 'csv', 'txt': 'csv'}
+
+__all__ = ['jobify', 'parapply', 'parapply_summary', 'splitrun', 'mapreduce',
+           'Reducer']
 
 ###############################################################################
 #                                 Decorators                                  #
@@ -145,7 +179,9 @@ def jobify(name=None, profile=None, qtype=None, submit=True, **kwds):
 
 def parapply(jobs, df, func, args=(), profile=None, applymap=False,
              merge_axis=0, merge_apply=False, name='parapply', imports=None,
-             direct=True, **kwds):
+             direct=True, shard_format=None, qtype=None, steal=False,
+             speculate=False, read_kwds=None, fan_in=None, outfile=None,
+             **kwds):
     """Split a dataframe, run apply in parallel, return result.
 
     This function will split a dataframe into however many pieces are requested
@@ -155,6 +191,52 @@ def parapply(jobs, df, func, args=(), profile=None, applymap=False,
     If the 'clean_files' and 'clean_outputs' arguments are not passed, we
     delete all intermediate files and output files by default.
 
+    By default every piece of the dataframe is pickled into its job's
+    function file and the results are pickled back. With shard_format
+    'feather' or 'parquet' (both need pyarrow), the pieces are written as
+    uncompressed Arrow IPC (Feather) or Parquet files in the script path
+    instead, which the jobs read memory mapped. DataFrame and Series results
+    come back the same way. This saves a lot of pickling time and memory on
+    multi-GB dataframes. Numpy arrays are always pickled.
+
+    If jobs is 'auto', a pilot job first runs the function on the first rows
+    (pilot_size in the [split] config, at most a twentieth of the rows). The
+    time it takes sets the number of jobs for the rest: enough to keep every
+    job under target_runtime seconds, more if the queue has free slots and
+    the jobs would still run longer than their submission overhead. The
+    pilot output is used as the first piece of the result.
+
+    If steal is True, a job that runs for much longer than expected
+    (straggler_factor in the [split] config times the runtime predicted by
+    the pilot job, or the median runtime of the finished jobs) has its piece
+    of the dataframe split further and submitted as new jobs. Whichever is
+    done first, the original job or all of the new ones, is used and the
+    other is killed.
+
+    If speculate is True, once speculate_after (in the [split] config) of the
+    jobs are done, a job still running speculate_factor times longer than
+    their median runtime is submitted again on the same piece of the
+    dataframe. The first copy to finish is used and the other is killed.
+    This stops one job on a slow node holding up the result.
+
+    df can also be the path to a CSV or Parquet file, a glob, a directory or
+    a list of files (by extension: .parquet and .pq, or .csv, .tsv and .txt,
+    which can be gzipped or bzipped). The data is then never loaded by this
+    process. Parquet files are split by row group, from their metadata.
+    Uncompressed CSV files are split into byte ranges at record boundaries
+    (which, with a header, every range starts with), compressed ones go to a
+    job whole. The pieces are grouped into jobs of about equal size, in
+    order, and each job reads its own with read_kwds. With jobs='auto' every
+    file or row group is a job. The default integer index restarts in every
+    piece of a CSV file, use index_col in read_kwds to keep a real one.
+
+    The job results are saved in the script path and concatenated by combine
+    jobs, each taking fan_in results and depending on the jobs that make
+    them, until one is left. merge_apply runs in the last combine job, so
+    only the final result is loaded here. If outfile is given, it is written
+    there instead (Parquet, CSV or TSV by extension, else a pickle) and never
+    loaded. steal and speculate do not work with files.
+
     This function will take any keyword arguments accepted by Job, which can
     be found by running fyrd.options.option_help(). It also accepts any of
     the keywords accepted by by pandas.DataFrame.apply(), found
@@ -162,10 +244,11 @@ def parapply(jobs, df, func, args=(), profile=None, applymap=False,
 
     Parameters
     ----------
-    jobs : int
-        Number of pieces to split the dataframe into
-    df : DataFrame
-        Any pandas DataFrame
+    jobs : int or 'auto'
+        Number of pieces to split the dataframe into, 'auto' to pick it with
+        a pilot job, see above.
+    df : DataFrame or str or list
+        Any pandas DataFrame, or CSV or Parquet files, see above
     args : tuple
         Positional arguments to pass to the function, keyword arguments can
         just be passed directly.
@@ -185,6 +268,23 @@ def parapply(jobs, df, func, args=(), profile=None, applymap=False,
         `['import numpy', 'scipy', 'from numpy import mean']`
     direct : bool
         Whether to run the function directly or to return a Job. Default True.
+    shard_format : {'pickle', 'feather', 'parquet'}
+        How to send the pieces of df to the jobs, see above. Default 'pickle'.
+    qtype : str
+        Override the default queue type
+    steal : bool
+        Split stragglers further, see above. Default False.
+    speculate : bool
+        Run stragglers again, see above. Default False.
+    read_kwds : dict
+        For files, keyword arguments for `pandas.read_csv()` or
+        `pyarrow.parquet.ParquetFile.read_row_groups()`, e.g. `{'sep': ';'}`
+        or `{'columns': ['A', 'B']}`.
+    fan_in : int
+        For files, how many results every combine job concatenates, default
+        fan_in in the [split] config.
+    outfile : str
+        For files, where to write the result instead of returning it.
 
     Any keyword arguments recognized by fyrd will be used for job
     submission.
@@ -195,7 +295,7 @@ def parapply(jobs, df, func, args=(), profile=None, applymap=False,
     -------
     DataFrame
         A recombined DataFrame: concatenated version of original split
-        DataFrame
+        DataFrame, or the absolute path to outfile
 
     Example
     -------
@@ -221,12 +321,16 @@ def parapply(jobs, df, func, args=(), profile=None, applymap=False,
         return _parapply(
             jobs, df, func, args=args, profile=profile, applymap=applymap,
             merge_axis=merge_axis, merge_apply=merge_apply, name=name,
-            imports=imports, **kwds
+            imports=imports, shard_format=shard_format, qtype=qtype,
+            steal=steal, speculate=speculate, read_kwds=read_kwds,
+            fan_in=fan_in, outfile=outfile, **kwds
         )
     kwargs = dict(
         args=args, profile=profile, applymap=applymap,
         merge_axis=merge_axis, merge_apply=merge_apply, name=name,
-        imports=imports
+        imports=imports, shard_format=shard_format, qtype=qtype, steal=steal,
+        speculate=speculate, read_kwds=read_kwds, fan_in=fan_in,
+        outfile=outfile
     )
     kwds = _options.sanitize_arguments(kwds)
     kwargs.update(kwds)
@@ -241,21 +345,50 @@ def parapply(jobs, df, func, args=(), profile=None, applymap=False,
 
 def _parapply(jobs, df, func, args=(), profile=None, applymap=False,
               merge_axis=0, merge_apply=False, name='parapply', imports=None,
+              shard_format=None, qtype=None, steal=False, speculate=False,
+              read_kwds=None, fan_in=None, outfile=None, summarize=False,
               **kwds):
-    """Direct running function for parapply, see parapply docstring."""
+    """Direct running function for parapply, see parapply docstring.
+
+    If summarize is True, the result is transposed and func applied to it
+    again, for `parapply_summary()`, or for a Reducer func the pieces are
+    summarised and merged by `_parapply_tree()`.
+    """
     # Handle arguments
-    if not isinstance(jobs, _int):
-        raise ValueError('Jobs argument must be an integer.')
-    if not isinstance(df, (_pd.core.frame.DataFrame, _np.ndarray)):
-        raise ValueError('df must be a dataframe or numpy array, is {}'
+    if not isinstance(jobs, _int) and jobs != 'auto':
+        raise ValueError("Jobs argument must be an integer or 'auto'.")
+    files = isinstance(df, (_str, _txt, list, tuple))
+    if not files and not isinstance(df, (_pd.core.frame.DataFrame,
+                                         _np.ndarray)):
+        raise ValueError('df must be a dataframe, numpy array or path, is {}'
                          .format(type(df)))
+    reducer = func if summarize and isinstance(func, Reducer) else None
+    if (files or reducer) and (steal or speculate):
+        raise ValueError('steal and speculate do not work with files or '
+                         'reducers')
+    if outfile and not (files or reducer):
+        raise ValueError('outfile only works with files or reducers')
     if not callable(func):
         raise ValueError('function must be callable, current type is {}'
                          .format(type(func)))
     if profile is not None and not isinstance(profile, (_str, _txt)):
         raise ValueError('Profile must be a string, is {}'
                          .format(type(profile)))
+    shard_format = shard_format if shard_format else 'pickle'
+    if shard_format not in SHARD_FORMATS:
+        raise ValueError('shard_format must be one of {0}, is {1}'
+                         .format(SHARD_FORMATS, shard_format))
+    if shard_format != 'pickle' and _pa is None:
+        raise ValueError("shard_format '{0}' needs pyarrow, which is not "
+                         "installed".format(shard_format))
+    if (shard_format != 'pickle' and not files
+            and not isinstance(df, _pd.DataFrame)):
+        _logme.log('Only DataFrames can be written as {0}, pickling'
+                   .format(shard_format), 'debug')
+        shard_format = 'pickle'
     fyrd_kwds, pandas_kwds = _options.split_keywords(kwds)
+    if reducer and (args or pandas_kwds):
+        raise ValueError('Reducers do not take arguments')
 
     # Get name
     name = name if name else 'split_file'
@@ -266,13 +399,10 @@ def _parapply(jobs, df, func, args=(), profile=None, applymap=False,
     if 'clean_outputs' not in fyrd_kwds:
         fyrd_kwds['clean_outputs'] = True
 
-    # Split dataframe
-    _logme.log('Splitting dataframe', 'debug')
-    dfs = _np.array_split(df, jobs)
-    assert len(dfs) == jobs
-
     # Pick function
     sub_func = _run_applymap if applymap else _run_apply
+    if reducer:
+        sub_func = _run_reducer
 
     # Some sane imports
     imports  = _run.listify(imports) if imports else []
@@ -280,31 +410,129 @@ def _parapply(jobs, df, func, args=(), profile=None, applymap=False,
                 'import sp', 'import pandas as pd', 'import pandas',
                 'from matplotlib import pyplot as plt',
                 'from scipy import stats']
-    imports = _run.export_imports(func, {'imports': imports})
+    imports = _run.export_imports(_func_of(func), {'imports': imports})
+
+    if files:
+        return _parapply_files(
+            jobs, df, func, args, sub_func, pandas_kwds, fyrd_kwds,
+            profile=profile, merge_axis=merge_axis, merge_apply=merge_apply,
+            summarize=summarize, name=name, imports=imports,
+            shard_format=shard_format, qtype=qtype, read_kwds=read_kwds,
+            fan_in=fan_in, outfile=outfile
+        )
+
+    shards = []
+    if shard_format != 'pickle':
+        # Paths are popped from the keywords, so use a copy
+        cpath = _conf.get_job_paths(dict(fyrd_kwds))[3]
+
+    def write_shard(piece, nm):
+        """Write piece to a shard file for job nm, return the path."""
+        shard = _os.path.join(cpath, '{0}.{1}.shard.{2}'.format(
+            nm, _os.getpid(), shard_format
+        ))
+        _write_shard(piece, shard, shard_format)
+        shards.append(shard)
+        return shard
+
+    def submit(piece, nm):
+        """Submit a job running sub_func on piece of the dataframe."""
+        if shard_format == 'pickle':
+            job_args = (piece, func, args, pandas_kwds)
+            job_func = sub_func
+        else:
+            shard  = write_shard(piece, nm)
+            result = shard[:-len(shard_format)] + 'out.' + shard_format
+            shards.append(result)
+            job_args = (shard, result, shard_format, sub_func, func, args,
+                        pandas_kwds)
+            job_func = _run_shard
+        return _Job(job_func, job_args, profile=profile, name=nm,
+                    qtype=qtype, imports=imports, **fyrd_kwds).submit()
+
+    # Time the work on the first rows to pick the number of jobs, the pilot
+    # result is the first part of the output
+    results  = []
+    expected = None
+    if jobs == 'auto':
+        pilot_rows = _pilot_size(len(df))
+        pkwds = fyrd_kwds.copy()
+        pkwds['syspaths'] = _run.update_syspaths(_func_of(func), fyrd_kwds)
+        out, runtime, overhead = _run_pilot(_Job(
+            _timed, (sub_func, (df[:pilot_rows], func, args, pandas_kwds)),
+            profile=profile, name='{0}_pilot'.format(name), qtype=qtype,
+            imports=imports, **pkwds
+        ))
+        results.append(out)
+        df = df[pilot_rows:]
+        jobs = _choose_jobs(runtime, overhead, pilot_rows, len(df), qtype)
+        if jobs:
+            expected = runtime/pilot_rows*len(df)/jobs + overhead
+
+    # Split dataframe
+    _logme.log('Splitting dataframe', 'debug')
+    dfs = _np.array_split(df, jobs) if jobs else []
+    assert len(dfs) == jobs
+
+    names = ['{}_{}_of_{}'.format(name, i, jobs) for i in range(1, jobs+1)]
+
+    # Summaries are merged by a tree of combine jobs
+    if reducer:
+        try:
+            tasks = [[('frame', d, None, 0)] if shard_format == 'pickle'
+                     else [(shard_format, write_shard(d, nm), None, 0)]
+                     for d, nm in zip(dfs, names)]
+            del dfs
+            return _parapply_tree(
+                tasks, func, args, sub_func, pandas_kwds, fyrd_kwds,
+                profile=profile, summarize=True, name=name, imports=imports,
+                shard_format=shard_format, qtype=qtype, fan_in=fan_in,
+                outfile=outfile, done=results
+            )
+        finally:
+            for shard in shards:
+                if _os.path.isfile(shard):
+                    _os.remove(shard)
 
     # Run the functions
     _logme.log('Submitting jobs', 'debug')
-    outs = []
-    count = 1
-    for d in dfs:
-        nm = '{}_{}_of_{}'.format(name, count, jobs)
-        outs.append(
-            _Job(sub_func, (d, func, args, pandas_kwds),
-                 profile=profile, name=nm, imports=imports,
-                 **fyrd_kwds).submit()
-        )
-        count += 1
+    outs  = [submit(d, nm) for d, nm in zip(dfs, names)]
+    if not steal and not speculate:
+        # Free the copies, the jobs have their own
+        del dfs
+
+    def resplit(index):
+        """Submit the piece of a straggler as more, smaller, jobs."""
+        piece = dfs[index]
+        count = min(max(2, _free_slots(qtype)), len(piece))
+        if count < 2:
+            return None
+        return [submit(d, '{0}.{1}'.format(names[index], i))
+                for i, d in enumerate(_np.array_split(piece, count), 1)]
+
+    def duplicate(index):
+        """Submit the piece of a straggler again."""
+        return submit(dfs[index], names[index] + '.spec')
 
     # Get the results
     _logme.log('Waiting for results', 'debug')
-    results = []
-    for out in outs:
-        try:
-            results.append(out.get())
-        except IOError:
-            _logme.log('Result getting failed, most likely one of the child ' +
-                       'jobs crashed, check the error files', 'critical')
-            raise
+    try:
+        for finished in _gather(outs, resplit if steal else None, expected,
+                                duplicate if speculate else None):
+            for job in finished:
+                result = job.get()
+                if isinstance(result, _Shard):
+                    result = result.read()
+                results.append(result)
+    except IOError:
+        _logme.log('Result getting failed, most likely one of the ' +
+                   'child jobs crashed, check the error files',
+                   'critical')
+        raise
+    finally:
+        for shard in shards:
+            if _os.path.isfile(shard):
+                _os.remove(shard)
 
     # Return the recombined DataFrame
     _logme.log('Done, joinging', 'debug')
@@ -317,11 +545,17 @@ def _parapply(jobs, df, func, args=(), profile=None, applymap=False,
     if merge_apply:
         out = sub_func(out, func, args, pandas_kwds)
 
+    if summarize:
+        out = sub_func(out.T, func, args, pandas_kwds)
+
     return out
 
 
 def parapply_summary(jobs, df, func, args=(), profile=None, applymap=False,
-                     name='parapply', imports=None, direct=True, **kwds):
+                     name='parapply', imports=None, direct=True,
+                     shard_format=None, qtype=None, steal=False,
+                     speculate=False, read_kwds=None, fan_in=None,
+                     outfile=None, **kwds):
     """Run parapply for a function with summary stats.
 
     Instead of returning the concatenated result, merge the result using
@@ -330,12 +564,26 @@ def parapply_summary(jobs, df, func, args=(), profile=None, applymap=False,
     This works best for summary functions like `.mean()`, which do a linear
     operation on a whole dataframe or series.
 
+    With files as df, the results are merged and the function applied again
+    by combine jobs on the cluster, see `parapply()`.
+
+    That is only right for some functions though, a mean of means is not the
+    mean of unevenly sized pieces. Functions that can be merged exactly in
+    any order can be declared by passing a `Reducer` as func, or the name of
+    one in REDUCERS: 'sum', 'count', 'mean' (merged as sums and counts),
+    'min' or 'max', which summarise every column over all rows. Every job
+    then saves a summary of its piece and combine jobs on the cluster merge
+    fan_in of them at a time, each starting as soon as its jobs are done,
+    until only the final result is left to come back. This works for
+    DataFrames and files, and is the way to summarise many pieces without
+    gathering them all here.
+
     Parameters
     ----------
-    jobs : int
-        Number of pieces to split the dataframe into
-    df : DataFrame
-        Any pandas DataFrame
+    jobs : int or 'auto'
+        Number of pieces to split the dataframe into, see `parapply()`.
+    df : DataFrame or str or list
+        Any pandas DataFrame, or CSV or Parquet files, see `parapply()`
     args : tuple
         Positional arguments to pass to the function, keyword arguments can
         just be passed directly.
@@ -355,6 +603,22 @@ def parapply_summary(jobs, df, func, args=(), profile=None, applymap=False,
         `['import numpy', 'scipy', 'from numpy import mean']`
     direct : bool
         Whether to run the function directly or to return a Job. Default True.
+    shard_format : {'pickle', 'feather', 'parquet'}
+        How to send the pieces of df to the jobs, see `parapply()`.
+    qtype : str
+        Override the default queue type
+    steal : bool
+        Split stragglers further, see `parapply()`. Default False.
+    speculate : bool
+        Run stragglers again, see `parapply()`. Default False.
+    read_kwds : dict
+        For files, keyword arguments for reading them, see `parapply()`.
+    fan_in : int
+        For files and reducers, how many results every combine job merges,
+        default fan_in in the [split] config.
+    outfile : str
+        For files and reducers, where to write the result instead of
+        returning it.
 
     Any keyword arguments recognized by fyrd will be used for job
     submission.
@@ -364,7 +628,7 @@ def parapply_summary(jobs, df, func, args=(), profile=None, applymap=False,
     Returns
     -------
     DataFrame
-        A recombined DataFrame
+        A recombined DataFrame, or the absolute path to outfile
 
     Example
     -------
@@ -377,25 +641,36 @@ def parapply_summary(jobs, df, func, args=(), profile=None, applymap=False,
     0     6.083333
     1    27.166667
     dtype: float64
+    >>> df = pandas.DataFrame([[0, 1], [2, 6], [9, 24], [13, 76], [4, 12]])
+    >>> fyrd.helpers.parapply_summary(2, df, 'mean')
+    0     5.6
+    1    23.8
+    dtype: float64
 
     See Also
     --------
     parapply: Run a command in parallel on a DataFrame without merging the
     result
     """
+    if isinstance(func, (_str, _txt)):
+        func = get_reducer(func)
     if direct:
         return _parapply_summary(
             jobs, df, func, args=args, profile=profile, applymap=applymap,
-            name=name, imports=imports, **kwds
+            name=name, imports=imports, shard_format=shard_format,
+            qtype=qtype, steal=steal, speculate=speculate,
+            read_kwds=read_kwds, fan_in=fan_in, outfile=outfile, **kwds
         )
     kwargs = dict(
         args=args, profile=profile, applymap=applymap,
-        name=name, imports=imports
+        name=name, imports=imports, shard_format=shard_format, qtype=qtype,
+        steal=steal, speculate=speculate, read_kwds=read_kwds, fan_in=fan_in,
+        outfile=outfile
         )
     kwds = _options.sanitize_arguments(kwds)
     kwargs.update(kwds)
-    kwargs['imports']  = _run.get_all_imports(func, kwargs)
-    kwargs['syspaths'] = _run.update_syspaths(func, kwargs)
+    kwargs['imports']  = _run.get_all_imports(_func_of(func), kwargs)
+    kwargs['syspaths'] = _run.update_syspaths(_func_of(func), kwargs)
     return _wrap_runner(
         _parapply_summary,
         *(jobs, df, func),
@@ -404,21 +679,19 @@ def parapply_summary(jobs, df, func, args=(), profile=None, applymap=False,
 
 
 def _parapply_summary(jobs, df, func, args=(), profile=None, applymap=False,
-                      name='parapply', imports=None, **kwds):
+                      name='parapply', imports=None, shard_format=None,
+                      qtype=None, steal=False, speculate=False,
+                      read_kwds=None, fan_in=None, outfile=None, **kwds):
     """Direct running function for parapply_sumary, see that docstring."""
-    imports = _run.export_imports(func, {'imports': imports})
-    out = parapply(jobs, df, func, args, profile, applymap, name=name,
-                   merge_axis=1, imports=imports, **kwds)
-
-    # Pick function and get args
-    sub_func = _run_applymap if applymap else _run_apply
-    pandas_kwds = _options.split_keywords(kwds)[1]
-
-    # Transpose
-    out = out.T
-
-    # Run the function again
-    return sub_func(out, func, args, pandas_kwds)
+    if isinstance(func, (_str, _txt)):
+        func = get_reducer(func)
+    imports = _run.export_imports(_func_of(func), {'imports': imports})
+    # Transposed and run through the function again after merging
+    return _parapply(jobs, df, func, args, profile, applymap, name=name,
+                     merge_axis=1, imports=imports, shard_format=shard_format,
+                     qtype=qtype, steal=steal, speculate=speculate,
+                     read_kwds=read_kwds, fan_in=fan_in, outfile=outfile,
+                     summarize=True, **kwds)
 
 
 def _run_apply(df, func, args=None, pandas_kwds=None):
@@ -467,6 +740,625 @@ def _run_applymap(df, func, args=None, pandas_kwds=None):
     return df.applymap(func, **apply_kwds)
 
 
+def _run_shard(infile, outfile, shard_format, sub_func, func, args=None,
+               pandas_kwds=None):
+    """Run sub_func on a DataFrame shard file, the job side of parapply.
+
+    Parameters
+    ----------
+    infile : str
+        The shard, written by `_write_shard()`
+    outfile : str
+        Where to write a DataFrame or Series result
+    shard_format : str
+        'feather' or 'parquet'
+    sub_func : function
+        `_run_apply()` or `_run_applymap()`
+    func, args, pandas_kwds
+        Passed to sub_func
+
+    Returns
+    -------
+    _Shard or object
+        A _Shard pointing to outfile for DataFrame and Series results, any
+        other result as is.
+    """
+    out = sub_func(_read_shard(infile, shard_format), func, args, pandas_kwds)
+    return _to_shard(out, outfile, shard_format)
+
+
+def _to_shard(out, path, shard_format):
+    """Write a DataFrame or Series out to path, return a _Shard for it.
+
+    Anything else, and frames with column names that are not strings, which
+    Arrow cannot store, are returned as is.
+    """
+    if isinstance(out, _pd.Series):
+        _write_shard(out.to_frame('_series'), path, shard_format)
+        return _Shard(path, shard_format, series=True, name=out.name)
+    if (isinstance(out, _pd.DataFrame)
+            and all([isinstance(i, _str) for i in out.columns])):
+        _write_shard(out, path, shard_format)
+        return _Shard(path, shard_format)
+    return out
+
+
+def _write_shard(df, path, shard_format):
+    """Write DataFrame df to path as uncompressed feather or parquet."""
+    if shard_format == 'feather':
+        # Uncompressed, so that reading can memory map it
+        _feather.write_feather(df, path, compression='uncompressed')
+    else:
+        _parquet.write_table(_pa.Table.from_pandas(df), path,
+                             compression='none')
+
+
+def _read_shard(path, shard_format):
+    """Read a DataFrame written by `_write_shard()`, memory mapped."""
+    reader = _feather if shard_format == 'feather' else _parquet
+    return reader.read_table(path, memory_map=True).to_pandas()
+
+
+class _Shard(object):
+
+    """A DataFrame or Series result written to a file by a parapply job."""
+
+    def __init__(self, path, shard_format, series=False, name=None):
+        """Store the location and what to turn it back into."""
+        self.path = path
+        self.shard_format = shard_format
+        self.series = series
+        self.name = name
+
+    def read(self):
+        """Return the DataFrame or Series."""
+        out = _read_shard(self.path, self.shard_format)
+        if self.series:
+            out = out['_series'].rename(self.name)
+        return out
+
+
+def _parapply_files(jobs, paths, func, args, sub_func, pandas_kwds, fyrd_kwds,
+                    read_kwds=None, **tree_kwds):
+    """Run parapply on CSV or Parquet files, see `parapply()`.
+
+    Plans the pieces of the files for every job and runs them with
+    `_parapply_tree()`, which takes the other keyword arguments.
+    """
+    files, file_format = _find_files(paths)
+    if file_format == 'parquet' and _pa is None:
+        raise ValueError('Reading Parquet files needs pyarrow, which is not '
+                         'installed')
+    pieces, weights = _plan_pieces(files, file_format, jobs, read_kwds)
+    if jobs == 'auto':
+        jobs = len(pieces)
+        cmax = _conf.get_option('split', 'max_jobs')
+        if cmax:
+            jobs = min(jobs, int(cmax))
+    groups = _group_pieces(weights, jobs)
+    _logme.log('Reading {0} {1} files in {2} pieces with {3} jobs'
+               .format(len(files), file_format, len(pieces), len(groups)),
+               'info')
+    return _parapply_tree(
+        [[pieces[i] for i in group] for group in groups], func, args,
+        sub_func, pandas_kwds, fyrd_kwds, read_kwds=read_kwds, **tree_kwds
+    )
+
+
+def _parapply_tree(tasks, func, args, sub_func, pandas_kwds, fyrd_kwds,
+                   profile=None, merge_axis=0, merge_apply=False,
+                   summarize=False, name='parapply', imports=None,
+                   shard_format='pickle', qtype=None, read_kwds=None,
+                   fan_in=None, outfile=None, done=None):
+    """Run parapply jobs and combine their results with a tree of jobs.
+
+    Submits a job for every list of pieces (see `_read_pieces()`) in tasks
+    and combine jobs that depend on them, each merging fan_in results, then
+    waits for all of them. Results are concatenated, or merged by func if it
+    is a Reducer and summarize is True. done is a list of results that are
+    already known, they come before those of the jobs.
+
+    Returns
+    -------
+    DataFrame or Series or str
+        The final result, or outfile.
+    """
+    fan_in = int(fan_in if fan_in else _conf.get_option('split', 'fan_in'))
+    if fan_in < 2:
+        raise ValueError('fan_in must be at least 2, is {0}'.format(fan_in))
+    reducer = func if summarize and isinstance(func, Reducer) else None
+
+    # Results go next to the job scripts, paths are popped so use a copy, and
+    # every call gets its own files so calls with one name do not collide
+    cpath = _conf.get_job_paths(dict(fyrd_kwds))[3]
+    base  = _os.path.join(cpath, '{0}.{1}.{2}'.format(
+        name, _os.getpid(), _uuid().hex[:8]
+    ))
+    syspaths = _run.update_syspaths(_func_of(func), fyrd_kwds)
+    job_kwds = dict(fyrd_kwds, syspaths=syspaths)
+    if outfile:
+        outfile = _os.path.abspath(outfile)
+
+    # Save known results and submit the jobs that read the pieces
+    _logme.log('Submitting jobs', 'debug')
+    submitted = []
+    stems = []
+    level = []
+    for count, out in enumerate(done if done else [], 1):
+        stem = '{0}.done_{1}'.format(base, count)
+        _store_part(out, stem, shard_format)
+        stems.append(stem)
+        level.append((None, stem))
+    for count, pieces in enumerate(tasks, 1):
+        stem = '{0}.part_{1}'.format(base, count)
+        job = _Job(
+            _run_pieces, (pieces, read_kwds, stem, shard_format, sub_func,
+                          func, args, pandas_kwds),
+            profile=profile, name='{0}_{1}_of_{2}'.format(
+                name, count, len(tasks)
+            ), qtype=qtype, imports=imports, **job_kwds
+        ).submit()
+        submitted.append(job)
+        stems.append(stem)
+        level.append((job, stem))
+
+    # Combine the results in a tree, the last job runs the final step
+    apply = (sub_func, func, args, pandas_kwds) if (
+        (merge_apply or summarize) and not reducer) else None
+    depth = 0
+    while len(level) > 1 or (depth == 0 and (apply or outfile or reducer)):
+        depth += 1
+        last = len(level) <= fan_in
+        nxt  = []
+        for count, start in enumerate(range(0, len(level), fan_in), 1):
+            group = level[start:start+fan_in]
+            stem  = '{0}.combine_{1}_{2}'.format(base, depth, count)
+            job = _Job(
+                _combine_parts, ([i[1] for i in group], stem, shard_format,
+                                 merge_axis),
+                {'transpose': summarize and last and not reducer,
+                 'apply': apply if last else None,
+                 'outfile': outfile if last else None,
+                 'reducer': reducer, 'finish': last},
+                profile=profile, name='{0}_combine_{1}_{2}'.format(
+                    name, depth, count
+                ), qtype=qtype, imports=imports,
+                depends=[i[0] for i in group if i[0] is not None],
+                **job_kwds
+            ).submit()
+            submitted.append(job)
+            stems.append(stem)
+            nxt.append((job, stem))
+        level = nxt
+
+    # Wait for every job in order, so that the first failure is raised
+    _logme.log('Waiting for results', 'debug')
+    try:
+        for job in submitted:
+            if not job.submitted:
+                raise _ClusterError('Job {0} could not be submitted'
+                                    .format(job.name))
+            job.get()
+            if job.state not in _batch.GOOD_STATES:
+                raise _ClusterError('Job {0} failed, check its error file'
+                                    .format(job.name))
+        out = outfile if outfile else _load_part(level[0][1])
+    except Exception:
+        _logme.log('Result getting failed, most likely one of the child '
+                   'jobs crashed, check the error files', 'critical')
+        for job in submitted:
+            if job.submitted:
+                _kill(job)
+        raise
+    finally:
+        for stem in stems:
+            _remove_part(stem)
+    return out
+
+
+def _find_files(paths):
+    """Return the files in paths and their format, see `parapply()`."""
+    files = []
+    for path in _run.listify(paths):
+        path = _os.path.abspath(_os.path.expandvars(_os.path.expanduser(
+            path
+        )))
+        if _os.path.isdir(path):
+            found = [_os.path.join(path, i) for i in sorted(_os.listdir(path))
+                     if _file_format(i)]
+        elif _os.path.isfile(path):
+            found = [path]
+        else:
+            found = sorted(_glob(path))
+        if not found:
+            raise OSError('Cannot find file {}'.format(path))
+        files += found
+    formats = set([_file_format(i) for i in files])
+    if None in formats:
+        raise ValueError('Can only read files ending in {0}'
+                         .format(sorted(FILE_FORMATS)))
+    if len(formats) > 1:
+        raise ValueError('Cannot read CSV and Parquet files together')
+    return files, formats.pop()
+
+
+def _file_format(path):
+    """Return 'csv' or 'parquet' by the extension of path, or None."""
+    return FILE_FORMATS.get(_file_ext(path))
+
+
+def _file_ext(path):
+    """Return the lower case extension of path, under any .gz or .bz2."""
+    for ext in ('.gz', '.bz2'):
+        if path.endswith(ext):
+            path = path[:-len(ext)]
+    return path.rpartition('.')[2].lower()
+
+
+def _plan_pieces(files, file_format, jobs, read_kwds=None):
+    """Split files into pieces for jobs, return the pieces and their sizes.
+
+    Pieces are (file_format, source, row_groups, offset) tuples for
+    `_read_pieces()`: Parquet row groups with their first row in the file,
+    or CSV files and byte ranges. Sizes are rows or bytes.
+    """
+    pieces  = []
+    weights = []
+    if file_format == 'parquet':
+        for path in files:
+            meta   = _parquet.ParquetFile(path).metadata
+            offset = 0
+            for group in range(meta.num_row_groups):
+                rows = meta.row_group(group).num_rows
+                pieces.append(('parquet', path, [group], offset))
+                weights.append(rows)
+                offset += rows
+        return pieces, weights
+    read_kwds = read_kwds if read_kwds else {}
+    # As in read_csv, names without header means there is no header
+    header = read_kwds.get(
+        'header', None if 'names' in read_kwds else 'infer'
+    ) is not None
+    total  = float(sum([_os.path.getsize(i) for i in files])) or 1.
+    for path in files:
+        size  = _os.path.getsize(path)
+        parts = 1
+        if jobs != 'auto' and not path.endswith(('.gz', '.bz2')):
+            parts = max(1, int(round(size*jobs/total)))
+        if parts == 1:
+            pieces.append(('csv', path, None, 0))
+            weights.append(size)
+            continue
+        for spec in _run.split_ranges(path, parts, keep_header=header,
+                                      splitter='csv'):
+            start, end = _run.parse_range(spec)[1][-1]
+            if end > start:
+                pieces.append(('csv', spec, None, 0))
+                weights.append(end - start)
+    return pieces, weights
+
+
+def _group_pieces(weights, jobs):
+    """Split the pieces into at most jobs contiguous groups of similar size.
+
+    Returns
+    -------
+    list
+        A list of lists of piece indices.
+    """
+    jobs   = max(1, min(jobs, len(weights)))
+    total  = float(sum(weights))
+    groups = [[]]
+    done   = 0
+    for index, weight in enumerate(weights):
+        if groups[-1] and len(groups) < jobs and (
+                done >= total*len(groups)/jobs
+                or len(weights) - index == jobs - len(groups)):
+            groups.append([])
+        groups[-1].append(index)
+        done += weight
+    return groups
+
+
+def _read_pieces(pieces, read_kwds=None):
+    """Read pieces of CSV or Parquet files into a DataFrame, in order.
+
+    Parameters
+    ----------
+    pieces : list
+        Pieces from `_plan_pieces()`, or ('frame', DataFrame, None, 0) and
+        (shard_format, shard, None, 0) for pieces of a DataFrame
+    read_kwds : dict, optional
+        Keyword arguments for `pandas.read_csv()` or
+        `pyarrow.parquet.ParquetFile.read_row_groups()`
+
+    Returns
+    -------
+    DataFrame
+    """
+    frames = []
+    for file_format, source, row_groups, offset in pieces:
+        kwds = dict(read_kwds) if read_kwds else {}
+        if file_format == 'frame':
+            df = source
+        elif file_format in SHARD_FORMATS[1:] and row_groups is None:
+            df = _read_shard(source, file_format)
+        elif file_format == 'parquet':
+            pfile = _parquet.ParquetFile(source)
+            kwds.setdefault('use_pandas_metadata', True)
+            df = pfile.read_row_groups(row_groups, **kwds).to_pandas()
+            # A stored RangeIndex restarts at every row group, shift it back
+            meta  = pfile.schema_arrow.pandas_metadata or {}
+            index = meta.get('index_columns', [])
+            if (len(index) == 1 and isinstance(index[0], dict)
+                    and index[0].get('kind') == 'range'):
+                step  = index[0]['step']
+                start = index[0]['start'] + offset*step
+                df.index = _pd.RangeIndex(start, start + len(df)*step, step,
+                                          name=index[0]['name'])
+        else:
+            parsed = _run.parse_range(source)
+            path = parsed[0] if parsed else source
+            if _file_ext(path) == 'tsv':
+                kwds.setdefault('sep', '\t')
+            if parsed:
+                with _run.open_range(source) as fin:
+                    df = _pd.read_csv(fin, **kwds)
+            else:
+                df = _pd.read_csv(source, **kwds)
+        frames.append(df)
+    return frames[0] if len(frames) == 1 else _pd.concat(frames)
+
+
+def _run_pieces(pieces, read_kwds, stem, shard_format, sub_func, func,
+                args=None, pandas_kwds=None):
+    """Run sub_func on pieces of files, the job side of `_parapply_files()`.
+
+    Returns
+    -------
+    str
+        The file the result is saved in, see `_store_part()`.
+    """
+    df = _read_pieces(pieces, read_kwds)
+    return _store_part(sub_func(df, func, args, pandas_kwds), stem,
+                       shard_format)
+
+
+def _combine_parts(stems, stem, shard_format, merge_axis=0, transpose=False,
+                   apply=None, outfile=None, reducer=None, finish=False):
+    """Concatenate saved results, a combine job of `_parapply_files()`.
+
+    Parameters
+    ----------
+    stems : list
+        The results to combine, saved by `_store_part()`, in order. They are
+        deleted once the result is saved.
+    stem : str
+        Where to save the result
+    shard_format : str
+    merge_axis : int
+    transpose : bool
+        Transpose the result, for `parapply_summary()`
+    apply : tuple
+        (sub_func, func, args, pandas_kwds) to run on the result
+    outfile : str
+        Write the result here with `_write_output()` instead
+    reducer : Reducer
+        Merge the results with reducer.combine instead of concatenating
+    finish : bool
+        Run reducer.finish on the merged result
+
+    Returns
+    -------
+    str
+        The file the result is in.
+    """
+    parts = [_load_part(i) for i in stems]
+    if reducer:
+        out = reducer.combine(parts)
+        if finish and reducer.finish:
+            out = reducer.finish(out)
+    else:
+        out = _pd.concat(parts, axis=merge_axis)
+    if transpose:
+        out = out.T
+    if apply:
+        sub_func, func, args, pandas_kwds = apply
+        out = sub_func(out, func, args, pandas_kwds)
+    if outfile:
+        _write_output(out, outfile)
+        result = outfile
+    else:
+        result = _store_part(out, stem, shard_format)
+    for i in stems:
+        _remove_part(i)
+    return result
+
+
+def _store_part(out, stem, shard_format):
+    """Save a result as stem.result, and stem.<format> for Arrow formats."""
+    if shard_format != 'pickle':
+        out = _to_shard(out, '{0}.{1}'.format(stem, shard_format),
+                        shard_format)
+    _serialize.dump(out, stem + '.result')
+    return stem + '.result'
+
+
+def _load_part(stem):
+    """Load a result saved by `_store_part()`."""
+    out = _serialize.load(stem + '.result')
+    return out.read() if isinstance(out, _Shard) else out
+
+
+def _remove_part(stem):
+    """Delete the files of a result saved by `_store_part()`."""
+    if _os.path.isfile(stem + '.result'):
+        _serialize.remove(stem + '.result')
+    for shard_format in SHARD_FORMATS[1:]:
+        if _os.path.isfile('{0}.{1}'.format(stem, shard_format)):
+            _os.remove('{0}.{1}'.format(stem, shard_format))
+
+
+def _write_output(out, outfile):
+    """Write a DataFrame or Series to outfile, in a format by extension."""
+    file_format = _file_format(outfile)
+    if isinstance(out, _pd.Series) and file_format == 'parquet':
+        out = out.to_frame()
+    if file_format == 'parquet':
+        out.to_parquet(outfile)
+    elif file_format == 'csv':
+        sep = '\t' if _file_ext(outfile) == 'tsv' else ','
+        out.to_csv(outfile, sep=sep)
+    else:
+        out.to_pickle(outfile)
+
+
+###############################################################################
+#                                  Reducers                                   #
+###############################################################################
+
+
+class Reducer(object):
+
+    """An associative summary that `parapply_summary()` merges in a tree.
+
+    Every job summarises its piece of the data with partial, combine jobs
+    merge groups of those summaries with combine and the last one turns the
+    merged summary into the result with finish. As the summaries can be
+    grouped any way, combine must be associative: merging the merged
+    summaries of groups must give the same as merging all of them at once.
+
+    Parameters
+    ----------
+    partial : function
+        Summarise a piece of the data, a DataFrame.
+    combine : function
+        Merge a list of summaries, in order, into one.
+    finish : function, optional
+        Turn the merged summary into the result, e.g. sums and counts into
+        means.
+    name : str, optional
+    """
+
+    def __init__(self, partial, combine, finish=None, name=None):
+        """Store the functions."""
+        self.partial = partial
+        self.combine = combine
+        self.finish  = finish
+        self.name    = name if name else partial.__name__
+
+    def __call__(self, df):
+        """Summarise all of df at once."""
+        out = self.combine([self.partial(df)])
+        return self.finish(out) if self.finish else out
+
+    def __repr__(self):
+        """Show the name."""
+        return 'Reducer<{0}>'.format(self.name)
+
+
+def _numeric(df):
+    """Return the numeric columns of df."""
+    return df.select_dtypes('number') if isinstance(df, _pd.DataFrame) \
+        else df
+
+
+def _sum_partial(df):
+    """Sum the numeric columns."""
+    return _numeric(df).sum()
+
+
+def _count_partial(df):
+    """Count the values that are not missing in every column."""
+    return df.count()
+
+
+def _mean_partial(df):
+    """Sum and count the numeric columns, for means."""
+    num = _numeric(df)
+    return _pd.DataFrame({'sum': num.sum(), 'count': num.count()})
+
+
+def _min_partial(df):
+    """Get the column minimums."""
+    return df.min()
+
+
+def _max_partial(df):
+    """Get the column maximums."""
+    return df.max()
+
+
+def _add_parts(parts):
+    """Add summaries, counting missing columns as 0."""
+    out = parts[0]
+    for part in parts[1:]:
+        out = out.add(part, fill_value=0)
+    return out
+
+
+def _min_parts(parts):
+    """Take the smallest value of every column."""
+    return _pd.concat(parts, axis=1).min(axis=1)
+
+
+def _max_parts(parts):
+    """Take the largest value of every column."""
+    return _pd.concat(parts, axis=1).max(axis=1)
+
+
+def _divide_mean(merged):
+    """Divide the merged sums by the counts."""
+    return merged['sum']/merged['count']
+
+
+# Reducers parapply_summary knows by name, missing values are skipped and
+# sum and mean only use numeric columns
+REDUCERS = {
+    'sum':   Reducer(_sum_partial, _add_parts, name='sum'),
+    'count': Reducer(_count_partial, _add_parts, name='count'),
+    'mean':  Reducer(_mean_partial, _add_parts, _divide_mean, name='mean'),
+    'min':   Reducer(_min_partial, _min_parts, name='min'),
+    'max':   Reducer(_max_partial, _max_parts, name='max'),
+}
+
+
+def get_reducer(reducer):
+    """Return a Reducer.
+
+    Parameters
+    ----------
+    reducer : str or Reducer
+        A name in REDUCERS or a Reducer to use as is.
+
+    Raises
+    ------
+    ValueError
+        If reducer is not a name in REDUCERS or a Reducer.
+    """
+    if isinstance(reducer, Reducer):
+        return reducer
+    if reducer in REDUCERS:
+        return REDUCERS[reducer]
+    raise ValueError('reducer must be one of {0} or a Reducer, is {1}'
+                     .format(sorted(REDUCERS), reducer))
+
+
+def _run_reducer(df, reducer, args=None, pandas_kwds=None):
+    """Summarise a piece of a DataFrame with reducer.partial.
+
+    Used in place of `_run_apply()`, args and pandas_kwds are not used.
+    """
+    if not isinstance(df, (_pd.DataFrame, _pd.Series)):
+        df = _pd.DataFrame(df)
+    return reducer.partial(df)
+
+
+def _func_of(func):
+    """Return the function to get imports and paths from, for Reducers too."""
+    return func.partial if isinstance(func, Reducer) else func
+
+
 ###############################################################################
 #                                  Split Run                                  #
 ###############################################################################
@@ -474,7 +1366,9 @@ def _run_applymap(df, func, args=None, pandas_kwds=None):
 
 def splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
              name=None, qtype=None, profile=None, outfile=None,
-             outheader=False, merge_func=None, direct=True, **kwds):
+             outheader=False, merge_func=None, direct=True, resume=False,
+             split_mode='lines', splitter='lines', merge='concat',
+             merge_key=None, speculate=False, **kwds):
     """Split a file, run command in parallel, return result.
 
     This function will split a file into however many pieces are requested
@@ -516,6 +1410,14 @@ def splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
     If outfile:
         the absolute path to that file
 
+    If merge is 'reduce':
+        the result of calling merge_func(merged, output) on every output in
+        turn, where merged is the first output or the last merge_func result.
+
+    If merge is 'sorted':
+        a single list, the k-way merge of the (already sorted) lists returned
+        by each job.
+
     If merge_func:
         the result of merge_func(list), where list is the list of outputs.
 
@@ -525,10 +1427,58 @@ def splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
     If direct is False, this function returns a fyrd.job.Job object which
     will return the results described above on get().
 
+    If resume is True, the run can be restarted after some of the jobs fail.
+    A manifest of the split files is written to the script path next to them,
+    along with the input file size and modification time, the number of jobs
+    and a hash of the command and arguments. Every successful result is saved
+    next to its split file as it comes in. If any job fails, the split files,
+    results and manifest are kept and the error is raised once all jobs are
+    done. Running splitrun again with the same arguments and resume=True then
+    reuses the split files and only resubmits the jobs with no saved result. If
+    anything in the manifest does not match, the file is split again from
+    scratch.
+
+    If split_mode is 'bytes', the input file is not copied. It is split into
+    byte ranges at line boundaries instead (see `fyrd.run.split_ranges()`),
+    which only reads a line per job. Functions get a range string like
+    'path::start-end' as '{file}' and must open it with
+    `fyrd.run.open_zipped()` or `fyrd.run.open_range()`, which stream just
+    those bytes. In scripts, '{file}' becomes a bash process substitution
+    that streams the range, so the command must read the file once from
+    start to end. Compressed files cannot be split by bytes.
+
+    Files are split between lines by default. To keep multi-line records
+    together, pass one of the splitters in `fyrd.run.SPLITTERS` ('fastq' for
+    4 line FASTQ records, 'csv' for CSV with newlines in quoted fields, 'tsv'
+    and 'sam' for tables whose leading '#' or '@' lines are a header that
+    every job gets) or a `fyrd.run.LineSplitter` subclass. Splitters work in
+    both split modes.
+
+    If jobs is 'auto', the command is first run as a pilot job on the header
+    and first records of the file (pilot_size in the [split] config, at most
+    a twentieth of them). The time it takes sets the number of jobs, as in
+    `parapply()`. For scripts that time comes from the job start and end
+    times, which are only accurate to the second. With resume=True, a file
+    split by an earlier run is reused without a pilot.
+
+    If speculate is True, jobs on slow nodes are run again once most of the
+    others are done, as in `parapply()`. The copy writes its output file
+    next to the original's, with '.spec' added, and whichever finishes first
+    is used and the other killed.
+
+    Results are merged as they come in, in job order, so merging overlaps with
+    the jobs that are still running. Output files are appended to outfile
+    without being read into memory. With merge='reduce' only the running
+    merge_func result is kept rather than every output. With merge='sorted',
+    every job output must be sorted (by merge_key if given) and they are
+    merged into one sorted outfile or list once all jobs are done, holding
+    only one line or item per job in memory.
+
     Parameters
     ----------
-    jobs : int
-        Number of pieces to split the dataframe into
+    jobs : int or 'auto'
+        Number of pieces to split the file into, 'auto' to pick it with a
+        pilot job, see above.
     infile : str
         The path to the file to be split.
     inheader : bool
@@ -552,12 +1502,29 @@ def splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
     outfile : str
         The path to the expected output file.
     outheader : bool
-        Does the input outfile have a header?
+        Do the output files have a header? If so, it is kept only from the
+        first one.
     merge_func : function
         An optional function used to merge the output list if there is no
         outfile.
     direct : bool
         Whether to run the function directly or to return a Job. Default True.
+    resume : bool
+        Keep a manifest and the results of finished jobs so that a failed run
+        can be rerun without redoing them, see above. Default False.
+    split_mode : {'lines', 'bytes'}
+        Copy the input file into one file per job ('lines', the default) or
+        hand each job a byte range of it ('bytes'), see above.
+    splitter : str or fyrd.run.LineSplitter
+        How to find record boundaries, a name in `fyrd.run.SPLITTERS` or a
+        splitter, see above. Default 'lines'.
+    merge : {'concat', 'sorted', 'reduce'}
+        How to merge the outputs, see above. Default 'concat'.
+    merge_key : function
+        A sort key for merge='sorted', called on every line (including the
+        newline) of output files or every item of output lists.
+    speculate : bool
+        Run stragglers again, see above. Default False.
 
     *All other keywords are parsed into cluster keywords by the options
     system. For available keywords see `fyrd.option_help()` *
@@ -572,12 +1539,16 @@ def splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
         return _splitrun(
             jobs, infile, inheader, command, args=args, kwargs=kwargs,
             name=name, qtype=qtype, profile=profile, outfile=outfile,
-            outheader=outheader, merge_func=merge_func, **kwds
+            outheader=outheader, merge_func=merge_func, resume=resume,
+            split_mode=split_mode, splitter=splitter, merge=merge,
+            merge_key=merge_key, speculate=speculate, **kwds
         )
     else:
         kk = dict(
             args=args, kwargs=kwargs, name=name, qtype=qtype, profile=profile,
-            outfile=outfile, outheader=outheader, merge_func=merge_func
+            outfile=outfile, outheader=outheader, merge_func=merge_func,
+            resume=resume, split_mode=split_mode, splitter=splitter,
+            merge=merge, merge_key=merge_key, speculate=speculate
         )
         kwds = _options.sanitize_arguments(kwds)
         kk.update(_options.check_arguments(kwds))
@@ -593,19 +1564,30 @@ def splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
 
 def _splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
               name=None, qtype=None, profile=None, outfile=None,
-              outheader=False, merge_func=None, **kwds):
+              outheader=False, merge_func=None, resume=False,
+              split_mode='lines', splitter='lines', merge='concat',
+              merge_key=None, speculate=False, **kwds):
     """This is the direct running function for `splitrun()`.
 
     Please see that function's docstring for information and do not call this
     function directly.
     """
     # Handle arguments
-    if not isinstance(jobs, _int):
-        raise ValueError('Jobs argument must be an integer.')
+    if not isinstance(jobs, _int) and jobs != 'auto':
+        raise ValueError("Jobs argument must be an integer or 'auto'.")
     if profile is not None and not isinstance(profile, (_str, _txt)):
         raise ValueError('Profile must be a string, is {}'
                          .format(type(profile)))
+    if split_mode not in ('lines', 'bytes'):
+        raise ValueError("split_mode must be 'lines' or 'bytes', is {}"
+                         .format(split_mode))
+    if merge not in ('concat', 'sorted', 'reduce'):
+        raise ValueError("merge must be 'concat', 'sorted' or 'reduce', is {}"
+                         .format(merge))
+    if merge == 'reduce' and (outfile or not callable(merge_func)):
+        raise ValueError("merge='reduce' needs a merge_func and no outfile")
     kwds = _options.check_arguments(kwds)
+    splitter = _run.get_splitter(splitter)
 
     # Get name
     name = name if name else 'split_file'
@@ -629,19 +1611,8 @@ def _splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
         # Add all imports from the function file to globals
         kwds['imports'] = _run.export_imports(command, kwds)
 
-    # Split file
-    _logme.log('Splitting file', 'debug')
-    files = _run.split_file(infile, jobs, outpath=cpath, keep_header=inheader)
-    assert len(files) == jobs
-
-    # Run the functions
-    _logme.log('Submitting jobs', 'debug')
-    outs = []
-    count = 1
-    for f in files:
-        if outfile:
-            o = f + '.out'
-        nm = '{}_{}_of_{}'.format(name, count, jobs)
+    def submit(f, o, nm, timed=False):
+        """Submit command on split file f with output o, timed for pilots."""
         if callable(command):
             try:
                 runargs, runkwargs = _run.replace_argument(
@@ -652,52 +1623,166 @@ def _splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
             if outfile:
                 runargs, runkwargs = _run.replace_argument(
                     [runargs, runkwargs], '{outfile}', o)
-            outs.append(
-                _Job(command, args=runargs, kwargs=runkwargs, name=nm,
-                     qtype=qtype, profile=profile, **kwds).submit()
-            )
+            if timed:
+                # The node must import command, not only _timed
+                pkwds = kwds.copy()
+                pkwds['syspaths'] = _run.update_syspaths(command, kwds)
+                return _Job(_timed, (command, runargs, runkwargs), name=nm,
+                            qtype=qtype, profile=profile, **pkwds)
+            return _Job(command, args=runargs, kwargs=runkwargs, name=nm,
+                        qtype=qtype, profile=profile, **kwds).submit()
+        if split_mode == 'bytes' and _run.parse_range(f):
+            f = _run.range_command(f)
+        if outfile:
+            cmnd = command.format(file=f, outfile=o)
         else:
-            if outfile:
-                cmnd = command.format(file=f, outfile=o)
-            else:
-                cmnd = command.format(file=f)
-            outs.append(
-                _Job(cmnd, name=nm, qtype=qtype, profile=profile,
-                     **kwds).submit()
-            )
-        count += 1
+            cmnd = command.format(file=f)
+        job = _Job(cmnd, name=nm, qtype=qtype, profile=profile, **kwds)
+        return job if timed else job.submit()
+
+    # Reuse the split files of an earlier run if possible
+    manifest = None
+    if resume:
+        manifest_file = _os.path.join(cpath, '{0}.{1}.manifest'.format(
+            _os.path.basename(infile), name
+        ))
+        fingerprint = _split_fingerprint(
+            infile, jobs, inheader, command, args, kwargs, outfile, split_mode,
+            splitter.name
+        )
+        manifest = _read_manifest(manifest_file, fingerprint)
 
-    # Get the results
-    _logme.log('Waiting for results', 'debug')
-    results = []
-    for out in outs:
-        try:
-            results.append(out.get())
-        except IOError:
-            _logme.log('Result getting failed, most likely one of the child ' +
-                       'jobs crashed, check the error files', 'critical')
-            raise
+    if manifest:
+        files = tuple(manifest['files'])
+        jobs  = len(files)
+    else:
+        if jobs == 'auto':
+            jobs = _pilot_split(infile, cpath, name, inheader, splitter,
+                                submit, qtype)
+        if split_mode == 'bytes':
+            _logme.log('Splitting file into byte ranges', 'debug')
+            files = _run.split_ranges(infile, jobs, keep_header=inheader,
+                                      splitter=splitter)
+        else:
+            # Split file
+            _logme.log('Splitting file', 'debug')
+            files = _run.split_file(infile, jobs, outpath=cpath,
+                                    keep_header=inheader, splitter=splitter)
+    assert len(files) == jobs
 
-    # Delete intermediate files
-    _logme.log('Removing intermediate files', 'debug')
-    for f in files:
-        assert _os.path.isfile(f)
-        _os.remove(f)
+    # Byte ranges are not files, so outputs need their own names
+    if split_mode == 'bytes':
+        stems = [_os.path.join(cpath, '{0}.range_{1}'.format(
+            _os.path.basename(infile), str(i).zfill(4)
+        )) for i in range(1, jobs+1)]
+    else:
+        stems = list(files)
+
+    done = [False]*jobs
+    if manifest:
+        done = [_os.path.isfile(i + '.result') and
+                (not outfile or _os.path.isfile(i + '.out')) for i in stems]
+        _logme.log('Resuming {0}, {1} of {2} jobs are done'
+                   .format(name, sum(done), jobs), 'info')
+    elif resume:
+        for stem in stems:
+            _serialize.remove(stem + '.result')
+        _write_manifest(manifest_file, fingerprint, files)
 
-    # Return the recombined DataFrame
+    # Run the functions
+    _logme.log('Submitting jobs', 'debug')
+    names = ['{}_{}_of_{}'.format(name, i, jobs) for i in range(1, jobs+1)]
+    outs  = [None if complete else submit(f, stem + '.out', nm)
+             for f, stem, nm, complete in zip(files, stems, names, done)]
+
+    def duplicate(index):
+        """Submit a straggler again, writing to its own output file."""
+        return submit(files[index], stems[index] + '.out.spec',
+                      names[index] + '.spec')
+
+    # Get the results, merging each one as it comes in
+    _logme.log('Waiting for results', 'debug')
+    fout    = None
+    if outfile and merge == 'concat':
+        fout = open(outfile, 'wb')
+    results = []
+    errors  = []
+    merged  = None
+    reduced = False
+    gathered = _gather(outs, duplicate=duplicate if speculate else None)
+    for stem, out, finished in zip(stems, outs, gathered):
+        if finished[0] is not out:
+            # The copy won, its output replaces the original's
+            out = finished[0]
+            if outfile and _os.path.isfile(stem + '.out.spec'):
+                _os.rename(stem + '.out.spec', stem + '.out')
+        if out is None:
+            result = _serialize.load(stem + '.result')
+        else:
+            try:
+                result = out.get()
+            except Exception as err:
+                if not resume:
+                    _logme.log('Result getting failed, most likely one of '
+                               'the child jobs crashed, check the error '
+                               'files', 'critical')
+                    if fout:
+                        fout.close()
+                        _os.remove(outfile)
+                    raise
+                # Let the other jobs finish so that their results are saved
+                _logme.log('Job {0} failed: {1}'.format(out.name, err),
+                           'error')
+                out.clean(delete_outputs=False)
+                errors.append(err)
+                continue
+            if resume:
+                # Written under a temporary name, so existing results are
+                # complete
+                _serialize.dump(result, stem + '.result.tmp')
+                _os.rename(stem + '.result.tmp', stem + '.result')
+        if errors:
+            # Nothing will be returned, just collect the other results
+            continue
+        if fout:
+            # Only the first output keeps its header
+            _run.append_file(fout, stem + '.out',
+                             1 if outheader and fout.tell() else 0)
+        elif outfile:
+            pass
+        elif merge == 'reduce':
+            merged  = merge_func(merged, result) if reduced else result
+            reduced = True
+        else:
+            results.append(result)
+    if fout:
+        fout.close()
+    if errors:
+        if fout:
+            _os.remove(outfile)
+        _logme.log('{0} of {1} jobs failed, rerun with resume=True to run '
+                   'only those again'.format(len(errors), jobs), 'critical')
+        raise errors[0]
+
+    # Return the recombined output
     _logme.log('Done, joining', 'debug')
     if outfile:
-        with open(outfile, 'w') as fout:
-            if outheader:
-                with open(files[0]) as fin:
-                    fout.write(fin.readline())
-            for f in files:
-                with open(f + '.out') as fin:
-                    if outheader:
-                        fin.readline()
-                    fout.write(fin.read())
+        if merge == 'sorted':
+            with open(outfile, 'w') as fout:
+                if outheader:
+                    with open(stems[0] + '.out') as fin:
+                        fout.write(fin.readline())
+                _run.merge_sorted([i + '.out' for i in stems], fout,
+                                  key=merge_key,
+                                  skip_lines=1 if outheader else 0)
         out = _os.path.abspath(outfile)
 
+    elif merge == 'reduce':
+        out = merged
+
+    elif merge == 'sorted':
+        out = list(_heapq.merge(*results, key=merge_key))
+
     elif merge_func:
         assert callable(merge_func)
         out = merge_func(results)
@@ -708,14 +1793,528 @@ def _splitrun(jobs, infile, inheader, command, args=None, kwargs=None,
     else:
         out = results
 
+    # Delete intermediate files
+    _logme.log('Removing intermediate files', 'debug')
+    for f, stem in zip(files, stems):
+        if split_mode != 'bytes':
+            assert _os.path.isfile(f)
+            _os.remove(f)
+        for path in [stem + '.out', stem + '.out.spec']:
+            if outfile and _os.path.isfile(path):
+                _os.remove(path)
+        if resume:
+            _serialize.remove(stem + '.result')
+    if resume:
+        _os.remove(manifest_file)
+
     return out
 
 
+###############################################################################
+#                                 Map Reduce                                  #
+###############################################################################
+
+
+def mapreduce(inputs, mapper, reducer, partitions=None, combiner=None,
+              name=None, qtype=None, profile=None, imports=None, **kwds):
+    """Run mapper on every input and reducer on all the values of each key.
+
+    A mapper job is submitted for every item in inputs. Each calls
+    mapper(item), which must return or yield (key, value) pairs, and spills
+    the values grouped by key into one file per partition in the script path.
+    Keys are assigned to partitions by a hash of the key (of the bytes of str
+    and bytes keys, or their repr otherwise), so keys must have the same repr
+    in every job (str, numbers and tuples of them do).
+
+    A reducer job is submitted for every partition, depending on all of the
+    mapper jobs, so the whole map and reduce is one set of scheduled jobs with
+    nothing waiting on the client. Each reads the spill files of its partition
+    and calls reducer(key, values) on every key in it, with the list of all of
+    the values of that key from every mapper.
+
+    If combiner is given, mappers call combiner(key, values) on their own
+    values of each key before spilling them, and the reducer gets a list of
+    the combiner results. This makes the spill files much smaller for
+    associative reductions like sums and counts, where combiner can simply be
+    the reducer.
+
+    Accepts exactly the same arguments as the Job class, except for those
+    above. If the 'clean_files' and 'clean_outputs' arguments are not passed,
+    we delete all intermediate files and output files by default.
+
+    Parameters
+    ----------
+    inputs : list
+        The items to map, e.g. file names, one mapper job is run on each.
+    mapper : function
+        mapper(item) returns (key, value) pairs.
+    reducer : function
+        reducer(key, values) returns the result for key.
+    partitions : int, optional
+        The number of reducer jobs, defaults to one per input.
+    combiner : function, optional
+        combiner(key, values) pre-reduces the values of each mapper job.
+    name : str, optional
+        A prefix for the job names, default 'mapreduce'.
+    qtype : str, optional
+        Override the queue type
+    profile : str, optional
+        A fyrd cluster profile to use
+    imports : list, optional
+        A list of imports for the jobs
+
+    Returns
+    -------
+    generator
+        Yields a (key, result) tuple for every key, in key order within each
+        partition. Partitions are yielded as their reducer jobs finish, in
+        partition order, so results stream in while later reducers are still
+        running. The jobs are all submitted before this function returns.
+        Reducer jobs delete the spill files they read, if a job fails the
+        rest are deleted when the error is raised.
+
+    Examples
+    --------
+    >>> def words(path):
+    ...     with open(path) as fin:
+    ...         for line in fin:
+    ...             for word in line.split():
+    ...                 yield word, 1
+    >>> def add(key, values):
+    ...     return sum(values)
+    >>> counts = dict(fyrd.mapreduce(
+    ...     ['a.txt', 'b.txt'], words, add, partitions=4, combiner=add
+    ... ))
+    """
+    inputs = _run.listify(inputs)
+    if not inputs:
+        raise ValueError('No inputs to map')
+    for function in [mapper, reducer] + ([combiner] if combiner else []):
+        if not callable(function):
+            raise ValueError('{0} is not callable'.format(function))
+    partitions = len(inputs) if partitions is None else partitions
+    if not isinstance(partitions, _int) or partitions < 1:
+        raise ValueError('partitions must be a positive integer, is {0}'
+                         .format(partitions))
+    if profile is not None and not isinstance(profile, (_str, _txt)):
+        raise ValueError('Profile must be a string, is {}'
+                         .format(type(profile)))
+    kwds = _options.check_arguments(kwds)
+    name = name if name else 'mapreduce'
+
+    # Set up auto-cleaning
+    if 'clean_files' not in kwds:
+        kwds['clean_files'] = True
+    if 'clean_outputs' not in kwds:
+        kwds['clean_outputs'] = True
+
+    # Spills go next to the job scripts, paths are popped so use a copy, and
+    # every call gets its own files as results are yielded lazily
+    cpath = _conf.get_job_paths(dict(kwds))[3]
+    base  = _os.path.join(cpath, '{0}.{1}.{2}'.format(
+        name, _os.getpid(), _uuid().hex[:8]
+    ))
+    stems = ['{0}.map_{1}'.format(base, i) for i in range(len(inputs))]
+    spills = [['{0}.part_{1}'.format(stem, i) for stem in stems]
+              for i in range(partitions)]
+
+    _logme.log('Submitting {0} mapper and {1} reducer jobs'
+               .format(len(inputs), partitions), 'debug')
+    mappers  = []
+    reducers = []
+    try:
+        syspaths = _run.update_syspaths(mapper, kwds)
+        if combiner:
+            syspaths += _run.update_syspaths(combiner)
+        for count, (item, stem) in enumerate(zip(inputs, stems), 1):
+            mappers.append(_Job(
+                _run_mapper, (item, mapper, stem, partitions, combiner),
+                profile=profile, name='{0}_map_{1}_of_{2}'.format(
+                    name, count, len(inputs)
+                ), qtype=qtype, imports=imports,
+                **dict(kwds, syspaths=syspaths)
+            ).submit())
+        syspaths = _run.update_syspaths(reducer, kwds)
+        for count, files in enumerate(spills, 1):
+            reducers.append(_Job(
+                _run_reduce, (files, reducer),
+                profile=profile, name='{0}_reduce_{1}_of_{2}'.format(
+                    name, count, partitions
+                ), qtype=qtype, imports=imports, depends=mappers,
+                **dict(kwds, syspaths=syspaths)
+            ).submit())
+    except Exception:
+        for job in mappers + reducers:
+            if job.submitted:
+                _kill(job)
+        _remove_spills(spills)
+        raise
+
+    return _stream_reduced(mappers, reducers, spills)
+
+
+def _stream_reduced(mappers, reducers, spills):
+    """Yield the results of the reducer jobs, see `mapreduce()`."""
+    try:
+        # Reducers cannot run if a mapper failed, so raise that error first
+        for job in mappers + reducers:
+            if not job.submitted:
+                raise _ClusterError('Job {0} could not be submitted'
+                                    .format(job.name))
+        for job in mappers:
+            job.get()
+            if job.state not in _batch.GOOD_STATES:
+                raise _ClusterError('Job {0} failed, check its error file'
+                                    .format(job.name))
+        for job in reducers:
+            out = job.get()
+            if job.state not in _batch.GOOD_STATES:
+                raise _ClusterError('Job {0} failed, check its error file'
+                                    .format(job.name))
+            for result in out:
+                yield result
+    except Exception:
+        _logme.log('Result getting failed, most likely one of the child '
+                   'jobs crashed, check the error files', 'critical')
+        for job in mappers + reducers:
+            if job.submitted:
+                _kill(job)
+        raise
+    finally:
+        _remove_spills(spills)
+
+
+def _run_mapper(item, mapper, stem, partitions, combiner=None):
+    """Run mapper on item and write a spill file per partition.
+
+    The spill files are stem.part_<partition>, each holds a dictionary of the
+    keys in that partition and a list of their values.
+
+    Returns
+    -------
+    list
+        The number of keys in each partition.
+    """
+    groups = [{} for _ in range(partitions)]
+    for key, value in mapper(item):
+        groups[_partition(key, partitions)].setdefault(key, []).append(value)
+    for count, group in enumerate(groups):
+        if combiner:
+            group = {k: [combiner(k, v)] for k, v in group.items()}
+        _serialize.dump(group, '{0}.part_{1}'.format(stem, count))
+    return [len(group) for group in groups]
+
+
+def _run_reduce(spills, reducer):
+    """Merge the spill files of a partition and reduce every key.
+
+    The spill files are deleted once every key is reduced.
+
+    Returns
+    -------
+    list
+        (key, result) tuples, sorted by key if the keys can be sorted.
+    """
+    groups = {}
+    for spill in spills:
+        for key, values in _serialize.load(spill).items():
+            groups.setdefault(key, []).extend(values)
+    try:
+        keys = sorted(groups)
+    except TypeError:
+        keys = list(groups)
+    out = [(key, reducer(key, groups[key])) for key in keys]
+    _remove_spills([spills])
+    return out
+
+
+def _partition(key, partitions):
+    """Return the partition of key, the same in every process."""
+    if isinstance(key, bytes):
+        data = key
+    elif isinstance(key, (_str, _txt)):
+        data = key.encode('utf-8')
+    else:
+        data = repr(key).encode('utf-8')
+    return int(_hashlib.md5(data).hexdigest()[:8], 16) % partitions
+
+
+def _remove_spills(spills):
+    """Delete the spill files in a list of lists of spill files."""
+    for files in spills:
+        for spill in files:
+            if _os.path.isfile(spill):
+                _serialize.remove(spill)
+
+
 ###############################################################################
 #                              Helper Functions                               #
 ###############################################################################
 
 
+def _split_fingerprint(infile, jobs, inheader, command, args, kwargs,
+                       outfile, split_mode, splitter):
+    """Return a dictionary that changes if a splitrun must start over."""
+    stat = _os.stat(infile)
+    if callable(command):
+        command = _cache.make_key(command, args, kwargs)
+    else:
+        command = _hashlib.sha256(command.encode()).hexdigest()
+    return {'infile': infile, 'size': stat.st_size, 'mtime': stat.st_mtime,
+            'jobs': jobs, 'inheader': bool(inheader), 'command': command,
+            'outfile': bool(outfile), 'split_mode': split_mode,
+            'splitter': splitter}
+
+
+def _read_manifest(manifest_file, fingerprint):
+    """Return a splitrun manifest if it matches fingerprint, else None."""
+    if not _os.path.isfile(manifest_file):
+        return None
+    with open(manifest_file) as fin:
+        manifest = _json.load(fin)
+    if manifest['fingerprint'] != fingerprint:
+        _logme.log('{0} is from a different run, splitting again'
+                   .format(manifest_file), 'info')
+        return None
+    for split, size in zip(manifest['files'], manifest['sizes']):
+        if size is None:
+            continue
+        if not _os.path.isfile(split) or _os.path.getsize(split) != size:
+            _logme.log('{0} is missing or changed, splitting again'
+                       .format(split), 'info')
+            return None
+    return manifest
+
+
+def _write_manifest(manifest_file, fingerprint, files):
+    """Write a splitrun manifest for the split files."""
+    with open(manifest_file + '.tmp', 'w') as fout:
+        _json.dump({'fingerprint': fingerprint, 'files': list(files),
+                    'sizes': [None if _run.parse_range(i)
+                              else _os.path.getsize(i) for i in files]},
+                   fout)
+    _os.rename(manifest_file + '.tmp', manifest_file)
+
+
+def _pilot_split(infile, cpath, name, inheader, splitter, submit, qtype):
+    """Time a splitrun command on the start of infile, return a job count."""
+    header = _run.read_header(infile, inheader, splitter)
+    count  = splitter.count(infile, header)
+    pilot  = _os.path.join(cpath, '{0}.pilot.{1}'.format(
+        _os.path.basename(infile), infile.split('.')[-1]
+    ))
+    try:
+        pilot_count = _run.head_file(infile, pilot, _pilot_size(count),
+                                     inheader, splitter)
+        runtime, overhead = _run_pilot(
+            submit(pilot, pilot + '.out', '{0}_pilot'.format(name), True)
+        )[1:]
+    finally:
+        for fl in [pilot, pilot + '.out']:
+            if _os.path.isfile(fl):
+                _os.remove(fl)
+    return max(_choose_jobs(runtime, overhead, pilot_count, count, qtype), 1)
+
+
+def _timed(function, args=(), kwargs=None):
+    """Return [seconds taken, output] of function(*args, **kwargs).
+
+    Runs in pilot jobs, so the time does not include job overhead. A list, not
+    a tuple, as job scripts take tuple outputs to be exceptions.
+    """
+    start = _time.time()
+    out = function(*args, **(kwargs if kwargs else {}))
+    return [_time.time() - start, out]
+
+
+def _run_pilot(job):
+    """Submit a pilot job and return its output, runtime and overhead.
+
+    job must run `_timed()` unless it is a script, script runtimes come from
+    the job start and end times, to the second.
+
+    Returns
+    -------
+    output : any
+    runtime : float
+        Seconds the work took on the node.
+    overhead : float
+        Seconds from submission to getting the output that were not work.
+    """
+    _logme.log('Submitting pilot job {0}'.format(job.name), 'debug')
+    start = _time.time()
+    out = job.submit().get()
+    took = _time.time() - start
+    if job.kind == 'script':
+        runtime = job.runtime
+        runtime = runtime.total_seconds() if runtime is not None else took
+    else:
+        runtime, out = out
+    return out, runtime, max(took - runtime, 0.0)
+
+
+def _free_slots(qtype=None):
+    """Return how many more jobs the queue of qtype will run at once."""
+    qtype = qtype if qtype else _batch.get_cluster_environment()
+    queue = _Queue(user='self', qtype=qtype)
+    limit = queue.max_jobs
+    if qtype in ('local', 'inline'):
+        cmax = _conf.get_option(qtype, 'max_jobs')
+        limit = min(limit, int(cmax) if cmax else _mp.cpu_count())
+    return max(limit - queue.active_job_count, 1)
+
+
+def _pilot_size(count):
+    """Return how many of count rows or records go in a pilot job."""
+    size = int(_conf.get_option('split', 'pilot_size'))
+    return max(1, min(size, count//20))
+
+
+def _choose_jobs(runtime, overhead, pilot_count, count, qtype=None):
+    """Pick a job count from a pilot job.
+
+    Enough jobs to keep each one under the target_runtime in the [split]
+    config. If the queue has more free slots than that, use them too as long
+    as every job still does more work than its overhead.
+
+    Parameters
+    ----------
+    runtime : float
+        Seconds the pilot job took for pilot_count rows or records.
+    overhead : float
+        Seconds of submission and output overhead in the pilot job.
+    pilot_count : int
+    count : int
+        Rows or records left to do.
+    qtype : str, optional
+
+    Returns
+    -------
+    jobs : int
+    """
+    if not count:
+        return 0
+    work   = float(runtime)/max(pilot_count, 1)*count
+    target = float(_conf.get_option('split', 'target_runtime'))
+    jobs   = int(_math.ceil(work/target))
+    free   = _free_slots(qtype)
+    if free > jobs:
+        jobs = max(jobs, min(free, int(work/max(overhead, 1.0))))
+    cap = _conf.get_option('split', 'max_jobs')
+    if cap:
+        jobs = min(jobs, int(cap))
+    jobs = max(1, min(jobs, count))
+    _logme.log('Pilot took {0:.2f}s for {1} of {2}, {3:.2f}s overhead, {4} '
+               'free slots, using {5} jobs'.format(
+                   runtime, pilot_count, count, overhead, free, jobs
+               ), 'info')
+    return jobs
+
+
+def _gather(outs, resplit=None, expected=None, duplicate=None):
+    """Yield a list of the finished jobs doing the work of each job in outs.
+
+    Lists are yielded in the order of outs, call `get()` on the jobs for the
+    results. Entries of outs that are None are yielded as [None].
+
+    If resplit is given, stragglers are split further. A job that has been
+    running for longer than straggler_factor (in the [split] config) times
+    expected seconds, or times the median runtime of the finished jobs if
+    expected is None and half of them are done, is passed to resplit(index).
+    That submits smaller jobs doing the same work and returns them, or None.
+    Whichever finishes first, the original job or all of the new ones, is
+    yielded and the others are killed.
+
+    If duplicate is given, stragglers are run again. Once speculate_after (in
+    the [split] config) of the jobs are done, a job that has been running for
+    longer than speculate_factor times their median runtime is passed to
+    duplicate(index), which submits a copy of it and returns it, or None. The
+    first of the two to complete is yielded and the other is killed. If one
+    fails, the other still gets to finish.
+    """
+    if not resplit and not duplicate:
+        for job in outs:
+            yield [job]
+        return
+    factor    = float(_conf.get_option('split', 'straggler_factor'))
+    after     = float(_conf.get_option('split', 'speculate_after'))
+    spec      = float(_conf.get_option('split', 'speculate_factor'))
+    sleep_len = float(_conf.get_option('queue', 'sleep_len'))
+    started   = {}
+    durations = []
+    parts     = {}
+    copies    = {}
+    done      = {}
+
+    def finish(index, winners, losers):
+        """Kill the losers and keep the winners for index."""
+        for loser in losers:
+            if loser is not None:
+                _kill(loser)
+        done[index] = winners
+
+    for index in range(len(outs)):
+        while index not in done:
+            now = _time.time()
+            median = sorted(durations)[len(durations)//2] if durations \
+                else None
+            limit = expected
+            if limit is None and len(durations) >= len(outs)/2.:
+                limit = median
+            if len(durations) < after*len(outs):
+                median = None
+            for i in range(index, len(outs)):
+                if i in done:
+                    continue
+                job = outs[i]
+                if job is None:
+                    done[i] = [None]
+                    continue
+                copy  = copies.get(i)
+                split = parts.get(i, [])
+                good  = [j for j in [job, copy] if j is not None and j.done
+                         and j.state in _batch.GOOD_STATES]
+                if good:
+                    if good[0] is job:
+                        if i in started:
+                            durations.append(now - started[i])
+                    else:
+                        _logme.log('Copy of {0} finished first'
+                                   .format(job.name), 'info')
+                    finish(i, good[:1], [j for j in [job, copy]
+                                         if j is not good[0]] + split)
+                elif split and all([p.done for p in split]):
+                    _logme.log('Split parts of {0} finished first'
+                               .format(job.name), 'info')
+                    finish(i, split, [job, copy])
+                elif job.done and (copy is None or copy.done):
+                    # Failed, get() will raise the error
+                    finish(i, [job], split)
+                elif job.state == 'running':
+                    started.setdefault(i, now)
+                    took = now - started[i]
+                    if (resplit and i not in parts and limit is not None
+                            and took > factor*limit):
+                        _logme.log('{0} has run for {1:.0f}s, splitting it'
+                                   .format(job.name, took), 'info')
+                        parts[i] = resplit(i) or []
+                    if (duplicate and i not in copies and median is not None
+                            and took > spec*median):
+                        _logme.log('{0} has run for {1:.0f}s, running it '
+                                   'again'.format(job.name, took), 'info')
+                        copies[i] = duplicate(i)
+            if index not in done:
+                _time.sleep(sleep_len)
+        yield done.pop(index)
+
+
+def _kill(job):
+    """Kill job if it is still running and delete its files."""
+    if not job.done:
+        job.kill(confirm=False)
+    job.clean(delete_outputs=True, get_outputs=False)
+
+
 def _wrap_runner(command, *args, **kkk):
     """Run a command as a job, for use with the functions in this file.
 
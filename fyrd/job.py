@@ -11,8 +11,6 @@ from time import sleep as _sleep
 from datetime import datetime as _dt
 from traceback import print_tb as _tb
 
-# Try to use dill, revert to pickle if not found
-import dill as _pickle
 from six import reraise as _reraise
 from six import text_type as _txt
 from six import string_types as _str
@@ -26,6 +24,8 @@ from . import run     as _run
 from . import conf    as _conf
 from . import queue   as _queue
 from . import logme   as _logme
+from . import cache as _cache
+from . import serialize as _serialize
 from . import script_runners as _scrpts
 from . import batch_systems  as _batch
 from . import ClusterError   as _ClusterError
@@ -34,6 +34,9 @@ _options = _batch.options
 
 __all__ = ['Job']
 
+# Stale shared memory buffers are cleaned once per process
+_SHM_CLEANED = False
+
 ###############################################################################
 #                                The Job Class                                #
 ###############################################################################
@@ -202,6 +205,11 @@ class Job(object):
     # Pickled output file for functions
     poutfile      = None
 
+    # Result cache, cached is True if the output came from the cache
+    use_cache     = False
+    cached        = False
+    _cache_key    = None
+
     # Holds queue information in torque and slurm
     queue_info    = None
 
@@ -533,6 +541,30 @@ class Job(object):
         # Get syspaths
         syspaths = kwds.pop('syspaths') if 'syspaths' in kwds else None
 
+        # Get the function serializer
+        serializer = kwds.pop('serializer') if 'serializer' in kwds \
+                     else _conf.get_option('jobs', 'serializer')
+        if serializer and serializer not in _serialize.SERIALIZERS:
+            raise _ClusterError(
+                'Serializer {0} is not available, use one of {1}'
+                .format(serializer, list(_serialize.SERIALIZERS))
+            )
+        compression = _conf.get_option('jobs', 'compression')
+        try:
+            _serialize.get_codec(compression)
+        except ValueError as err:
+            raise _ClusterError(str(err))
+        blob_dir = _os.path.join(
+            self.scriptpath, _serialize.BLOB_DIR
+        ) if _conf.get_option('jobs', 'dedup') else None
+
+        # Check the result cache before submitting
+        use_cache = kwds.pop('cache') if 'cache' in kwds else None
+        self.use_cache = bool(
+            use_cache if use_cache is not None
+            else _conf.get_option('cache', 'enabled')
+        )
+
         # Split out sys.paths from imports and set imports in self
         if imports:
             self.imports = []
@@ -551,10 +583,13 @@ class Job(object):
                 self.scriptpath, '{}_func.{}.py'.format(name, self.suffix)
                 )
             self.poutfile = self.outfile + '.func.pickle'
+            in_buffer_dir, out_buffer_dir = self._buffer_dirs()
             self.function = _Function(
                 file_name=script_file, function=command, args=args,
                 kwargs=kwargs, imports=self.imports, syspaths=syspaths,
-                outfile=self.poutfile
+                outfile=self.poutfile, in_buffer_dir=in_buffer_dir,
+                out_buffer_dir=out_buffer_dir, serializer=serializer,
+                compression=compression, blob_dir=blob_dir
             )
             # Collapse the _command into a python call to the function script
             executable = '#!/usr/bin/env python{}'.format(
@@ -643,6 +678,12 @@ class Job(object):
             _logme.log('Not submitting, already submitted.', 'warn')
             return self
 
+        if not self.scripts_ready:
+            self.gen_scripts()
+
+        if self._get_cached():
+            return self
+
         if not self.written:
             self.write()
 
@@ -651,6 +692,10 @@ class Job(object):
         if self.dependencies:
             for depend in self.dependencies:
                 if isinstance(depend, Job):
+                    if depend.cached:
+                        _logme.log('Dependency {} is cached, skipping'
+                                   .format(depend.name), 'debug')
+                        continue
                     if not depend.id:
                         _logme.log(
                             'Cannot submit job as dependency {} '
@@ -778,6 +823,7 @@ class Job(object):
             ):
                 return self
         self.batch.kill(self.id)
+        self._remove_shm_buffers()
         return self
 
     def clean(self, delete_outputs=None, get_outputs=True):
@@ -809,9 +855,25 @@ class Job(object):
             for f in self.outfiles:
                 if _os.path.isfile(f):
                     _logme.log('Deleteing {}'.format(f), 'debug')
-                    _os.remove(f)
+                    _serialize.remove(f)
+            self._remove_shm_buffers()
         return self
 
+    def _remove_shm_buffers(self):
+        """Delete any output buffers of this job in shared memory.
+
+        Catches buffers from failed or killed runners that never wrote the
+        output pickle that lists them.
+        """
+        if not self.poutfile:
+            return
+        for path in _serialize.shm_buffers(self.poutfile):
+            _logme.log('Deleting {}'.format(path), 'debug')
+            try:
+                _os.remove(path)
+            except OSError:  # Gone already
+                pass
+
     def scrub(self, confirm=True):
         """Clean everything and reset to an unrun state.
 
@@ -853,6 +915,8 @@ class Job(object):
         self._found_files  = False
         self.start         = None
         self.end           = None
+        self.cached        = False
+        self._cache_key    = None
         return self.update()
 
     ######################
@@ -988,23 +1052,23 @@ class Job(object):
             except IOError:
                 _logme.log(msg + ' and files could not be found, job must '
                            'have failed', 'error')
+                self._remove_shm_buffers()
                 if raise_on_error:
                     raise
                 return
-            if status != 'disappeared':
+            # Function jobs that raised exit non-zero, get their exception
+            if status != 'disappeared' and not (
+                    self.kind == 'function' and _os.path.isfile(self.poutfile)
+                    or self._got_out):
+                self._remove_shm_buffers()
                 return
         else:
             # Get output
             _logme.log('Wait complete, fetching outputs', 'debug')
             self.fetch_outputs(save=save, delete_files=False)
-        out = self.out if save else self.get_output(save=save, update=False)
-        if isinstance(out, tuple) and issubclass(out[0], Exception):
-            if raise_on_error:
-                _reraise(*out)
-            else:
-                _logme.log('Job failed with exception {}'.format(out))
-                print(_tb(out[2]))
-                return out
+        out = self.out if save else self.get_output(
+            save=save, update=False, raise_on_error=False
+        )
         # Cleanup
         if cleanup is None:
             cleanup = self.clean_files
@@ -1014,6 +1078,19 @@ class Job(object):
             delete_outfiles = self.clean_outputs
         if save is False:
             delete_outfiles = del_no_save if del_no_save is not None else False
+        if _run.is_exc(out):
+            self._remove_shm_buffers()
+            if cleanup:
+                self.clean(delete_outputs=delete_outfiles)
+            if raise_on_error:
+                _reraise(*out)
+            _logme.log('Job failed with exception {}'.format(out))
+            print(_tb(out[2]))
+            return out
+        if status is not True and status != 'disappeared':
+            # Failed without an exception, e.g. killed
+            self._remove_shm_buffers()
+            return
         if cleanup:
             self.clean(delete_outputs=delete_outfiles)
         return out
@@ -1068,15 +1145,23 @@ class Job(object):
             return None
         _logme.log('Getting output from {}'.format(self.poutfile), 'debug')
         if _os.path.isfile(self.poutfile):
-            with open(self.poutfile, 'rb') as fin:
-                out = _pickle.load(fin)
-            if delete_file is True or self.clean_files is True:
+            delete = delete_file is True or self.clean_files is True
+            # Mapped buffers outlive their files, so unlink them right away
+            out = _serialize.load(self.poutfile, delete_buffers=delete)
+            if delete:
                 _logme.log('Deleting {}'.format(self.poutfile),
                            'debug')
-                _os.remove(self.poutfile)
+                _serialize.remove(self.poutfile)
             if save:
                 self._out = out
                 self._got_out = True
+            if self._cache_key and not _run.is_exc(out):
+                try:
+                    _cache.get_cache().put(self._cache_key, out)
+                except Exception as err:
+                    _logme.log('Could not cache the output of {}: {}'
+                               .format(self.name, err), 'warn')
+                self._cache_key = None
             if _run.is_exc(out):
                 _logme.log('{} failed with exception {}'.format(self, out[1]),
                            'error')
@@ -1359,7 +1444,8 @@ class Job(object):
         if not self._got_times:
             self.get_times(update=False)
         if save:
-            self.get_output(save=True, delete_file=delete_files, update=False)
+            self.get_output(save=True, delete_file=delete_files, update=False,
+                            raise_on_error=False)
             self.get_stdout(save=True, delete_file=delete_files, update=False)
             self.get_stderr(save=True, delete_file=delete_files, update=False)
 
@@ -1525,6 +1611,79 @@ class Job(object):
         self._found_files = True
         return True
 
+    def _get_cached(self):
+        """Complete self from the result cache if possible.
+
+        Sets self._cache_key so that get_output() can cache the result.
+
+        Returns
+        -------
+        found : bool
+        """
+        if self.kind != 'function' or not self.use_cache:
+            return False
+        try:
+            self._cache_key = _cache.make_key(
+                self.command, self.args, self.kwargs
+            )
+            found, out = _cache.get_cache().get(self._cache_key)
+        except Exception as err:
+            _logme.log('Cannot use the result cache for {}: {}'
+                       .format(self.name, err), 'warn')
+            self._cache_key = None
+            return False
+        if not found:
+            _logme.log('{} is not cached'.format(self.name), 'debug')
+            return False
+        _logme.log('Using cached result for {}'.format(self.name), 'info')
+        self._cache_key    = None
+        self.cached        = True
+        self.submitted     = True
+        self.submit_time   = _dt.now()
+        self.start         = self.end = self.submit_time
+        self.state         = 'completed'
+        self._out          = out
+        self._stdout       = ''
+        self._stderr       = ''
+        self._exitcode     = 0
+        self._got_out      = True
+        self._got_stdout   = True
+        self._got_stderr   = True
+        self._got_exitcode = True
+        self._got_times    = True
+        self._found_files  = True
+        return True
+
+    def _buffer_dirs(self):
+        """Return the directories for out-of-band function buffers.
+
+        If out_of_band is set, large arguments and outputs are written as
+        memory mappable sidecar files next to the pickle files. If
+        result_transport is 'shm' and the job runs on this machine, outputs go
+        to a tmpfs instead.
+
+        Returns
+        -------
+        in_buffer_dir : str or None
+        out_buffer_dir : str or None
+        """
+        in_dir = out_dir = None
+        if _conf.get_option('jobs', 'out_of_band'):
+            in_dir = self.scriptpath
+            out_dir = _os.path.dirname(_os.path.abspath(self.poutfile))
+        if _conf.get_option('jobs', 'result_transport') != 'shm':
+            return in_dir, out_dir
+        if self.qtype not in ('local', 'inline'):
+            _logme.log('shm result transport only works for local jobs, '
+                       'using files', 'debug')
+            return in_dir, out_dir
+        shm_dir = _serialize.shm_dir()
+        if not shm_dir:
+            _logme.log('No shared memory filesystem, using files', 'debug')
+            return in_dir, out_dir
+        _clean_shm()
+        return in_dir, shm_dir
+
     def _update_name(self, name=None):
         """Make sure the job name is unique.
 
@@ -1600,3 +1759,18 @@ class Job(object):
                 return int(id)
         _logme.log('No ID yet.', 'error')
         return 0
+
+
+def _clean_shm():
+    """Delete shared memory buffers older than shm_max_age, once."""
+    global _SHM_CLEANED
+    if _SHM_CLEANED:
+        return
+    _SHM_CLEANED = True
+    max_age = _conf.get_option('jobs', 'shm_max_age')
+    if not max_age:
+        return
+    deleted = _serialize.clean_shm(float(max_age)*60*60)
+    if deleted:
+        _logme.log('Deleted {0} stale shared memory buffers'
+                   .format(len(deleted)), 'debug')
@@ -176,6 +176,9 @@ class Queue(object):
 
         self.last_update = None
 
+        # Token for batch systems that can provide only changed jobs
+        self._change_token = None
+
     ####################
     #  Public Methods  #
     ####################
@@ -256,6 +259,9 @@ class Queue(object):
 
         check_jobs = []
         for job in jobs:
+            if isinstance(job, self._Job) and job.cached:
+                # Completed from the result cache, never queued
+                continue
             if isinstance(job, (self._Job, QueueJob)):
                 job_id = job.id
             else:
@@ -606,6 +612,10 @@ class Queue(object):
         """Refresh the list of jobs from the server.
 
         This is the core queue interaction function of this class.
+
+        If the batch system defines `queue_changes()`, only the jobs that
+        changed since the last update are parsed, all others are left as
+        they are in the cache.
         """
         if self._updating:
             return
@@ -613,11 +623,20 @@ class Queue(object):
         # Set the update time I don't care about microseconds
         self.last_update = int(_time())
 
-        jobs = []  # list of jobs created this session
+        if hasattr(self.batch_system, 'queue_changes'):
+            self._change_token, full, removed, parsed = \
+                self.batch_system.queue_changes(
+                    self._change_token, self.user, self.partition
+                )
+        else:
+            full    = True
+            removed = []
+            parsed  = self.batch_system.queue_parser(self.user, self.partition)
+
+        jobs = set()  # set of jobs seen this session
         for [job_id, array_id, job_name, job_user, job_partition,
              job_state, job_nodelist, job_nodecount,
-             job_cpus, job_exitcode] in self.batch_system.queue_parser(
-                 self.user, self.partition):
+             job_cpus, job_exitcode] in parsed:
             job_id = str(job_id)
             job_state = job_state.lower()
             if job_nodecount and job_cpus:
@@ -664,14 +683,17 @@ class Queue(object):
 
             # Assign the job to self.
             self.jobs[job_id] = job
-            jobs.append(str(job_id))
+            jobs.add(str(job_id))
 
         # We assume that if a job just disappeared it completed
-        if self.jobs:
-            for qjob in self.jobs.values():
-                if str(qjob.id) not in jobs:
-                    qjob.state = 'completed'
-                    qjob.disappeared = True
+        if full:
+            gone = [i for i in self.jobs if i not in jobs]
+        else:
+            gone = [str(i) for i in removed if str(i) in self.jobs]
+        for job_id in gone:
+            qjob = self.jobs[job_id]
+            qjob.state = 'completed'
+            qjob.disappeared = True
 
     def __getattr__(self, key):
         """Make running and queued attributes dynamic."""
@@ -10,11 +10,20 @@ These functions are not intended to be accessed directly and so documentation
 is limited.
 """
 from __future__ import with_statement
+import io as _io
 import os as _os
 import re as _re
 import sys as _sys
+import zlib as _zlib
+import heapq as _heapq
+import errno as _errno
+import shutil as _shutil
+import struct as _struct
 import inspect as _inspect
 import argparse as _argparse
+import multiprocessing as _mp
+from itertools import chain as _chain
+from collections import deque as _deque
 from collections import OrderedDict as _OD
 
 import bz2
@@ -28,6 +37,17 @@ from six import text_type as _txt
 from six import string_types as _str
 from six import integer_types as _int
 from six.moves import input as _get_input
+from six.moves import shlex_quote as _quote
+
+try:
+    from concurrent import futures as _futures
+except ImportError:  # python2 without the futures backport
+    _futures = None
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
 
 # Progress bar handling
 from tqdm import tqdm, tqdm_notebook
@@ -404,7 +424,8 @@ def is_exc(x):
     """
     return bool(isinstance(x, tuple)
                 and len(x) == 3
-                and issubclass(BaseException, x[0]))
+                and isinstance(x[0], type)
+                and issubclass(x[0], BaseException))
 
 
 ###############################################################################
@@ -418,6 +439,9 @@ def open_zipped(infile, mode='r'):
     If infile is a file handle or text device, it is returned without
     changes.
 
+    infile can also be a byte range from `split_ranges()`, which is opened
+    with `open_range()`.
+
     Returns
     -------
     text mode file handle.
@@ -426,6 +450,8 @@ def open_zipped(infile, mode='r'):
     if hasattr(infile, 'write'):
         return infile
     if isinstance(infile, _str):
+        if parse_range(infile) and not _os.path.exists(infile):
+            return open_range(infile, mode)
         if infile.endswith('.gz'):
             return gzip.open(infile, mode)
         if infile.endswith('.bz2'):
@@ -436,6 +462,189 @@ def open_zipped(infile, mode='r'):
         return open(infile, mode)
 
 
+###############################################################################
+#                                 Byte Ranges                                 #
+###############################################################################
+
+# path::start-end[,start-end...], the ends are exclusive
+RANGE_SEP = '::'
+_RANGE_RE = _re.compile(r'^[0-9]+-[0-9]+(,[0-9]+-[0-9]+)*$')
+
+
+def make_range(path, segments):
+    """Return a byte range string for a list of (start, end) segments."""
+    return '{0}{1}{2}'.format(path, RANGE_SEP, ','.join(
+        ['{0}-{1}'.format(start, end) for start, end in segments]
+    ))
+
+
+def parse_range(spec):
+    """Split a byte range string into path and segments.
+
+    Parameters
+    ----------
+    spec : str
+        A string like 'path::start-end', as made by `make_range()`.
+
+    Returns
+    -------
+    path : str
+    segments : list
+        A list of (start, end) tuples, end is exclusive.
+
+    Returns None if spec is not a byte range.
+    """
+    if not isinstance(spec, _str) or RANGE_SEP not in spec:
+        return None
+    path, _, ranges = spec.rpartition(RANGE_SEP)
+    if not path or not _RANGE_RE.match(ranges):
+        return None
+    return path, [tuple([int(j) for j in i.split('-')])
+                  for i in ranges.split(',')]
+
+
+class _RangeReader(_io.RawIOBase):
+
+    """Read a list of (start, end) byte segments of a file in order."""
+
+    def __init__(self, path, segments):
+        """Open path."""
+        super(_RangeReader, self).__init__()
+        self._file     = open(path, 'rb')
+        self._segments = list(segments)
+        self._left     = None
+
+    def readable(self):
+        """Always True."""
+        return True
+
+    def readinto(self, buf):
+        """Read the next bytes of the current segment into buf."""
+        while self._segments:
+            if self._left is None:
+                start, end = self._segments[0]
+                self._file.seek(start)
+                self._left = end - start
+            count = 0
+            if self._left > 0:
+                count = self._file.readinto(
+                    memoryview(buf)[:min(len(buf), self._left)]
+                )
+            if not count:
+                # Segment done (or file truncated), move to the next
+                self._segments.pop(0)
+                self._left = None
+                continue
+            self._left -= count
+            return count
+        return 0
+
+    def close(self):
+        """Close the file."""
+        self._file.close()
+        super(_RangeReader, self).close()
+
+
+def open_range(spec, mode='r'):
+    """Open a byte range of a file for streaming reads.
+
+    Only the bytes in the range are read, the file is never copied.
+
+    Parameters
+    ----------
+    spec : str
+        A byte range from `split_ranges()` or `make_range()`
+    mode : {'r', 'rb'}, optional
+
+    Returns
+    -------
+    file handle
+        Text mode unless mode is 'rb'.
+    """
+    if not mode.startswith('r'):
+        raise ValueError('Byte ranges can only be read')
+    parsed = parse_range(spec)
+    if not parsed:
+        raise ValueError('{0} is not a byte range'.format(spec))
+    reader = _io.BufferedReader(_RangeReader(*parsed))
+    if 'b' in mode:
+        return reader
+    return _io.TextIOWrapper(reader)
+
+
+def range_command(spec):
+    """Return a bash process substitution that streams a byte range.
+
+    The result can be used anywhere a shell command expects a file path it
+    reads from start to end, e.g. `wc -l <(...)`.
+    """
+    path, segments = parse_range(spec)
+    path = _quote(path)
+    cmnds = []
+    for start, end in segments:
+        cmnds.append('tail -c +{0} {1} | head -c {2}'.format(
+            start + 1, path, end - start
+        ))
+    return '<({0})'.format('; '.join(cmnds))
+
+
+def split_ranges(infile, parts, keep_header=False, splitter='lines'):
+    """Split an uncompressed file into byte ranges at record boundaries.
+
+    Seeks to roughly every size/parts bytes and moves each boundary to the
+    start of the next record, so only a record per part is read (except for
+    quoted CSV, see CsvSplitter) and nothing is written. Open the ranges with
+    `open_range()` (or `open_zipped()`), or use `range_command()` in shell
+    scripts.
+
+    Parameters
+    ----------
+    infile : str
+    parts : int
+    keep_header : bool, optional
+        Start every range with the first record of the file, which is not
+        part of any other range.
+    splitter : str or LineSplitter, optional
+        How to find records, a name in SPLITTERS or a splitter. Any header
+        the splitter finds (e.g. SAM @ lines) starts every range.
+
+    Returns
+    -------
+    tuple
+        Byte range strings, exactly parts long, ranges can be empty if lines
+        are longer than size/parts.
+
+    Raises
+    ------
+    ValueError
+        If infile is compressed
+    """
+    if infile.endswith(('.gz', '.bz2', '.xz', '.zip')):
+        raise ValueError('Cannot split compressed file {0} by bytes'
+                         .format(infile))
+    parts    = int(parts)
+    size     = _os.path.getsize(infile)
+    splitter = get_splitter(splitter)
+    with open(infile, 'rb') as fin:
+        header = len(splitter.read_header(fin, keep_header)[0])
+        bounds = [header]
+        step   = (size - header)/float(parts)
+        for part in range(1, parts):
+            target = max(header + int(step*part), bounds[-1])
+            if target >= size:
+                bounds.append(size)
+                continue
+            bounds.append(min(splitter.align(fin, target, bounds[-1]), size))
+        bounds.append(size)
+    prefix = [(0, header)] if header else []
+    ranges = tuple([
+        make_range(infile, prefix + [(start, end)])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ])
+    _logme.log('Split ranges: {}'.format(ranges), 'debug')
+    return ranges
+
+
 def exp_file(infile):
     """Return an expanded path to a file."""
     return _os.path.expandvars(
@@ -476,86 +685,802 @@ def block_read(files, size=65536):
         yield b
 
 
-def count_lines(infile, force_blocks=False):
+def append_file(fout, infile, skip_lines=0):
+    """Append infile to the open binary file fout without reading it all.
+
+    The bytes are copied in the kernel with `os.copy_file_range()` or
+    `os.sendfile()` where possible, falling back to a chunked copy.
+
+    Parameters
+    ----------
+    fout : file
+        A file opened for binary writing.
+    infile : str
+        The file to append, copied as is (not decompressed).
+    skip_lines : int, optional
+        Leave out this many lines from the start of infile, e.g. a header.
+
+    Returns
+    -------
+    size : int
+        The number of bytes appended.
+    """
+    with open(infile, 'rb') as fin:
+        for _ in range(skip_lines):
+            fin.readline()
+        offset = fin.tell()
+        size = _os.fstat(fin.fileno()).st_size - offset
+        fout.flush()
+        done = _copy_range(fin.fileno(), fout.fileno(), offset, size)
+        # The kernel moved the descriptor, sync the python file
+        fout.seek(0, 2)
+        if done < size:
+            fin.seek(offset + done)
+            _shutil.copyfileobj(fin, fout, _SPLIT_BLOCK)
+    return size
+
+
+def _copy_range(infd, outfd, offset, size):
+    """Copy up to size bytes from offset in infd to outfd in the kernel.
+
+    Returns the number of bytes copied, less than size if neither
+    copy_file_range nor sendfile work here.
+    """
+    done = 0
+    for name in ['copy_file_range', 'sendfile']:
+        copier = getattr(_os, name, None)
+        if not copier:
+            continue
+        try:
+            while done < size:
+                if name == 'copy_file_range':
+                    sent = copier(infd, outfd, size-done, offset+done)
+                else:
+                    sent = copier(outfd, infd, offset+done, size-done)
+                if not sent:
+                    break
+                done += sent
+        except OSError as err:
+            if err.errno not in _NO_COPY:
+                raise
+            continue
+        break
+    return done
+
+
+_NO_COPY = set([getattr(_errno, i) for i in
+                ['EXDEV', 'EINVAL', 'ENOSYS', 'EBADF', 'ENOTSUP',
+                 'EOPNOTSUPP'] if hasattr(_errno, i)])
+
+
+def merge_sorted(infiles, fout, key=None, skip_lines=0):
+    """Merge already sorted text files into fout line by line.
+
+    A k-way merge with `heapq.merge()`, so only one line per file is held in
+    memory at a time.
+
+    Parameters
+    ----------
+    infiles : list
+        Paths to sorted files, can be compressed.
+    fout : file
+        A file opened for text writing.
+    key : function, optional
+        Called on every line (with its newline) to get the sort key.
+    skip_lines : int, optional
+        Leave out this many lines from the start of every file.
+
+    Returns
+    -------
+    count : int
+        The number of lines written.
+    """
+    files = [open_zipped(i) for i in infiles]
+    try:
+        for fin in files:
+            for _ in range(skip_lines):
+                fin.readline()
+        count = 0
+        for line in _heapq.merge(*[_ended(i) for i in files], key=key):
+            fout.write(line)
+            count += 1
+    finally:
+        for fin in files:
+            fin.close()
+    return count
+
+
+def _ended(lines):
+    """Yield lines, adding a newline to a last line without one."""
+    for line in lines:
+        yield line if line.endswith('\n') else line + '\n'
+
+
+def count_lines(infile, force_blocks=False, threads=None):
     """Return the line count of a file as quickly as possible.
 
-    Uses `wc` if avaialable, otherwise does a rapid read.
+    Counts newlines, like `wc -l`, in binary blocks in this process, with
+    numpy if it is installed. Large plain files are split into one range per
+    thread, each read with `os.pread()`, gzipped files are streamed through
+    zlib and bzipped files through bzip2 in a subprocess if it is installed.
+
+    Parameters
+    ----------
+    infile : str
+        Path to the file, can be compressed.
+    force_blocks : bool, optional
+        Read the file in order in a single thread with python's own
+        decompressors.
+    threads : int, optional
+        Number of threads for plain files, default the number of cores.
+
+    Returns
+    -------
+    count : int
     """
-    if which('wc') and not force_blocks:
-        _logme.log('Using wc', 'debug')
-        if infile.endswith('.gz'):
-            cat = 'zcat'
-        elif infile.endswith('.bz2'):
-            cat = 'bzcat'
+    if infile.endswith('.gz'):
+        _logme.log('Counting with zlib', 'debug')
+        return _count_blocks(_gzip_blocks(infile))
+    if infile.endswith('.bz2'):
+        if force_blocks:
+            stream, proc = bz2.BZ2File(infile, 'rb'), None
         else:
-            cat = 'cat'
-        command = "{cat} {infile} | wc -l | awk '{{print $1}}'".format(
-            cat=cat, infile=infile
-        )
-        return int(cmd(command)[1])
-    else:
-        _logme.log('Using block read', 'debug')
-        with open_zipped(infile) as fin:
-            return sum(bl.count("\n") for bl in block_read(fin))
+            stream, proc = _open_decompressed(infile)
+        with stream:
+            count = _count_blocks(block_read(stream, _COUNT_BLOCK))
+        if proc:
+            proc.wait()
+        return count
+    size = _os.path.getsize(infile)
+    threads = min(threads if threads else _mp.cpu_count(),
+                  size//(_COUNT_BLOCK*8) + 1)
+    if force_blocks or threads < 2 or not _futures or not hasattr(_os,
+                                                                 'pread'):
+        _logme.log('Counting by block read', 'debug')
+        with open(infile, 'rb') as fin:
+            return _count_blocks(block_read(fin, _COUNT_BLOCK))
+    _logme.log('Counting with {0} threads'.format(threads), 'debug')
+    # One contiguous range of whole blocks per thread
+    step = -(-size//threads//_COUNT_BLOCK)*_COUNT_BLOCK
+    fd = _os.open(infile, _os.O_RDONLY)
+    try:
+        with _futures.ThreadPoolExecutor(threads) as pool:
+            return sum(pool.map(
+                lambda x: _count_blocks(_pread_blocks(fd, x, x + step)),
+                range(0, size, step)
+            ))
+    finally:
+        _os.close(fd)
 
 
-def split_file(infile, parts, outpath='', keep_header=False):
-    """Split a file in parts and return a list of paths.
+def _count_blocks(blocks):
+    """Return the number of newlines in an iterable of bytes.
+
+    Uses numpy if it is installed, which is faster than bytes.count and
+    releases the GIL, so threads count in parallel.
+    """
+    if _np is None:
+        return sum([block.count(b'\n') for block in blocks])
+    return sum([int(_np.count_nonzero(_np.frombuffer(block, _np.uint8) == 10))
+                for block in blocks])
+
+
+def _pread_blocks(fd, start, end):
+    """Yield the bytes from start to end of fd in blocks."""
+    while start < end:
+        block = _os.pread(fd, min(_COUNT_BLOCK, end - start), start)
+        if not block:
+            break
+        start += len(block)
+        yield block
+
+
+def _gzip_blocks(infile, size=None):
+    """Yield the decompressed contents of a gzip file in blocks with zlib.
+
+    Handles files of several gzip members, like bgzip output.
+
+    Raises
+    ------
+    EOFError
+        If the file is truncated.
+    """
+    size = size if size else _COUNT_BLOCK
+    decomp = _zlib.decompressobj(16 + _zlib.MAX_WBITS)
+    # True while the current member has started but not ended
+    pending = False
+    with open(infile, 'rb') as fin:
+        for data in block_read(fin, 1024*1024):
+            while data:
+                pending = True
+                # Bounded, so highly compressed blocks do not fill memory
+                yield decomp.decompress(data, size)
+                data = decomp.unconsumed_tail
+                if decomp.eof:
+                    # The rest of the input, including unconsumed_tail
+                    data = decomp.unused_data
+                    decomp = _zlib.decompressobj(16 + _zlib.MAX_WBITS)
+                    pending = False
+                    if not data.strip(b'\0'):
+                        # Padding at the end of the file, not a member
+                        data = b''
+    if pending:
+        yield decomp.flush()
+        if not decomp.eof:
+            raise EOFError('{0} ended before the end of the gzip stream'
+                           .format(infile))
+
+
+def read_header(infile, keep_header=False, splitter='lines'):
+    """Return the header of infile as bytes, see `split_file()`."""
+    splitter = get_splitter(splitter)
+    stream, proc = _open_decompressed(infile)
+    with stream:
+        header = splitter.read_header(stream, keep_header)[0]
+    if proc:
+        proc.kill()
+        proc.wait()
+    return header
+
+
+def head_file(infile, outfile, records, keep_header=False, splitter='lines'):
+    """Write the header and first records of infile to outfile.
+
+    outfile is compressed the same way as infile, so that it can stand in for
+    it, e.g. to time a command on a small piece of a file.
 
-    .. note:: Linux specific (uses wc).
+    Parameters
+    ----------
+    infile : str
+    outfile : str
+    records : int
+        The number of records to write after the header.
+    keep_header : bool, optional
+        Treat the first record as a header.
+    splitter : str or LineSplitter, optional
+        How to find records, see `split_file()`.
+
+    Returns
+    -------
+    written : int
+        The number of records written, less than records if infile is short.
+    """
+    splitter = get_splitter(splitter)
+    if infile.endswith('.gz'):
+        fout = gzip.open(outfile, 'wb')
+    elif infile.endswith('.bz2'):
+        fout = bz2.BZ2File(outfile, 'wb')
+    else:
+        fout = open(outfile, 'wb')
+    stream, proc = _open_decompressed(infile)
+    written = 0
+    with stream, fout:
+        header, block = splitter.read_header(stream, keep_header)
+        fout.write(header)
+        while written < records:
+            if not block:
+                block = stream.read(_SPLIT_BLOCK)
+                if not block:
+                    break
+            end, found = splitter.advance(block, 0, records - written)
+            fout.write(block[:end])
+            written += found
+            block = block[end:]
+    if proc:
+        # Usually stopped early, so do not wait for the whole file
+        proc.kill()
+        proc.wait()
+    splitter.reset()
+    return written
+
+
+def split_file(infile, parts, outpath='', keep_header=False, threads=None,
+               splitter='lines'):
+    """Split a file in parts and return a list of paths.
 
     If has_header is True, the top line is stripped off the infile prior to
     splitting and assumed to be the header.
 
+    The file is read in large blocks (by gzip or bzip2 in a separate process
+    if the input is compressed, so that decompression runs alongside the
+    splitting) and cut at line boundaries. Compressed outputs are compressed
+    block by block in a pool of threads and written in order: gzipped inputs
+    give BGZF files (see `bgzf_compress()`), bz2 inputs give multi-stream bz2
+    files, both readable with `open_zipped()`.
+
+    Files are cut between records, which are lines unless another splitter is
+    given, e.g. 'fastq' for 4 line FASTQ records or 'csv' for CSV with quoted
+    newlines.
+
     Parameters
     ----------
     outpath : str, optional
         The directory to save the split files.
     keep_header : bool, optional
-        Add the header line to the top of every file.
+        Add the first record to the top of every file.
+    threads : int, optional
+        Number of compression threads, defaults to the number of cores.
+    splitter : str or LineSplitter, optional
+        How to find records, a name in SPLITTERS or a splitter. Any header
+        the splitter finds (e.g. SAM @ lines) goes at the top of every file.
 
     Returns
     -------
     list
-        Paths to split files.
+        Paths to split files, exactly parts long. The records are spread as
+        evenly as possible.
     """
-    # Determine how many reads will be in each split sam file.
-    _logme.log('Getting line count', 'debug')
-
-    num_lines = int(count_lines(infile)/int(parts)) + 1
+    parts    = int(parts)
+    threads  = int(threads) if threads else _mp.cpu_count()
+    splitter = get_splitter(splitter)
 
     # Subset the file into X number of jobs, maintain extension
-    cnt       = 0
-    currjob   = 1
-    suffix    = '.split_' + str(currjob).zfill(4) + '.' + infile.split('.')[-1]
+    ext       = infile.split('.')[-1]
     file_name = _os.path.basename(infile)
-    run_file  = _os.path.join(outpath, file_name + suffix)
-    outfiles  = [run_file]
+    outfiles  = tuple([
+        _os.path.join(outpath, '{0}.split_{1}.{2}'.format(
+            file_name, str(i).zfill(4), ext
+        )) for i in range(1, parts+1)
+    ])
 
     # Actually split the file
     _logme.log('Splitting file', 'debug')
-    with open_zipped(infile) as fin:
-        header = fin.readline() if keep_header else ''
-        sfile = open_zipped(run_file, 'w')
-        sfile.write(header)
-        for line in fin:
-            cnt += 1
-            if cnt < num_lines:
-                sfile.write(line)
-            elif cnt == num_lines:
-                sfile.write(line)
-                sfile.close()
-                currjob += 1
-                suffix = '.split_' + str(currjob).zfill(4) + '.' + \
-                    infile.split('.')[-1]
-                run_file = _os.path.join(outpath, file_name + suffix)
-                sfile = open_zipped(run_file, 'w')
-                outfiles.append(run_file)
-                sfile.write(header)
-                cnt = 0
-        sfile.close()
+    stream, proc = _open_decompressed(infile)
+    writer = _SplitWriter(ext, threads)
+    try:
+        header, rest = splitter.read_header(stream, keep_header)
+
+        # Determine how many records go in each split file
+        _logme.log('Getting record count', 'debug')
+        num_records = splitter.count(infile, header)
+        sizes = [num_records//parts + (1 if i < num_records % parts else 0)
+                 for i in range(parts)]
+
+        part   = 0
+        left   = sizes[0]
+        sfile  = writer.open(outfiles[0], header)
+        blocks = _chain([rest], iter(lambda: stream.read(_SPLIT_BLOCK), b''))
+        for block in blocks:
+            pos = 0
+            while pos < len(block):
+                if part == parts - 1:
+                    writer.write(sfile, block[pos:])
+                    break
+                end, found = splitter.advance(block, pos, left)
+                writer.write(sfile, block[pos:end])
+                left -= found
+                if left:
+                    break
+                # This part is full
+                writer.close(sfile)
+                pos   = end
+                part += 1
+                left  = sizes[part]
+                sfile = writer.open(outfiles[part], header)
+        writer.close(sfile)
+        # Only if there were fewer lines than counted
+        for outfile in outfiles[part+1:]:
+            writer.close(writer.open(outfile, header))
+    finally:
+        writer.finish()
+        stream.close()
+    if proc and proc.wait() != 0:
+        raise IOError('Decompressing {0} failed with code {1}'
+                      .format(infile, proc.returncode))
     _logme.log('Split files: {}'.format(outfiles), 'debug')
-    return tuple(outfiles)
+    return outfiles
+
+
+###############################################################################
+#                              Record Splitters                               #
+###############################################################################
+
+
+class LineSplitter(object):
+
+    """Find the boundaries of records in a file, records are lines.
+
+    This is the base of all splitters. To split other formats, subclass it and
+    override advance() and align(), plus count() and read_header() if needed.
+    Splitters keep state between calls to advance(), so a new one is made for
+    every file.
+
+    Attributes
+    ----------
+    name : str
+    header_prefix : bytes or None
+        Leading lines that start with this are the header of the file, which
+        goes at the top of every split.
+    """
+
+    name          = 'lines'
+    header_prefix = None
+
+    def reset(self):
+        """Forget any state, called at the start of the records."""
+        pass
+
+    def read_header(self, stream, keep_header=False):
+        """Read the header from the start of a binary stream.
+
+        Parameters
+        ----------
+        stream : file
+        keep_header : bool, optional
+            Also take the first record as a header.
+
+        Returns
+        -------
+        header : bytes
+        rest : bytes
+            Bytes read after the header, the start of the records.
+        """
+        header = b''
+        line   = stream.readline()
+        if self.header_prefix:
+            while line and line.startswith(self.header_prefix):
+                header += line
+                line    = stream.readline()
+        if keep_header and line:
+            self.reset()
+            end, found = self.advance(line, 0, 1)
+            while not found:
+                more = stream.readline()
+                if not more:
+                    break
+                line += more
+                end, found = self.advance(line, len(line) - len(more), 1)
+            header += line[:end]
+            line    = line[end:]
+        self.reset()
+        return header, line
+
+    def count(self, infile, header=b''):
+        """Return the number of records after header in infile."""
+        return count_lines(infile) - header.count(b'\n')
+
+    def advance(self, block, pos, count):
+        """Find the end of the count-th record that ends in block[pos:].
+
+        Returns
+        -------
+        end : int
+            The offset just after that record, or len(block).
+        found : int
+            The number of records that end between pos and end.
+        """
+        lines = block.count(b'\n', pos)
+        if lines < count:
+            return len(block), lines
+        end = pos
+        for _ in range(count):
+            end = block.index(b'\n', end) + 1
+        return end, count
+
+    def align(self, fin, target, previous=0):
+        """Return the start of the first record at or after target.
+
+        Parameters
+        ----------
+        fin : file
+            The file open in binary mode
+        target : int
+        previous : int, optional
+            The start of an earlier record, splitters that need to read from
+            a known record boundary start there.
+        """
+        # Finish the line that target - 1 is on
+        fin.seek(max(target - 1, 0))
+        fin.readline()
+        return fin.tell()
+
+
+class TsvSplitter(LineSplitter):
+
+    """Tab separated lines, leading lines starting with # are the header.
+
+    Handles VCF, BED and other commented tables.
+    """
+
+    name          = 'tsv'
+    header_prefix = b'#'
+
+
+class SamSplitter(LineSplitter):
+
+    """SAM alignments, leading lines starting with @ are the header."""
+
+    name          = 'sam'
+    header_prefix = b'@'
+
+
+class FastqSplitter(LineSplitter):
+
+    """FASTQ files, records are 4 lines (header, sequence, +, qualities)."""
+
+    name = 'fastq'
+
+    def reset(self):
+        """Start at the first line of a record."""
+        self.phase = 0
+
+    def count(self, infile, header=b''):
+        """Return the number of records after header in infile."""
+        return (count_lines(infile) - header.count(b'\n'))//4
+
+    def advance(self, block, pos, count):
+        """Find the end of the count-th record that ends in block[pos:]."""
+        end, lines = super(FastqSplitter, self).advance(
+            block, pos, 4*count - self.phase
+        )
+        found, self.phase = divmod(self.phase + lines, 4)
+        return end, found
+
+    def align(self, fin, target, previous=0):
+        """Return the start of the first record at or after target.
+
+        A record starts on a line beginning with @ that is followed two lines
+        later by a line beginning with +. Quality lines can start with @, but
+        then the line two later is a sequence.
+        """
+        start = super(FastqSplitter, self).align(fin, target, previous)
+        fin.seek(start)
+        lines = [fin.readline() for _ in range(7)]
+        for i in range(4):
+            if lines[i].startswith(b'@') and lines[i+2].startswith(b'+'):
+                return start + sum([len(j) for j in lines[:i]])
+        if not lines[0]:
+            return start
+        raise ValueError('Cannot find a FASTQ record after byte {0}'
+                         .format(target))
+
+
+class CsvSplitter(LineSplitter):
+
+    """CSV files, newlines inside double quoted fields are not record ends.
+
+    Whether a newline is quoted depends on all the quotes before it, so
+    aligning byte ranges reads (but does not copy) the file from the previous
+    boundary to each target, counting quotes.
+    """
+
+    name = 'csv'
+
+    def reset(self):
+        """Start outside of quotes."""
+        self.quoted = False
+
+    def count(self, infile, header=b''):
+        """Return the number of records after header in infile."""
+        stream, proc = _open_decompressed(infile)
+        total = 0
+        with stream:
+            stream.read(len(header))
+            self.reset()
+            for block in iter(lambda: stream.read(_SPLIT_BLOCK), b''):
+                total += self.advance(block, 0, len(block))[1]
+        if proc:
+            proc.wait()
+        self.reset()
+        # Like wc, a last record with no newline is not counted
+        return total
+
+    def advance(self, block, pos, count):
+        """Find the end of the count-th record that ends in block[pos:]."""
+        if not self.quoted and block.find(b'"', pos) == -1:
+            return super(CsvSplitter, self).advance(block, pos, count)
+        found = 0
+        while found < count:
+            newline = block.find(b'\n', pos)
+            if newline == -1:
+                self.quoted ^= bool(block.count(b'"', pos) % 2)
+                return len(block), found
+            self.quoted ^= bool(block.count(b'"', pos, newline) % 2)
+            pos = newline + 1
+            if not self.quoted:
+                found += 1
+        return pos, found
+
+    def align(self, fin, target, previous=0):
+        """Return the start of the first record at or after target."""
+        # previous is a record start, so outside quotes
+        self.reset()
+        fin.seek(previous)
+        left = max(target - 1 - previous, 0)
+        while left:
+            block = fin.read(min(left, _SPLIT_BLOCK))
+            if not block:
+                break
+            self.quoted ^= bool(block.count(b'"') % 2)
+            left -= len(block)
+        position = fin.tell()
+        for block in iter(lambda: fin.read(_SPLIT_BLOCK), b''):
+            end, found = self.advance(block, 0, 1)
+            if found:
+                return position + end
+            position += len(block)
+        return position
+
+
+# name: splitter class
+SPLITTERS = _OD([
+    ('lines', LineSplitter),
+    ('tsv',   TsvSplitter),
+    ('sam',   SamSplitter),
+    ('fastq', FastqSplitter),
+    ('csv',   CsvSplitter),
+])
+
+
+def get_splitter(splitter='lines'):
+    """Return a new splitter.
+
+    Parameters
+    ----------
+    splitter : str or LineSplitter or LineSplitter subclass
+        A name in SPLITTERS, or a splitter to use as is.
+
+    Raises
+    ------
+    ValueError
+        If the name is not in SPLITTERS.
+    """
+    if isinstance(splitter, LineSplitter):
+        splitter.reset()
+        return splitter
+    if isinstance(splitter, type) and issubclass(splitter, LineSplitter):
+        splitter = splitter()
+    elif splitter in SPLITTERS:
+        splitter = SPLITTERS[splitter]()
+    else:
+        raise ValueError('Splitter {0} is not available, use one of {1}'
+                         .format(splitter, list(SPLITTERS)))
+    splitter.reset()
+    return splitter
+
+
+###############################################################################
+#                           Parallel File Splitting                           #
+###############################################################################
+
+# Bytes read at a time by split_file and count_lines
+_SPLIT_BLOCK = 4*1024*1024
+_COUNT_BLOCK = 1024*1024
+
+# Uncompressed bytes per BGZF block, as in htslib
+BGZF_BLOCK = 65280
+
+# The empty block that ends every BGZF file
+BGZF_EOF = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+            b'\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+def bgzf_compress(data, level=6):
+    """Compress data as BGZF blocks.
+
+    BGZF (from the SAM/BAM specification) is a series of gzip members of at
+    most 64 KB each, with the compressed size in an extra header field. Any
+    gzip reader can read it, and since blocks are independent, they can be
+    compressed in parallel and indexed for random access.
+
+    Parameters
+    ----------
+    data : bytes
+    level : int, optional
+        zlib compression level
+
+    Returns
+    -------
+    bytes
+        The blocks, without the BGZF_EOF block.
+    """
+    data = memoryview(data)
+    out  = []
+    for start in range(0, len(data), BGZF_BLOCK):
+        block = data[start:start+BGZF_BLOCK]
+        comp  = _zlib.compressobj(level, _zlib.DEFLATED, -15)
+        cdata = comp.compress(block) + comp.flush()
+        # BSIZE is the total block size minus 1: 18 header + 8 trailer bytes
+        out.append(_struct.pack('<4BI2BH2BHH', 31, 139, 8, 4, 0, 0, 255, 6,
+                                66, 67, 2, len(cdata) + 25))
+        out.append(cdata)
+        out.append(_struct.pack('<II', _zlib.crc32(block) & 0xffffffff,
+                                len(block)))
+    return b''.join(out)
+
+
+# extension: (compress function, end of file bytes)
+_SPLIT_CODECS = {
+    'gz':  (bgzf_compress, BGZF_EOF),
+    'bz2': (bz2.compress, b''),
+}
+
+
+def _open_decompressed(infile):
+    """Open infile as a binary stream of its decompressed contents.
+
+    Uses gzip or bzip2 in a subprocess if possible.
+
+    Returns
+    -------
+    stream : file
+    proc : subprocess.Popen or None
+    """
+    for ext, prog, opener in [('.gz', 'gzip', gzip.open),
+                              ('.bz2', 'bzip2', bz2.BZ2File)]:
+        if not infile.endswith(ext):
+            continue
+        if which(prog):
+            proc = Popen([prog, '-dc', infile], stdout=PIPE, bufsize=-1)
+            return proc.stdout, proc
+        return opener(infile, 'rb'), None
+    return open(infile, 'rb'), None
+
+
+class _SplitWriter(object):
+
+    """Compress split file blocks in a thread pool and write them in order.
+
+    Writes are queued as futures, the oldest are written as they complete or
+    when too many are waiting, so memory use is bounded.
+    """
+
+    def __init__(self, ext, threads):
+        """Pick the codec for ext and start the pool."""
+        self.compress, self.eof = _SPLIT_CODECS.get(ext, (None, b''))
+        self.pool = None
+        if self.compress and threads > 1 and _futures:
+            self.pool = _futures.ThreadPoolExecutor(threads)
+        self.max_pending = threads*2
+        # (file, future), a future of None closes the file
+        self.pending = _deque()
+
+    def open(self, path, header=b''):
+        """Open path for writing and queue header."""
+        sfile = open(path, 'wb')
+        self.write(sfile, header)
+        return sfile
+
+    def write(self, sfile, data):
+        """Queue data to be compressed and written to sfile."""
+        if not data:
+            return
+        if not self.compress:
+            sfile.write(data)
+        elif not self.pool:
+            sfile.write(self.compress(data))
+        else:
+            self.pending.append((sfile, self.pool.submit(self.compress,
+                                                         data)))
+            self._drain(self.max_pending)
+
+    def close(self, sfile):
+        """Close sfile once its queued data is written."""
+        if self.pool:
+            self.pending.append((sfile, None))
+            self._drain(self.max_pending)
+        else:
+            sfile.write(self.eof)
+            sfile.close()
+
+    def finish(self):
+        """Write everything queued and stop the pool."""
+        self._drain(0)
+        if self.pool:
+            self.pool.shutdown()
+
+    def _drain(self, keep):
+        """Write completed blocks in order, wait if more than keep queued."""
+        while self.pending:
+            sfile, future = self.pending[0]
+            if future is None:
+                sfile.write(self.eof)
+                sfile.close()
+            elif len(self.pending) > keep or future.done():
+                sfile.write(future.result())
+            else:
+                break
+            self.pending.popleft()
 
 
 def is_exe(fpath):
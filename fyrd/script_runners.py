@@ -83,6 +83,7 @@ thing to run successfully on the first try, no matter what.
 '''
 import os
 import sys
+import types
 import socket
 from subprocess import Popen, PIPE
 import six
@@ -90,6 +91,11 @@ from tblib import pickling_support
 pickling_support.install()
 import dill as pickle
 
+# fyrd.serialize, embedded so that fyrd is not needed on the compute nodes
+serialize = types.ModuleType('fyrd_serialize')
+exec(compile({serialize_source!r}, 'fyrd_serialize', 'exec'),
+     serialize.__dict__)
+
 out = None
 try:
 {imports}
@@ -139,23 +145,22 @@ def run_function(func_c, args=None, kwargs=None):
 if __name__ == "__main__":
     # If an Exception was raised during import, skip this
     if not out:
-        with open('{pickle_file}', 'rb') as fin:
-            # Try to install packages first
-            try:
-                function_call, args, kwargs = pickle.load(fin)
-            except ImportError as e:
-                out = sys.exc_info()
-                module = str(e).split(' ')[-1]
-                node   = socket.gethostname()
-                sys.stderr.write(ERR_MESSAGE.format(module))
-                out = list(out)
-                out[1] = ImportError(
-                    'Module {{}} is not installed on compute node {{}}'
-                    .format(module, node)
-                )
-                out = tuple(out)
-            except:
-                out = sys.exc_info()
+        # Try to install packages first
+        try:
+            function_call, args, kwargs = serialize.load('{pickle_file}')
+        except ImportError as e:
+            out = sys.exc_info()
+            module = str(e).split(' ')[-1]
+            node   = socket.gethostname()
+            sys.stderr.write(ERR_MESSAGE.format(module))
+            out = list(out)
+            out[1] = ImportError(
+                'Module {{}} is not installed on compute node {{}}'
+                .format(module, node)
+            )
+            out = tuple(out)
+        except:
+            out = sys.exc_info()
 
     try:
         if not out:
@@ -163,10 +168,10 @@ if __name__ == "__main__":
     except Exception:
         out = sys.exc_info()
 
-    with open('{out_file}', 'wb') as fout:
-        pickle.dump(out, fout)
+    serialize.dump(out, '{out_file}', buffer_dir={out_buffer_dir!r},
+                   serializer={serializer!r}, compression={compression!r})
 
     if isinstance(out, tuple):
-        if issubclass(BaseException, out[0]):
+        if issubclass(out[0], BaseException):
             six.reraise(*out)
 """
@@ -0,0 +1,761 @@
+# -*- coding: utf-8 -*-
+"""
+Read and write the pickle files used to run functions.
+
+Function jobs pickle ``(function, args, kwargs)`` to a file, the runner script
+loads it, runs the function and pickles the result to another file. This
+module writes those files. Each one starts with a magic line and a one line
+JSON header describing how the rest of the file was written, files without the
+magic line are plain dill pickles.
+
+When a buffer directory is given, large buffers (e.g. numpy arrays and the
+blocks of pandas DataFrames) are written with pickle protocol 5 as separate
+out-of-band files in that directory. They are memory mapped on load, so the
+unpickled arrays point straight into the page cache instead of being read and
+copied. The mappings are copy-on-write, the arrays stay writable and the files
+are never changed.
+
+The serializer is picked from the SERIALIZERS registry, the header records
+which one was used so the reader does not need to know:
+
+    dill : The default, handles closures, lambdas and interactive code
+    pickle : The stock pickle, much faster for plain data, functions are
+             pickled by reference so they must be importable
+    cloudpickle : Like dill, usually faster, only if installed
+    arrow : Arrow IPC streams for pandas DataFrames, only if pyarrow is
+            installed
+
+If an object cannot be written with the requested serializer (e.g. a lambda
+with pickle or a tuple with arrow), dill is used instead.
+
+Objects shared by many jobs, like the function and large arguments of a
+parapply, can be stored once in a content addressed blob store (BLOB_DIR next
+to the pickle files). The pickles then only hold the blob ids, and each
+pickle gets a hard link to each of its blobs which doubles as a reference
+count.
+
+Pickles can also be compressed with any codec in CODECS: zstd or lz4 if
+installed, or gzip. Payloads smaller than MIN_COMPRESS are left alone and the
+codec used goes in the header. Compressed files have no out-of-band buffers,
+mapping uncompressed buffers and shrinking the file are mutually exclusive.
+
+This module must not import anything from fyrd, its source is embedded in the
+function runner script so that it works on nodes without fyrd installed.
+"""
+import os as _os
+import io as _io
+import copy as _copy
+import gzip as _gzip
+import shutil as _shutil
+import hashlib as _hashlib
+import json as _json
+import mmap as _mmap
+import pickle as _stdpickle
+import time as _time
+import tempfile as _tmp
+from collections import OrderedDict as _OD
+
+import dill as _dill
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+try:
+    import cloudpickle as _cloudpickle
+except ImportError:
+    _cloudpickle = None
+
+try:
+    import pandas as _pd
+    import pyarrow as _pa
+except ImportError:
+    _pa = None
+
+try:
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None
+
+try:
+    import lz4.frame as _lz4
+except ImportError:
+    _lz4 = None
+
+MAGIC = b'FYRDPKL1\n'
+
+# Out-of-band buffers need pickle protocol 5 (python 3.8+)
+OOB = _stdpickle.HIGHEST_PROTOCOL >= 5
+
+# Buffers smaller than this stay in the pickle file
+MIN_BUFFER = 1024*1024
+
+# tmpfs mounted everywhere on linux
+SHM_DIR = '/dev/shm'
+
+# Buffers in SHM_DIR start with this, it is shared with everything else
+SHM_PREFIX = 'fyrd.'
+
+# clean_shm() deletes buffers older than this many seconds
+SHM_MAX_AGE = 24*60*60
+
+DEFAULT_SERIALIZER = 'dill'
+
+# Payloads smaller than this are not compressed
+MIN_COMPRESS = 64*1024
+
+# Shared objects smaller than this are not stored as blobs
+MIN_BLOB = 64*1024
+
+# The blob store, relative to the pickle files
+BLOB_DIR = '.fyrd_blobs'
+
+
+if OOB:
+    class _Pickler(_dill.Pickler):
+
+        """dill Pickler that lets numpy arrays use out-of-band buffers.
+
+        dill pickles arrays with ``ndarray.__reduce__()``, which always puts
+        the data in-band, so arrays are sent to the stock pickle instead.
+        dill adds its array hack to the class dispatch table the first time it
+        sees an array, so every instance gets a copy without it.
+        """
+
+        def __init__(self, *args, **kwargs):
+            """Initialize the pickler with a private dispatch table."""
+            _dill.Pickler.__init__(self, *args, **kwargs)
+            self.dispatch = _copy.copy(_dill.Pickler.dispatch)
+            if _np is not None:
+                self.dispatch.pop(_np.ndarray, None)
+
+        def save(self, obj, save_persistent_id=True):
+            """Skip the dill numpy hack for plain arrays."""
+            if _np is not None and type(obj) is _np.ndarray:
+                return _stdpickle._Pickler.save(self, obj, save_persistent_id)
+            return _dill.Pickler.save(self, obj, save_persistent_id)
+
+
+###############################################################################
+#                                 Serializers                                 #
+###############################################################################
+
+# name: {'dump': dump(obj, fout, buffer_callback, persistent_id),
+#        'load': load(fin, buffers, persistent_load)}
+# buffer_callback is None if out-of-band buffers are not wanted, buffers is
+# None if the file has none. persistent_id and persistent_load are only set
+# if the file references blobs, see dump().
+SERIALIZERS = _OD()
+
+
+def register(name, dump_function, load_function):
+    """Add a serializer to SERIALIZERS.
+
+    dump_function(obj, fout, buffer_callback, persistent_id) must raise an
+    Exception if obj cannot be written, in which case dill is used.
+    """
+    SERIALIZERS[name] = {'dump': dump_function, 'load': load_function}
+
+
+def _pickle_with(pickler, obj, persistent_id):
+    """Run pickler.dump(obj) with an optional persistent_id function."""
+    if persistent_id:
+        pickler.persistent_id = persistent_id
+    pickler.dump(obj)
+
+
+def _unpickle_with(unpickler_class, fin, buffers, persistent_load):
+    """Load from fin with an unpickler class."""
+    if buffers:
+        unpickler = unpickler_class(fin, buffers=buffers)
+    else:
+        unpickler = unpickler_class(fin)
+    if persistent_load:
+        unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
+
+def _dill_dump(obj, fout, buffer_callback=None, persistent_id=None):
+    """Write with dill, protocol 5 if buffer_callback."""
+    if buffer_callback:
+        pickler = _Pickler(fout, protocol=5, buffer_callback=buffer_callback)
+    else:
+        pickler = _dill.Pickler(fout)
+    _pickle_with(pickler, obj, persistent_id)
+
+
+def _dill_load(fin, buffers=None, persistent_load=None):
+    """Read with dill."""
+    return _unpickle_with(_dill.Unpickler, fin, buffers, persistent_load)
+
+
+def _pickle_dump(obj, fout, buffer_callback=None, persistent_id=None):
+    """Write with the stock pickle."""
+    if buffer_callback:
+        pickler = _stdpickle.Pickler(fout, protocol=5,
+                                     buffer_callback=buffer_callback)
+    else:
+        pickler = _stdpickle.Pickler(fout, _stdpickle.HIGHEST_PROTOCOL)
+    _pickle_with(pickler, obj, persistent_id)
+
+
+def _pickle_load(fin, buffers=None, persistent_load=None):
+    """Read with the stock pickle."""
+    return _unpickle_with(_stdpickle.Unpickler, fin, buffers,
+                          persistent_load)
+
+
+register('dill', _dill_dump, _dill_load)
+register('pickle', _pickle_dump, _pickle_load)
+
+if _cloudpickle is not None:
+    def _cloudpickle_dump(obj, fout, buffer_callback=None,
+                          persistent_id=None):
+        """Write with cloudpickle, the stock pickle reads the result."""
+        if buffer_callback:
+            pickler = _cloudpickle.CloudPickler(
+                fout, protocol=5, buffer_callback=buffer_callback
+            )
+        else:
+            pickler = _cloudpickle.CloudPickler(
+                fout, protocol=_stdpickle.HIGHEST_PROTOCOL
+            )
+        _pickle_with(pickler, obj, persistent_id)
+
+    register('cloudpickle', _cloudpickle_dump, _pickle_load)
+
+if _pa is not None:
+    def _arrow_dump(obj, fout, buffer_callback=None, persistent_id=None):
+        """Write a DataFrame as an Arrow IPC stream."""
+        if not isinstance(obj, _pd.DataFrame):
+            raise TypeError('arrow can only write DataFrames')
+        table = _pa.Table.from_pandas(obj)
+        writer = _pa.ipc.new_stream(fout, table.schema)
+        writer.write_table(table)
+        writer.close()
+
+    def _arrow_load(fin, buffers=None, persistent_load=None):
+        """Read an Arrow IPC stream into a DataFrame."""
+        return _pa.ipc.open_stream(fin).read_all().to_pandas()
+
+    register('arrow', _arrow_dump, _arrow_load)
+
+
+###############################################################################
+#                                   Codecs                                    #
+###############################################################################
+
+# name: {'compress': compress(bytes), 'decompress': decompress(bytes)}
+# In order of preference for 'auto'
+CODECS = _OD()
+
+if _zstd is not None:
+    CODECS['zstd'] = {
+        'compress': lambda data: _zstd.ZstdCompressor(level=3).compress(data),
+        'decompress': lambda data: _zstd.ZstdDecompressor().decompress(data),
+    }
+
+if _lz4 is not None:
+    CODECS['lz4'] = {
+        'compress': _lz4.compress, 'decompress': _lz4.decompress,
+    }
+
+# Level 9 (the default) is several times slower for a few percent
+CODECS['gzip'] = {
+    'compress': lambda data: _gzip.compress(data, compresslevel=3),
+    'decompress': _gzip.decompress,
+}
+
+
+def get_codec(compression):
+    """Return the codec name for compression, None for no compression.
+
+    Parameters
+    ----------
+    compression : str or None
+        A name in CODECS, 'auto' for the best available, or None/'none'.
+
+    Raises
+    ------
+    ValueError
+        If the codec is not available.
+    """
+    if not compression or compression == 'none':
+        return None
+    if compression == 'auto':
+        return list(CODECS)[0]
+    if compression not in CODECS:
+        raise ValueError('Compression {0} is not available, use one of {1}'
+                         .format(compression, list(CODECS) + ['auto']))
+    return compression
+
+
+###############################################################################
+#                               Reading/Writing                               #
+###############################################################################
+
+
+def shm_dir():
+    """Return a writable tmpfs directory or None if there isn't one."""
+    if _os.path.isdir(SHM_DIR) and _os.access(SHM_DIR, _os.W_OK):
+        return SHM_DIR
+    return None
+
+
+def shm_buffers(file_name):
+    """Return the buffers in SHM_DIR for file_name, even without its header.
+
+    Buffers are written before the pickle, so a writer that is killed can
+    leave buffers behind that the pickle never lists.
+    """
+    if not shm_dir():
+        return []
+    prefix = SHM_PREFIX + _os.path.basename(file_name) + '.'
+    return [_os.path.join(SHM_DIR, i) for i in _os.listdir(SHM_DIR)
+            if i.startswith(prefix) and i.endswith('.buf')]
+
+
+def clean_shm(max_age=SHM_MAX_AGE):
+    """Delete the buffers in SHM_DIR last written over max_age seconds ago.
+
+    Returns
+    -------
+    deleted : list
+    """
+    if not shm_dir():
+        return []
+    cutoff = _time.time() - max_age
+    deleted = []
+    for name in _os.listdir(SHM_DIR):
+        if not name.startswith(SHM_PREFIX) or not name.endswith('.buf'):
+            continue
+        path = _os.path.join(SHM_DIR, name)
+        try:
+            if _os.stat(path).st_mtime < cutoff:
+                _os.remove(path)
+                deleted.append(path)
+        except OSError:  # Removed by someone else
+            pass
+    return deleted
+
+
+def _serialize(obj, serializer, min_buffer=None, persistent_id=None):
+    """Pickle obj in memory, falling back to dill.
+
+    Parameters
+    ----------
+    obj : any
+    serializer : str
+    min_buffer : int, optional
+        Keep buffers of at least this many bytes out-of-band, None for all
+        in-band.
+    persistent_id : callable, optional
+
+    Returns
+    -------
+    serializer : str
+        The serializer actually used
+    data : BytesIO
+    buffers : list
+        The out-of-band buffers as memoryviews
+    """
+    buffers = []
+
+    def keep_inband(buf):
+        """Return True to keep a buffer in the pickle stream."""
+        raw = buf.raw()
+        if raw.nbytes < min_buffer:
+            return True
+        buffers.append(raw)
+        return False
+
+    callback = keep_inband if OOB and min_buffer is not None else None
+    data = _io.BytesIO()
+    try:
+        SERIALIZERS[serializer]['dump'](obj, data, callback, persistent_id)
+    except Exception:
+        if serializer == 'dill':
+            raise
+        serializer = 'dill'
+        del buffers[:]
+        data = _io.BytesIO()
+        SERIALIZERS[serializer]['dump'](obj, data, callback, persistent_id)
+    return serializer, data, buffers
+
+
+def _view(data):
+    """Return the contents of a BytesIO without copying if possible."""
+    return data.getbuffer() if hasattr(data, 'getbuffer') else data.getvalue()
+
+
+def dump(obj, file_name, buffer_dir=None, min_buffer=MIN_BUFFER,
+         serializer=None, compression=None, min_compress=MIN_COMPRESS,
+         blobs=None, blob_dir=None, min_blob=MIN_BLOB):
+    """Pickle obj to file_name.
+
+    Parameters
+    ----------
+    obj : any
+    file_name : str
+    buffer_dir : str, optional
+        Write buffers of at least min_buffer bytes to separate files in this
+        directory, ignored before python 3.8.
+    min_buffer : int, optional
+    serializer : str, optional
+        A name in SERIALIZERS, default dill.
+    compression : str, optional
+        A name in CODECS or 'auto', disables buffer_dir.
+    min_compress : int, optional
+        Do not compress pickles smaller than this.
+    blobs : list, optional
+        Objects within obj to store in blob_dir if they pickle to at least
+        min_blob bytes, see store_blob().
+    blob_dir : str, optional
+    min_blob : int, optional
+
+    Returns
+    -------
+    buffers : list
+        Paths to the buffer files written.
+
+    Raises
+    ------
+    ValueError
+        If the serializer or codec is not available.
+    """
+    codec = get_codec(compression)
+    if codec:
+        buffer_dir = None
+    serializer = serializer if serializer else DEFAULT_SERIALIZER
+    if serializer not in SERIALIZERS:
+        raise ValueError('Serializer {0} is not available, use one of {1}'
+                         .format(serializer, list(SERIALIZERS)))
+
+    # Write shared objects once, the pickle only holds their ids
+    blob_ids = {}
+    if blobs and blob_dir:
+        for blob in blobs:
+            if id(blob) not in blob_ids:
+                blob_ids[id(blob)] = store_blob(
+                    blob, file_name, blob_dir, serializer, min_blob,
+                    codec, min_compress
+                )
+
+    def persistent_id(obj):
+        """Return the blob id of obj or None to pickle it."""
+        return blob_ids.get(id(obj))
+
+    if not any(blob_ids.values()):
+        persistent_id = None
+
+    serializer, data, buffers = _serialize(
+        obj, serializer, min_buffer if buffer_dir else None, persistent_id
+    )
+    header = {'serializer': serializer, 'buffers': [],
+              'blobs': sorted(set([i for i in blob_ids.values() if i]))}
+    data = _view(data)
+    if codec and len(data) >= min_compress:
+        data = CODECS[codec]['compress'](data)
+        header['codec'] = codec
+    prefix = _os.path.basename(file_name) + '.'
+    if buffer_dir and _os.path.abspath(buffer_dir) == SHM_DIR:
+        prefix = SHM_PREFIX + prefix
+    for raw in buffers:
+        fd, path = _tmp.mkstemp(prefix=prefix, suffix='.buf', dir=buffer_dir)
+        with _os.fdopen(fd, 'wb') as fout:
+            fout.write(raw)
+        header['buffers'].append(_os.path.abspath(path))
+    with open(file_name, 'wb') as fout:
+        fout.write(MAGIC)
+        fout.write(_json.dumps(header).encode() + b'\n')
+        fout.write(data)
+    return header['buffers']
+
+
+def read_header(fin):
+    """Read the header from an open file, None if not a fyrd pickle.
+
+    The file is left at the start of the pickle data.
+    """
+    if fin.read(len(MAGIC)) != MAGIC:
+        fin.seek(0)
+        return None
+    return _json.loads(fin.readline().decode())
+
+
+def load(file_name, delete_buffers=False):
+    """Load an object written by dump() or by dill.
+
+    Parameters
+    ----------
+    file_name : str
+    delete_buffers : bool, optional
+        Unlink the out-of-band buffer files once mapped, the mappings stay
+        valid until the object is garbage collected.
+
+    Returns
+    -------
+    obj : any
+    """
+    with open(file_name, 'rb') as fin:
+        header = read_header(fin)
+        if not header:
+            return _dill.load(fin)
+        serializer = header['serializer']
+        codec = header.get('codec')
+        for name, known in [(serializer, SERIALIZERS), (codec, CODECS)]:
+            if name and name not in known:
+                raise ValueError('{0} was written with {1}, which is not '
+                                 'available'.format(file_name, name))
+        if codec:
+            fin = _io.BytesIO(CODECS[codec]['decompress'](fin.read()))
+        buffers = [_map(i) for i in header['buffers']]
+        if delete_buffers:
+            for path in header['buffers']:
+                _os.remove(path)
+        persistent_load = None
+        if header.get('blobs'):
+            def persistent_load(blob_id):
+                """Load a blob from the link next to this file."""
+                return load_blob(blob_link(file_name, blob_id))
+        return SERIALIZERS[serializer]['load'](fin, buffers, persistent_load)
+
+
+def _map(path):
+    """Memory map path copy-on-write."""
+    with open(path, 'rb') as fin:
+        if not _os.fstat(fin.fileno()).st_size:
+            return bytearray()
+        return _mmap.mmap(fin.fileno(), 0, access=_mmap.ACCESS_COPY)
+
+
+###############################################################################
+#                                    Blobs                                    #
+###############################################################################
+
+
+def blob_link(file_name, blob_id):
+    """Return the path to the link to blob_id for file_name."""
+    return '{0}.{1}.blob'.format(file_name, blob_id)
+
+
+def store_blob(obj, file_name, blob_dir, serializer=None, min_blob=MIN_BLOB,
+               compression=None, min_compress=MIN_COMPRESS):
+    """Write obj to the content addressed store in blob_dir once.
+
+    The blob is named by a hash of its contents, so identical objects pickled
+    for many jobs are only written once. file_name gets its own hard link to
+    the blob, the link count is the reference count, the blob is deleted with
+    the last pickle that uses it (see remove()). If hard links are not
+    supported, file_name gets a copy.
+
+    Blobs keep their large buffers inside the file, 64 byte aligned, and are
+    loaded with a single memory map, so arrays in them are not copied either.
+    Compressed blobs keep everything in the compressed pickle data.
+
+    Parameters
+    ----------
+    obj : any
+    file_name : str
+        The pickle file that will reference the blob.
+    blob_dir : str
+        The store, created if missing.
+    serializer : str, optional
+    min_blob : int, optional
+        Objects smaller than this are not stored.
+    compression : str, optional
+        A name in CODECS or 'auto'.
+    min_compress : int, optional
+
+    Returns
+    -------
+    blob_id : str or None
+        None if obj is too small to bother.
+    """
+    serializer = serializer if serializer else DEFAULT_SERIALIZER
+    codec = get_codec(compression)
+    serializer, data, buffers = _serialize(
+        obj, serializer, None if codec else MIN_BUFFER
+    )
+    data = _view(data)
+    size = len(data) + sum([i.nbytes for i in buffers])
+    if size < min_blob:
+        return None
+    if not codec or size < min_compress:
+        codec = None
+    digest = _hashlib.sha256('{0}:{1}'.format(serializer, codec).encode())
+    digest.update(data)
+    for raw in buffers:
+        digest.update(raw)
+    blob_id = digest.hexdigest()[:32]
+
+    store = _os.path.join(blob_dir, blob_id + '.blob')
+    link = blob_link(file_name, blob_id)
+    if _os.path.exists(link):
+        _os.remove(link)
+    # Another process can release the stored blob, and remove the emptied
+    # store, between the steps
+    for _ in range(3):
+        if not _os.path.isdir(blob_dir):
+            try:
+                _os.makedirs(blob_dir)
+            except OSError:  # Made by another process
+                pass
+        if not _os.path.isfile(store):
+            try:
+                _write_blob(store, serializer, data, buffers, codec)
+            except OSError:
+                if _os.path.isdir(blob_dir):
+                    raise
+                continue
+        try:
+            _os.link(store, link)
+            break
+        except AttributeError:  # No hard links on this platform
+            _shutil.copyfile(store, link)
+            break
+        except OSError:
+            if _os.path.isfile(store):  # Filesystem without hard links
+                _shutil.copyfile(store, link)
+                break
+    return blob_id
+
+
+def _write_blob(path, serializer, data, buffers, codec=None):
+    """Write a blob atomically, buffers go after the pickle data."""
+    def pad(length):
+        """Bytes needed to align length to 64."""
+        return -length % 64
+
+    if codec:
+        data = CODECS[codec]['compress'](data)
+
+    offsets = []
+    end = len(data) + pad(len(data))
+    for raw in buffers:
+        offsets.append([end, raw.nbytes])
+        end += raw.nbytes + pad(raw.nbytes)
+    header = _json.dumps({'serializer': serializer, 'size': len(data),
+                          'offsets': offsets, 'codec': codec}).encode()
+    # Pad the header so that the data starts aligned too
+    header += b' ' * pad(len(MAGIC) + len(header) + 1) + b'\n'
+    fd, tmp_path = _tmp.mkstemp(suffix='.tmp', dir=_os.path.dirname(path))
+    with _os.fdopen(fd, 'wb') as fout:
+        fout.write(MAGIC)
+        fout.write(header)
+        fout.write(data)
+        fout.write(b'\0' * pad(len(data)))
+        for raw in buffers:
+            fout.write(raw)
+            fout.write(b'\0' * pad(raw.nbytes))
+    _os.rename(tmp_path, path)
+
+
+def load_blob(path):
+    """Load a blob, its buffers point into a copy-on-write memory map."""
+    with open(path, 'rb') as fin:
+        header = read_header(fin)
+        start = fin.tell()
+    for name, known in [(header['serializer'], SERIALIZERS),
+                        (header.get('codec'), CODECS)]:
+        if name and name not in known:
+            raise ValueError('{0} was written with {1}, which is not '
+                             'available'.format(path, name))
+    mapped = _map(path)
+    if header.get('codec'):
+        data = mapped[start:start+header['size']]
+        fin = _io.BytesIO(CODECS[header['codec']]['decompress'](data))
+        return SERIALIZERS[header['serializer']]['load'](fin, None, None)
+    view = memoryview(mapped)
+    buffers = [view[start+i:start+i+j] for i, j in header['offsets']]
+    mapped.seek(start)
+    return SERIALIZERS[header['serializer']]['load'](mapped, buffers, None)
+
+
+def blob_files(file_name):
+    """Return a list of the blob links used by file_name."""
+    if not _os.path.isfile(file_name):
+        return []
+    with open(file_name, 'rb') as fin:
+        header = read_header(fin)
+    if not header:
+        return []
+    return [blob_link(file_name, i) for i in header.get('blobs', [])]
+
+
+def release_blob(link, blob_dir):
+    """Delete a blob link and the blob itself if nothing else links to it."""
+    blob_id = _os.path.basename(link).split('.')[-2]
+    if _os.path.isfile(link):
+        _os.remove(link)
+    store = _os.path.join(blob_dir, blob_id + '.blob')
+    try:
+        if _os.stat(store).st_nlink == 1:
+            _os.remove(store)
+    except OSError:  # Gone already
+        pass
+    _remove_empty(blob_dir)
+
+
+def clean_blobs(blob_dir):
+    """Delete every blob in blob_dir that no pickle links to.
+
+    Returns
+    -------
+    deleted : list
+    """
+    if not _os.path.isdir(blob_dir):
+        return []
+    deleted = []
+    for name in _os.listdir(blob_dir):
+        path = _os.path.join(blob_dir, name)
+        if name.endswith('.blob') and _os.stat(path).st_nlink == 1:
+            _os.remove(path)
+            deleted.append(path)
+    _remove_empty(blob_dir)
+    return deleted
+
+
+def _remove_empty(blob_dir):
+    """Delete blob_dir if no blobs are left in it."""
+    try:
+        _os.rmdir(blob_dir)
+    except OSError:  # Not empty or gone already
+        pass
+
+
+###############################################################################
+#                                  Cleaning                                   #
+###############################################################################
+
+
+def buffer_files(file_name):
+    """Return a list of the buffer files used by file_name."""
+    if not _os.path.isfile(file_name):
+        return []
+    with open(file_name, 'rb') as fin:
+        header = read_header(fin)
+    return header.get('buffers', []) if header else []
+
+
+def remove(file_name, blob_dir=None):
+    """Delete file_name and any of its buffer files and blob links.
+
+    Parameters
+    ----------
+    file_name : str
+    blob_dir : str, optional
+        The blob store, blobs that are not linked from anywhere else are
+        deleted from it, defaults to BLOB_DIR next to file_name.
+    """
+    if not blob_dir:
+        blob_dir = _os.path.join(_os.path.dirname(_os.path.abspath(file_name)),
+                                 BLOB_DIR)
+    for path in buffer_files(file_name):
+        if _os.path.isfile(path):
+            _os.remove(path)
+    for link in blob_files(file_name):
+        release_blob(link, blob_dir)
+    if _os.path.isfile(file_name):
+        _os.remove(file_name)
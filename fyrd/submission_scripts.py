@@ -5,7 +5,6 @@ Classes to build submission scripts.
 import os  as _os
 import sys as _sys
 import inspect as _inspect
-import dill as _pickle
 
 ###############################################################################
 #                               Import Ourself                                #
@@ -13,8 +12,13 @@ import dill as _pickle
 
 from . import run as _run
 from . import logme as _logme
+from . import serialize as _serialize
 from . import script_runners as _scrpts
 
+# The runner script embeds the serialize module
+with open(_os.path.splitext(_serialize.__file__)[0] + '.py') as _fin:
+    SERIALIZE_SOURCE = _fin.read()
+
 
 class Script(object):
 
@@ -70,7 +74,9 @@ class Function(Script):
     """A special Script used to run a function."""
 
     def __init__(self, file_name, function, args=None, kwargs=None,
-                 imports=None, syspaths=None, pickle_file=None, outfile=None):
+                 imports=None, syspaths=None, pickle_file=None, outfile=None,
+                 in_buffer_dir=None, out_buffer_dir=None, serializer=None,
+                 compression=None, blob_dir=None):
         """Create a function wrapper.
 
         NOTE: Function submission will fail if the parent file's code is not
@@ -97,12 +103,31 @@ class Function(Script):
             The file to hold the function.
         outfile : str, optional
             The file to hold the output.
+        in_buffer_dir : str, optional
+            Write large buffers in the arguments to memory mappable files in
+            this directory, the runner maps them instead of reading them.
+        out_buffer_dir : str, optional
+            Write large buffers in the output to memory mappable files in this
+            directory, e.g. a tmpfs for jobs running on this machine.
+        serializer : str, optional
+            The fyrd.serialize serializer to write the function, arguments and
+            output with, default dill.
+        compression : str, optional
+            A fyrd.serialize codec to compress the input and output pickles
+            with, or 'auto' for the best available.
+        blob_dir : str, optional
+            Store the function and large arguments in this content addressed
+            store, so jobs that share them only write them once.
         """
         _logme.log('Building Function for {}'.format(function), 'debug')
         self.function = function
         self.parent   = _inspect.getmodule(function)
         self.args     = args
         self.kwargs   = kwargs
+        self.in_buffer_dir = in_buffer_dir
+        self.serializer = serializer
+        self.compression = compression
+        self.blob_dir = blob_dir
 
         ##########################
         #  Take care of imports  #
@@ -133,15 +158,29 @@ class Function(Script):
                                              modimpstr=func_import,
                                              imports=impts,
                                              pickle_file=self.pickle_file,
-                                             out_file=self.outfile)
+                                             out_file=self.outfile,
+                                             out_buffer_dir=out_buffer_dir,
+                                             serializer=serializer,
+                                             compression=compression,
+                                             serialize_source=SERIALIZE_SOURCE)
 
         super(Function, self).__init__(file_name, script)
 
     def write(self, overwrite=True):
         """Write the pickle file and call the parent Script write function."""
         _logme.log('Writing pickle file {}'.format(self.pickle_file), 'debug')
-        with open(self.pickle_file, 'wb') as fout:
-            _pickle.dump((self.function, self.args, self.kwargs), fout)
+        blobs = [self.function]
+        if isinstance(self.args, (list, tuple)):
+            blobs += list(self.args)
+        elif self.args is not None:
+            blobs.append(self.args)
+        if self.kwargs:
+            blobs += list(self.kwargs.values())
+        _serialize.dump((self.function, self.args, self.kwargs),
+                        self.pickle_file, buffer_dir=self.in_buffer_dir,
+                        serializer=self.serializer,
+                        compression=self.compression, blobs=blobs,
+                        blob_dir=self.blob_dir)
         super(Function, self).write(overwrite)
 
     def clean(self, delete_output=False):
@@ -156,7 +195,7 @@ class Function(Script):
             if _os.path.isfile(self.pickle_file):
                 _logme.log('Function: Deleting {}'.format(self.pickle_file),
                            'debug')
-                _os.remove(self.pickle_file)
+                _serialize.remove(self.pickle_file, blob_dir=self.blob_dir)
             else:
                 _logme.log('Function: {} already gone'
                            .format(self.pickle_file), 'debug')
@@ -164,7 +203,7 @@ class Function(Script):
                 if _os.path.isfile(self.outfile):
                     _logme.log('Function: Deleting {}'.format(self.outfile),
                                'debug')
-                    _os.remove(self.outfile)
+                    _serialize.remove(self.outfile)
                 else:
                     _logme.log('Function: {} already gone'
                                .format(self.outfile), 'debug')
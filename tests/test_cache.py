@@ -0,0 +1,102 @@
+"""Test the function result cache."""
+import os
+import sys
+import shutil
+sys.path.append(os.path.abspath('.'))
+import fyrd
+from fyrd import cache
+
+CACHE_DIR = os.path.abspath('cache_test')
+
+
+def raise_me(number, power=2):
+    """Raise number to power."""
+    return number**power
+
+
+def call_me(function, number):
+    """Return function(number)."""
+    return function(number)
+
+
+def make_function(body):
+    """Define a function called square with body, like an edited file."""
+    env = {}
+    exec('def square(x):\n    return {0}\n'.format(body), env)
+    return env['square']
+
+
+def test_keys():
+    """Keys change with the function code and arguments, not the object."""
+    key = cache.make_key(raise_me, (2,), {'power': 3})
+    assert key == cache.make_key(raise_me, (2,), {'power': 3})
+    assert key != cache.make_key(raise_me, (2,), {'power': 4})
+    assert key != cache.make_key(raise_me, (3,), {'power': 3})
+    first, same, edited = [make_function(i) for i in ['x*x', 'x*x', 'x**2']]
+    assert cache.function_hash(first) == cache.function_hash(same)
+    assert cache.function_hash(first) != cache.function_hash(edited)
+    # Functions passed as arguments are hashed by code too
+    assert (cache.make_key(call_me, (first, 2))
+            == cache.make_key(call_me, (same, 2)))
+    assert (cache.make_key(call_me, (first, 2))
+            != cache.make_key(call_me, (edited, 2)))
+
+
+def test_eviction():
+    """Least recently used results are evicted past max_size."""
+    results = cache.ResultCache(CACHE_DIR, max_size=1)
+    try:
+        data = b'x' * 400000
+        assert results.put('a'*32, data)
+        assert not results.put('a'*32, data)
+        assert results.put('b'*32, data)
+        assert results.get('a'*32) == (True, data)
+        # The third entry pushes the cache past 1MB, b was used least recently
+        results.put('c'*32, data)
+        assert results.get('b'*32) == (False, None)
+        assert results.get('a'*32)[0]
+        assert not os.path.exists(results.path('b'*32))
+        stats = results.stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 1
+        assert stats['evictions'] == 1
+        assert stats['entries'] == 2
+        results.clear(reset_stats=True)
+        assert results.stats()['size'] == 0
+        assert results.stats()['hits'] == 0
+    finally:
+        shutil.rmtree(CACHE_DIR)
+
+
+def test_cached_job():
+    """A rerun job completes from the cache without being submitted."""
+    fyrd.conf.set_option('cache', 'location', CACHE_DIR)
+    try:
+        job = fyrd.Job(raise_me, (7,), cache=True, clean_files=True,
+                       clean_outputs=True, qtype='inline').submit()
+        assert not job.cached
+        assert job.get() == 49
+        assert cache.stats()['entries'] == 1
+        job2 = fyrd.Job(raise_me, (7,), cache=True, clean_files=True,
+                        clean_outputs=True, qtype='inline').submit()
+        assert job2.cached
+        assert job2.id is None
+        assert not os.path.exists(job2.function.pickle_file)
+        assert job2.get() == 49
+        assert job2.exitcode == 0
+        # Dependent jobs run straight away
+        job3 = fyrd.Job(raise_me, (8,), cache=True, depends=job2,
+                        clean_files=True, clean_outputs=True,
+                        qtype='inline').submit()
+        assert job3.get() == 64
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses']) == (1, 2)
+        # Off by default
+        job4 = fyrd.Job(raise_me, (7,), clean_files=True,
+                        clean_outputs=True, qtype='inline').submit()
+        assert not job4.cached
+        assert job4.get() == 49
+    finally:
+        fyrd.conf.set_option('cache', 'location',
+                             fyrd.conf.DEFAULTS['cache']['location'])
+        shutil.rmtree(CACHE_DIR)
@@ -0,0 +1,578 @@
+"""Test the in-process inline batch system."""
+import os
+import sys
+import time
+import pytest
+
+sys.path.append(os.path.abspath('.'))
+import fyrd
+from fyrd.batch_systems import inline
+
+fyrd.logme.MIN_LEVEL = 'debug'
+
+
+def raise_me(number, power=2):
+    """Raise number to power."""
+    return number**power
+
+
+def raise_error(message):
+    """Raise a ValueError with message."""
+    raise ValueError(message)
+
+
+def echo(obj):
+    """Return obj."""
+    return obj
+
+
+def test_script_job():
+    """Run a shell command inline."""
+    job = fyrd.Job('echo hi', profile='default', clean_files=True,
+                   clean_outputs=True, qtype='inline').submit()
+    assert job.qtype == 'inline'
+    out = job.get()
+    assert job.exitcode == 0
+    assert out == 'hi\n'
+    assert job.stderr == ''
+
+
+def test_function_job():
+    """Run a function inline."""
+    job = fyrd.Job(raise_me, (10,), kwargs={'power': 3}, clean_files=True,
+                   clean_outputs=True, qtype='inline').submit()
+    assert job.get() == 1000
+    assert job.exitcode == 0
+
+
+def test_function_exception():
+    """A function job that raises fails and get() raises its exception."""
+    job = fyrd.Job(raise_error, ('inline error',), clean_files=True,
+                   clean_outputs=True, qtype='inline').submit()
+    with pytest.raises(ValueError, match='inline error'):
+        job.get()
+    assert inline._JOBS[int(job.id)].state == 'failed'
+    assert not os.path.exists(job.poutfile)
+    assert not os.path.exists(job.function.pickle_file)
+
+
+def test_depends():
+    """Dependent jobs start only after their dependencies finish."""
+    job = fyrd.Job('sleep 2; echo one', profile='default', clean_files=True,
+                   clean_outputs=True, qtype='inline').submit()
+    job2 = fyrd.Job('echo two', profile='default', clean_files=True,
+                    clean_outputs=True, depends=job,
+                    qtype='inline').submit()
+    assert inline._JOBS[int(job2.id)].state == 'pending'
+    assert job2.get() == 'two\n'
+    assert job.get() == 'one\n'
+
+
+def test_depends_failed():
+    """Jobs that depend on a failed job are killed rather than run."""
+    job = fyrd.Job('sleep 1; exit 1', profile='default', clean_files=True,
+                   clean_outputs=True, qtype='inline').submit()
+    job2 = fyrd.Job('echo two', profile='default', clean_files=True,
+                    clean_outputs=True, depends=job,
+                    qtype='inline').submit()
+    job3 = fyrd.Job('echo three', profile='default', clean_files=True,
+                    clean_outputs=True, depends=job2,
+                    qtype='inline').submit()
+    job.wait()
+    assert inline._JOBS[int(job.id)].state == 'failed'
+    assert inline._JOBS[int(job2.id)].state == 'killed'
+    assert inline._JOBS[int(job3.id)].state == 'killed'
+    assert int(job.id) not in inline._DEPENDENTS
+    assert int(job2.id) not in inline._DEPENDENTS
+    for jb in [job, job2, job3]:
+        jb.clean(delete_outputs=True, get_outputs=False)
+
+
+def test_kill():
+    """Kill a running job."""
+    job = fyrd.Job('sleep 30', profile='default', clean_files=True,
+                   clean_outputs=True, qtype='inline').submit()
+    assert inline.kill(job.id)
+    assert inline._JOBS[int(job.id)].state == 'killed'
+    states = {i[0]: i[5] for i in inline.queue_parser()}
+    assert states[job.id] == 'killed'
+    job.clean(delete_outputs=True)
+
+
+def test_kill_starting(monkeypatch):
+    """A job killed after it is marked running never starts its command."""
+    def kill_on_open(path, mode='r'):
+        """Open path after killing every running job."""
+        running = [i for i, j in inline._JOBS.items() if j.state == 'running']
+        inline.kill(running)
+        return open(path, mode)
+
+    monkeypatch.setattr(inline, 'open', kill_on_open, raising=False)
+    job = fyrd.Job('touch kill_test.flag', profile='default',
+                   clean_files=True, clean_outputs=True,
+                   qtype='inline').submit()
+    inline._JOBS[int(job.id)].future.result()
+    monkeypatch.undo()
+    assert inline._JOBS[int(job.id)].state == 'killed'
+    assert inline._JOBS[int(job.id)].process is None
+    assert not os.path.exists('kill_test.flag')
+    job.clean(delete_outputs=True, get_outputs=False)
+
+
+def make_array(length):
+    """Return a numpy array."""
+    import numpy as np
+    return np.arange(length, dtype=float)
+
+
+def test_shm_transport():
+    """Large function outputs come back through shared memory."""
+    np = pytest.importorskip('numpy')
+    if not fyrd.serialize.OOB or not fyrd.serialize.shm_dir():
+        pytest.skip('Needs pickle protocol 5 and /dev/shm')
+    fyrd.conf.set_option('jobs', 'result_transport', 'shm')
+    try:
+        job = fyrd.Job(make_array, (500000,), clean_files=True,
+                       clean_outputs=True, qtype='inline').submit()
+        job.wait()
+        buffers = fyrd.serialize.buffer_files(job.poutfile)
+        assert buffers
+        assert all([i.startswith(fyrd.serialize.SHM_DIR) for i in buffers])
+        out = job.get()
+        assert not any([os.path.exists(i) for i in buffers])
+        assert (out == np.arange(500000, dtype=float)).all()
+    finally:
+        fyrd.conf.set_option('jobs', 'result_transport', 'file')
+
+
+def test_shm_cleanup():
+    """Shared memory buffers without a pickle or past the cutoff go."""
+    pytest.importorskip('numpy')
+    if not fyrd.serialize.OOB or not fyrd.serialize.shm_dir():
+        pytest.skip('Needs pickle protocol 5 and /dev/shm')
+    fyrd.conf.set_option('jobs', 'result_transport', 'shm')
+    try:
+        job = fyrd.Job(make_array, (500000,), clean_files=True,
+                       clean_outputs=True, qtype='inline').submit()
+        job.wait()
+        buffers = fyrd.serialize.shm_buffers(job.poutfile)
+        assert buffers
+        assert all([os.path.basename(i).startswith(
+            fyrd.serialize.SHM_PREFIX) for i in buffers])
+        # As if the runner was killed before it wrote the pickle
+        os.remove(job.poutfile)
+        job.clean(delete_outputs=True, get_outputs=False)
+        assert not any([os.path.exists(i) for i in buffers])
+    finally:
+        fyrd.conf.set_option('jobs', 'result_transport', 'file')
+    prefix = os.path.join(fyrd.serialize.SHM_DIR,
+                          fyrd.serialize.SHM_PREFIX + 'shm_test.')
+    for age in ['old', 'new']:
+        with open(prefix + age + '.buf', 'w') as fout:
+            fout.write(age)
+    os.utime(prefix + 'old.buf', (1, 1))
+    assert fyrd.serialize.clean_shm(3600) == [prefix + 'old.buf']
+    assert os.path.exists(prefix + 'new.buf')
+    os.remove(prefix + 'new.buf')
+
+
+def test_out_of_band_sidecars():
+    """Large arguments and outputs are written as sidecar files."""
+    np = pytest.importorskip('numpy')
+    if not fyrd.serialize.OOB:
+        pytest.skip('Needs pickle protocol 5')
+    array = np.arange(500000, dtype=float)
+    fyrd.conf.set_option('jobs', 'dedup', False)
+    try:
+        job = fyrd.Job(raise_me, (array,), clean_files=True,
+                       clean_outputs=True, qtype='inline').submit()
+    finally:
+        fyrd.conf.set_option('jobs', 'dedup', True)
+    job.wait()
+    in_buffers = fyrd.serialize.buffer_files(job.function.pickle_file)
+    out_buffers = fyrd.serialize.buffer_files(job.poutfile)
+    assert len(in_buffers) == 1
+    assert len(out_buffers) == 1
+    assert os.path.dirname(out_buffers[0]) == os.path.dirname(
+        os.path.abspath(job.poutfile))
+    assert (job.get() == array**2).all()
+    assert not any([os.path.exists(i) for i in in_buffers + out_buffers])
+
+
+def test_serializer_keyword():
+    """The serializer keyword sets how function files are written."""
+    job = fyrd.Job(raise_me, (4,), serializer='pickle', clean_files=False,
+                   clean_outputs=True, qtype='inline').submit()
+    job.wait()
+    for pfile in [job.function.pickle_file, job.poutfile]:
+        with open(pfile, 'rb') as fin:
+            assert fyrd.serialize.read_header(fin)['serializer'] == 'pickle'
+    assert job.get() == 16
+    job.clean(delete_outputs=True)
+    with pytest.raises(fyrd.ClusterError):
+        fyrd.Job(raise_me, (4,), serializer='bob',
+                 qtype='inline').gen_scripts()
+
+
+def test_compression(tmp_path):
+    """Function pickles are compressed if compression is set."""
+    fyrd.conf.set_option('jobs', 'compression', 'gzip')
+    try:
+        job = fyrd.Job(echo, (['ab'] * 100000,), clean_files=False,
+                       clean_outputs=True, scriptpath=str(tmp_path),
+                       qtype='inline').submit()
+        job.wait()
+        # The argument is big enough to go in a blob
+        pfiles = fyrd.serialize.blob_files(job.function.pickle_file)
+        for pfile in pfiles + [job.poutfile]:
+            with open(pfile, 'rb') as fin:
+                assert fyrd.serialize.read_header(fin)['codec'] == 'gzip'
+        assert job.get() == ['ab'] * 100000
+        job.clean(delete_outputs=True)
+        assert not os.path.exists(
+            os.path.join(str(tmp_path), fyrd.serialize.BLOB_DIR)
+        )
+    finally:
+        fyrd.conf.set_option('jobs', 'compression', None)
+
+
+def test_dedup(tmp_path):
+    """Jobs sharing a large argument store it once."""
+    np = pytest.importorskip('numpy')
+    array = np.arange(500000, dtype=float)
+    jobs = [fyrd.Job(raise_me, (array, i), clean_files=True,
+                     clean_outputs=True, scriptpath=str(tmp_path),
+                     qtype='inline').submit()
+            for i in range(1, 4)]
+    links = [fyrd.serialize.blob_files(j.function.pickle_file) for j in jobs]
+    assert all([len(i) == 1 for i in links])
+    blob_id = os.path.basename(links[0][0]).split('.')[-2]
+    assert all([os.path.basename(i[0]).split('.')[-2] == blob_id
+                for i in links])
+    store = os.path.join(jobs[0].scriptpath, fyrd.serialize.BLOB_DIR,
+                         blob_id + '.blob')
+    assert os.stat(store).st_nlink == 4
+    for power, job in enumerate(jobs, 1):
+        assert (job.get() == array**power).all()
+    assert not os.path.exists(store)
+    assert not os.path.exists(os.path.dirname(store))
+
+
+def count_or_fail(infile, flag):
+    """Count lines in infile, the second split fails while flag exists."""
+    with open(flag + '.calls', 'a') as fout:
+        fout.write(infile + '\n')
+    if os.path.exists(flag) and '.split_0002.' in infile:
+        raise ValueError('Failing on purpose')
+    with fyrd.run.open_zipped(infile) as fin:
+        return len(fin.readlines())
+
+
+def test_splitrun_resume():
+    """A resumed splitrun only reruns the jobs that failed."""
+    infile = os.path.join('tests', 'test.txt.gz')
+    manifest = os.path.abspath('test.txt.gz.resume.manifest')
+    open('resume_flag', 'w').close()
+    try:
+        with pytest.raises(ValueError):
+            fyrd.helpers.splitrun(
+                2, infile, False, count_or_fail, ('{file}', 'resume_flag'),
+                name='resume', qtype='inline', resume=True
+            )
+    finally:
+        os.remove('resume_flag')
+    assert os.path.isfile(manifest)
+    splits = [os.path.abspath('test.txt.gz.split_000{0}.gz'.format(i))
+              for i in [1, 2]]
+    assert os.path.isfile(splits[0] + '.result')
+    assert not os.path.isfile(splits[1] + '.result')
+    out = fyrd.helpers.splitrun(
+        2, infile, False, count_or_fail, ('{file}', 'resume_flag'),
+        name='resume', qtype='inline', resume=True
+    )
+    with fyrd.run.open_zipped(infile) as fin:
+        assert sum(out) == len(fin.readlines())
+    with open('resume_flag.calls') as fin:
+        calls = fin.read().split()
+    os.remove('resume_flag.calls')
+    assert sorted(calls[:2]) == splits
+    assert calls[2:] == [splits[1]]
+    assert not os.path.exists(manifest)
+    assert not any([os.path.exists(i) for i in splits])
+    assert not any([os.path.exists(i + '.result') for i in splits])
+
+
+def count_lines(infile):
+    """Count the lines in infile."""
+    with fyrd.run.open_zipped(infile) as fin:
+        return len(fin.readlines())
+
+
+def test_splitrun_bytes():
+    """Split by byte ranges without copying the file."""
+    with open('bytes_test.txt', 'w') as fout:
+        fout.write('head\n' + ''.join(['{0}\n'.format(i) for i in range(999)]))
+    try:
+        out = fyrd.helpers.splitrun(
+            3, 'bytes_test.txt', True, count_lines, ('{file}',),
+            qtype='inline', split_mode='bytes'
+        )
+        # Every job gets the header
+        assert sum(out) == 999 + 3
+        assert not [i for i in os.listdir('.') if '.range_' in i]
+        fyrd.helpers.splitrun(
+            3, 'bytes_test.txt', False, 'tail -n 1 {file} > {outfile}',
+            qtype='inline', split_mode='bytes', outfile='bytes_test.out'
+        )
+        # Ranges split by size, not line count
+        with open('bytes_test.out') as fin:
+            ends = [int(i) for i in fin.read().split()]
+        assert len(ends) == 3
+        assert ends == sorted(ends)
+        assert ends[-1] == 998
+    finally:
+        os.remove('bytes_test.txt')
+        os.remove('bytes_test.out')
+        for fl in os.listdir('.'):
+            if fl.startswith('bytes_test.txt.range_'):
+                os.remove(fl)
+
+
+def sorted_lines(infile):
+    """Return the sorted lines of infile as integers."""
+    with fyrd.run.open_zipped(infile) as fin:
+        return sorted([int(i) for i in fin])
+
+
+def add(first, second):
+    """Add two numbers."""
+    return first + second
+
+
+def test_splitrun_merge():
+    """Merge outputs by concatenation, sorted merge or a running reduce."""
+    with open('merge_test.txt', 'w') as fout:
+        fout.write(''.join(['{0}\n'.format(i) for i in range(300, 0, -1)]))
+    try:
+        out = fyrd.helpers.splitrun(
+            3, 'merge_test.txt', False, sorted_lines, ('{file}',),
+            qtype='inline', merge='sorted'
+        )
+        assert out == list(range(1, 301))
+        out = fyrd.helpers.splitrun(
+            3, 'merge_test.txt', False, count_lines, ('{file}',),
+            qtype='inline', merge='reduce', merge_func=add
+        )
+        assert out == 300
+        for merge in ['concat', 'sorted']:
+            fyrd.helpers.splitrun(
+                3, 'merge_test.txt', False,
+                '(echo num; sort -n {file}) > {outfile}',
+                qtype='inline', outfile='merge_test.out', outheader=True,
+                merge=merge, merge_key=int
+            )
+            with open('merge_test.out') as fin:
+                lines = fin.read().split()
+            assert lines[0] == 'num'
+            assert sorted(lines[1:], key=int) == [str(i)
+                                                  for i in range(1, 301)]
+            if merge == 'sorted':
+                assert lines[1:] == [str(i) for i in range(1, 301)]
+        with pytest.raises(ValueError):
+            fyrd.helpers.splitrun(3, 'merge_test.txt', False, count_lines,
+                                  ('{file}',), qtype='inline', merge='reduce')
+    finally:
+        os.remove('merge_test.txt')
+        os.remove('merge_test.out')
+
+
+def slow_count(infile, delay):
+    """Count the lines in infile, taking delay seconds per line."""
+    import time
+    with fyrd.run.open_zipped(infile) as fin:
+        lines = len(fin.readlines())
+    time.sleep(lines*delay)
+    return lines
+
+
+def test_splitrun_auto():
+    """Pick the number of jobs from the runtime of a pilot job."""
+    with open('auto_test.txt', 'w') as fout:
+        fout.write(''.join(['{0}\n'.format(i) for i in range(1000)]))
+    fyrd.conf.set_option('split', 'target_runtime', 1)
+    try:
+        # Quick work is not worth splitting
+        out = fyrd.helpers.splitrun(
+            'auto', 'auto_test.txt', False, count_lines, ('{file}',),
+            qtype='inline'
+        )
+        assert out == [1000]
+        # About 5 seconds of work, so about 5 jobs
+        out = fyrd.helpers.splitrun(
+            'auto', 'auto_test.txt', False, slow_count, ('{file}', 0.005),
+            qtype='inline'
+        )
+        assert sum(out) == 1000
+        assert 4 <= len(out) <= 7
+        assert not [i for i in os.listdir('.') if '.pilot.' in i]
+    finally:
+        fyrd.conf.set_option('split', 'target_runtime',
+                             fyrd.conf.DEFAULTS['split']['target_runtime'])
+        os.remove('auto_test.txt')
+
+
+class TimedJob(object):
+
+    """A stand in for a Job that runs for a set time."""
+
+    def __init__(self, name, runtime, state='completed'):
+        """Finish with state runtime seconds from now."""
+        self.name   = name
+        self.end    = time.time() + runtime
+        self.final  = state
+        self.killed = False
+
+    @property
+    def done(self):
+        """Finished or killed."""
+        return self.killed or time.time() >= self.end
+
+    @property
+    def state(self):
+        """The state a Job would have."""
+        if self.killed:
+            return 'killed'
+        return self.final if self.done else 'running'
+
+    def kill(self, confirm=True):
+        """Stop running."""
+        self.killed = True
+
+    def clean(self, delete_outputs=None, get_outputs=True):
+        """Nothing to delete."""
+        pass
+
+    def get(self):
+        """Return the name."""
+        return self.name
+
+
+def test_speculate():
+    """Run stragglers again and use whichever copy finishes first."""
+    fyrd.conf.set_option('queue', 'sleep_len', 0.05)
+    try:
+        outs = [TimedJob('fast', 0.2), TimedJob('slow', 60),
+                TimedJob('failing', 60, 'failed'), TimedJob('fast', 0.2),
+                TimedJob('fast', 0.3), None]
+        copies = []
+
+        def duplicate(index):
+            """Copy outs[index], the copy takes a second."""
+            copies.append(TimedJob('copy', 1))
+            return copies[-1]
+
+        # No copies before speculate_after of the jobs are done
+        fyrd.conf.set_option('split', 'speculate_after', 0.9)
+        gathered = fyrd.helpers._gather(outs, duplicate=duplicate)
+        assert next(gathered)[0].get() == 'fast'
+        outs[1].end = outs[2].end = time.time()
+        assert [i[0].get() if i[0] else None for i in gathered] == [
+            'slow', 'failing', 'fast', 'fast', None
+        ]
+        assert not copies
+
+        # The copy of a failed job can still win
+        outs = [TimedJob('fast', 0.2), TimedJob('slow', 60),
+                TimedJob('failing', 1.5, 'failed'), TimedJob('fast', 0.2),
+                TimedJob('fast', 0.3)]
+        fyrd.conf.set_option('split', 'speculate_after', 0.5)
+        start = time.time()
+        out = [i[0].get() for i in
+               fyrd.helpers._gather(outs, duplicate=duplicate)]
+        assert out == ['fast', 'copy', 'copy', 'fast', 'fast']
+        assert time.time() - start < 30
+        assert outs[1].killed
+        assert outs[2].state in ('failed', 'killed')
+        assert len(copies) == 2
+    finally:
+        fyrd.conf.set_option('split', 'speculate_after',
+                             fyrd.conf.DEFAULTS['split']['speculate_after'])
+        fyrd.conf.set_option('queue', 'sleep_len',
+                             fyrd.conf.DEFAULTS['queue']['sleep_len'])
+
+
+def test_splitrun_speculate():
+    """Speculative runs do not change the output."""
+    with open('spec_test.txt', 'w') as fout:
+        fout.write(''.join(['{0}\n'.format(i) for i in range(100)]))
+    try:
+        out = fyrd.helpers.splitrun(
+            3, 'spec_test.txt', False, 'wc -l < {file} > {outfile}',
+            qtype='inline', outfile='spec_test.out', speculate=True
+        )
+        with open(out) as fin:
+            assert sum([int(i) for i in fin]) == 100
+        assert not [i for i in os.listdir('.') if '.spec' in i
+                    and i.startswith('spec_test.txt')]
+    finally:
+        os.remove('spec_test.txt')
+        os.remove('spec_test.out')
+
+
+def count_words(text):
+    """Yield every word in text with a count of 1."""
+    for word in text.split():
+        yield word, 1
+
+
+def add_counts(key, values):
+    """Return the sum of values."""
+    return sum(values)
+
+
+def bad_mapper(text):
+    """Fail on the second input."""
+    if text == 'fail':
+        raise ValueError('bad input')
+    return count_words(text)
+
+
+def test_mapreduce():
+    """Count words with a map, a shuffle by key and a reduce."""
+    texts = ['a b c a', 'b b d', 'c a e e e', '']
+    expected = {'a': 3, 'b': 3, 'c': 2, 'd': 1, 'e': 3}
+    out = fyrd.mapreduce(texts, count_words, add_counts, partitions=3,
+                         qtype='inline')
+    results = list(out)
+    assert dict(results) == expected
+    assert len(results) == len(expected)
+    # Keys are in one partition only and sorted within it
+    parts = [fyrd.helpers._partition(i[0], 3) for i in results]
+    assert parts == sorted(parts)
+    assert not [i for i in os.listdir(fyrd.conf.get_job_paths({})[3])
+                if i.startswith('mapreduce.') and '.map_' in i]
+    # Combiners give the same result
+    out = fyrd.mapreduce(texts, count_words, add_counts, combiner=add_counts,
+                         qtype='inline', name='mr_test')
+    assert dict(out) == expected
+    # Calls with the same name can be read at the same time
+    first = fyrd.mapreduce(texts, count_words, add_counts, partitions=2,
+                           qtype='inline')
+    second = fyrd.mapreduce(texts[:2], count_words, add_counts,
+                            partitions=2, qtype='inline')
+    first_out, second_out = [next(first)], [next(second)]
+    first_out += list(first)
+    second_out += list(second)
+    assert dict(first_out) == expected
+    assert dict(second_out) == {'a': 2, 'b': 3, 'c': 1, 'd': 1}
+    with pytest.raises(ValueError):
+        fyrd.mapreduce(texts, count_words, add_counts, partitions=0,
+                       qtype='inline')
+    # The mapper error is raised and the spill files are deleted
+    with pytest.raises(ValueError):
+        list(fyrd.mapreduce(['a', 'fail'], bad_mapper, add_counts,
+                            qtype='inline', name='mr_fail'))
+    assert not [i for i in os.listdir(fyrd.conf.get_job_paths({})[3])
+                if i.startswith('mr_fail.') and '.map_' in i]
+    # Reducers are killed rather than run on missing spills
+    assert not [i for i in os.listdir('.') if i.startswith('mr_fail_')]
@@ -1,6 +1,9 @@
 """Test remote queues, we can't test local queues in py.test."""
 import os
 import sys
+import time
+import signal
+import subprocess
 from datetime import datetime as dt
 from datetime import timedelta as td
 import pytest
@@ -53,6 +56,11 @@ def dosomething(x):
     return out
 
 
+def raise_error(message):
+    """Raise a ValueError with message."""
+    raise ValueError(message)
+
+
 def dosomethingbad(x):
     """Try to operate on a file, but do it stupidly."""
     out = []
@@ -149,6 +157,162 @@ def test_multi_job_get():
     assert not os.path.isfile(job2.outfile)
 
 
+@pytest.mark.skipif(not env,
+                    reason="No valid batch system detected")
+def test_queue_changes():
+    """Get only the changed jobs from the server."""
+    local = fyrd.batch_systems.get_batch_system('local')
+    token, full, _, jobs = local.queue_changes()
+    assert full
+    job = fyrd.Job('echo hi', profile='default', clean_files=True,
+                   clean_outputs=True, qtype='local').submit()
+    token2, full, _, jobs = local.queue_changes(token)
+    assert not full
+    assert token2[0] == token[0]
+    assert token2[1] > token[1]
+    assert [j[0] for j in jobs] == [job.id]
+    token3, full, _, jobs = local.queue_changes((token2[0], token2[1] + 1000))
+    assert full
+    assert job.get() == 'hi\n'
+
+
+@pytest.mark.skipif(not env,
+                    reason="No valid batch system detected")
+def test_queue_changes_restart():
+    """Tokens from before a restart of the server get every job."""
+    local = fyrd.batch_systems.get_batch_system('local')
+    job = fyrd.Job('sleep 30', profile='default', clean_files=True,
+                   clean_outputs=True, qtype='local').submit()
+    token = local.queue_changes()[0]
+    local.kill_queue()
+    # A process that started the server cannot start it again, so restart it
+    # from another one, it marks the job killed reusing change numbers
+    subprocess.check_call([sys.executable, '-c',
+                           'from fyrd.batch_systems import local; '
+                           'local.get_server()'])
+    token2, full, _, jobs = local.queue_changes(token)
+    assert full
+    assert token2[0] != token[0]
+    assert [j[5] for j in jobs if j[0] == job.id] == ['killed']
+    token3, full, _, jobs = local.queue_changes(token2)
+    assert not full
+    assert token3 == token2
+    assert jobs == []
+
+
+@pytest.mark.skipif(not env,
+                    reason="No valid batch system detected")
+def test_start_daemon_dies(monkeypatch):
+    """Starting fails straight away if the daemon dies after forking."""
+    local = fyrd.batch_systems.get_batch_system('local')
+    check_runner = local.QueueManager.check_runner
+
+    def check_and_die(self):
+        """Start the job_runner, save its pid and kill the daemon."""
+        check_runner(self)
+        with open('runner_test.pid', 'w') as fout:
+            fout.write(str(self._job_runner.pid))
+        os._exit(1)
+
+    local.kill_queue()
+    monkeypatch.setattr(local.QueueManager, 'check_runner', check_and_die)
+    monkeypatch.setattr(local, '_WE_ARE_A_SERVER', True)
+    start = time.time()
+    try:
+        assert local._start() == 1
+        assert time.time() - start < local.START_TIMEOUT/2
+    finally:
+        monkeypatch.undo()
+        if os.path.isfile('runner_test.pid'):
+            with open('runner_test.pid') as fin:
+                pid = int(fin.read())
+            os.remove('runner_test.pid')
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        for fl in [local.PID_FILE, local.URI_FILE]:
+            if os.path.isfile(fl):
+                os.remove(fl)
+
+
+def test_database_migration():
+    """Upgrade a local queue database from before schema versioning."""
+    import sqlite3
+    local = fyrd.batch_systems.get_batch_system('local')
+    db_file = 'old_local_queue.db'
+    if os.path.isfile(db_file):
+        os.remove(db_file)
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        'CREATE TABLE jobs (jobno INTEGER PRIMARY KEY, name VARCHAR NOT NULL, '
+        'command VARCHAR NOT NULL, submit_time DATETIME NOT NULL, '
+        'threads INTEGER NOT NULL, state VARCHAR NOT NULL, exitcode INTEGER, '
+        'pid INTEGER, runpath VARCHAR, outfile VARCHAR, errfile VARCHAR)'
+    )
+    conn.execute("INSERT INTO jobs VALUES (7, 'old', 'echo hi', "
+                 "'2018-01-01 00:00:00.000000', 1, 'completed', 0, 1, "
+                 "NULL, NULL, NULL)")
+    conn.commit()
+    conn.close()
+    db = local.LocalQueue(db_file)
+    assert db.schema_version == local.SCHEMA_VERSION
+    assert db.migrate() == local.SCHEMA_VERSION
+    conn = sqlite3.connect(db_file)
+    columns = [i[1] for i in conn.execute('PRAGMA table_info(jobs)')]
+    indexes = [i[1] for i in conn.execute('PRAGMA index_list(jobs)')]
+    jobs = conn.execute('SELECT jobno, name FROM jobs').fetchall()
+    conn.close()
+    os.remove(db_file)
+    assert 'change_seq' in columns
+    assert 'ix_jobs_state' in indexes
+    assert 'ix_jobs_submit_time' in indexes
+    assert jobs == [(7, 'old')]
+
+
+def test_max_mem():
+    """Get the memory available to local jobs from the config."""
+    local = fyrd.batch_systems.get_batch_system('local')
+    old = fyrd.conf.get_option('local', 'max_mem')
+    try:
+        fyrd.conf.set_option('local', 'max_mem', None)
+        assert local.get_max_mem() is None
+        fyrd.conf.set_option('local', 'max_mem', 2000)
+        assert local.get_max_mem() == 2000
+        fyrd.conf.set_option('local', 'max_mem', 'auto')
+        assert local.get_max_mem() > 0
+        fyrd.conf.set_option('local', 'max_mem', 'lots')
+        with pytest.raises(local.QueueError):
+            local.get_max_mem()
+    finally:
+        fyrd.conf.set_option('local', 'max_mem', old)
+
+
+def test_scheduler_backfill():
+    """Reserve cores for a wide job and backfill only short jobs."""
+    local = fyrd.batch_systems.get_batch_system('local')
+    for policy, expected in [('fifo', [2, 3]), ('backfill', [2])]:
+        sched = local.Scheduler(4, policy=policy)
+        sched.queue(0, 1, runtime=100, now=0)
+        assert sched.schedule(now=0) == [0]
+        sched.queue(1, 4, runtime=100, now=0)
+        sched.queue(2, 1, runtime=50, now=0)
+        sched.queue(3, 1, runtime=500, now=0)
+        assert sched.schedule(now=0) == expected
+    # Jobs submitted by running jobs are never held back
+    sched.queue(4, 1, runtime=500, nested=True, now=0)
+    assert sched.schedule(now=0) == [4]
+    sched.finish(0)
+    sched.finish(2)
+    sched.finish(4)
+    assert sched.schedule(now=100) == [1]
+    # Higher priority first
+    sched = local.Scheduler(4, policy='priority')
+    sched.queue(0, 4, now=0)
+    sched.queue(1, 4, priority=10, now=0)
+    assert sched.schedule(now=0) == [1]
+
+
 @pytest.mark.skipif(not env,
                     reason="No valid batch system detected")
 def test_basic_job():
@@ -329,6 +493,19 @@ def test_multi_job_cleaning():
     assert not os.path.isfile(job2.submission.file_name)
 
 
+@pytest.mark.skipif(not env,
+                    reason="No valid batch system detected")
+def test_function_exception():
+    """A function job that raises fails and get() raises its exception."""
+    job = fyrd.Job(raise_error, ('local error',), clean_files=True,
+                   clean_outputs=True, qtype='local').submit()
+    with pytest.raises(ValueError, match='local error'):
+        job.get()
+    assert job.exitcode != 0
+    assert not os.path.exists(job.poutfile)
+    assert not os.path.exists(job.function.pickle_file)
+
+
 @pytest.mark.skipif(not env,
                     reason="No valid batch system detected")
 def test_function_submission():
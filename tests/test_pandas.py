@@ -5,6 +5,7 @@ Pandas is hard to install, so this isn't part of the travis py.test.
 """
 import os
 import sys
+import shutil
 import argparse
 from uuid import uuid4
 sys.path.append(os.path.abspath('.'))
@@ -37,11 +38,38 @@ def get_mean(d):
     return d.mean()
 
 
+def get_max(d):
+    """Get a dataframe max"""
+    return d.max()
+
+
+def row_count(d):
+    """Count the rows, as a Series."""
+    return pd.Series([len(d)], index=['rows'])
+
+
+def add_all(parts):
+    """Add up a list of Series."""
+    return sum(parts[1:], parts[0])
+
+
 def merge_two(d1, d2):
     """Merge two pandas dataframes."""
     return pd.concat([d1, d2])
 
 
+def double(d):
+    """Multiply by two."""
+    return d*2
+
+
+def slow_sum(d):
+    """Sum two columns slowly."""
+    import time
+    time.sleep(0.01)
+    return d.A + d.B
+
+
 def join_columns(d):
     """Merge three columns plus a sum."""
     return '{}.{}.{}'.format(d.s1, d.s2, d.A + d.B)
@@ -189,6 +217,127 @@ def test_parapply_summary_indirect(delete=True):
         raise
 
 
+@pytest.mark.skipif(not env,
+                    reason="No valid batch system detected")
+@pytest.mark.skipif(canrun is not True,
+                    reason="Need pandas and numpy installed")
+def test_parapply_shard_format():
+    """Hand shards to the jobs as Arrow files."""
+    df = make_df()
+    with pytest.raises(ValueError):
+        fyrd.helpers.parapply(2, df, join_columns, axis=1, shard_format='bob')
+    if fyrd.helpers._pa is None:
+        with pytest.raises(ValueError):
+            fyrd.helpers.parapply(2, df, join_columns, axis=1,
+                                  shard_format='feather')
+        pytest.skip('Needs pyarrow')
+    df_comp = df.copy()
+    df_comp['joined'] = df.apply(join_columns, axis=1)
+    for shard_format in ['feather', 'parquet']:
+        new_df = df.copy()
+        new_df['joined'] = fyrd.helpers.parapply(
+            2, df, join_columns, axis=1, shard_format=shard_format
+        )
+        assert new_df.equals(df_comp)
+        doubled = fyrd.helpers.parapply(
+            2, df[['A', 'B']], double, shard_format=shard_format
+        )
+        assert doubled.equals(df[['A', 'B']]*2)
+    assert not [i for i in os.listdir(fyrd.conf.get_job_paths({})[3])
+                if '.shard.' in i]
+
+
+@pytest.mark.skipif(canrun is not True,
+                    reason="Need pandas and numpy installed")
+def test_parapply_auto():
+    """Pick the number of jobs from a pilot and steal work from stragglers."""
+    df = make_df()
+    fyrd.conf.set_option('split', 'target_runtime', 0.2)
+    try:
+        out = fyrd.helpers.parapply('auto', df, slow_sum, axis=1,
+                                    qtype='inline', steal=True)
+        assert out.equals(df.A + df.B)
+        out = fyrd.helpers.parapply('auto', df[['A', 'B']], double,
+                                    qtype='inline', speculate=True)
+        assert out.equals(df[['A', 'B']]*2)
+    finally:
+        fyrd.conf.set_option('split', 'target_runtime',
+                             fyrd.conf.DEFAULTS['split']['target_runtime'])
+
+
+@pytest.mark.skipif(canrun is not True,
+                    reason="Need pandas and numpy installed")
+def test_parapply_files():
+    """Run parapply on CSV and Parquet files without loading them."""
+    df = make_df()
+    os.makedirs('parapply_files')
+    try:
+        df[:60].to_csv('parapply_files/a.csv', index=False)
+        df[60:].to_csv('parapply_files/b.csv', index=False)
+        out = fyrd.helpers.parapply(3, 'parapply_files/*.csv', join_columns,
+                                    axis=1, qtype='inline', fan_in=2)
+        assert list(out) == list(df.apply(join_columns, axis=1))
+        cols = list('ABCD')
+        out = fyrd.helpers.parapply_summary(
+            4, 'parapply_files', get_max, qtype='inline', fan_in=2,
+            read_kwds={'usecols': cols}
+        )
+        assert out.equals(df[cols].max())
+        out = fyrd.helpers.parapply(
+            2, ['parapply_files/a.csv'], double, qtype='inline',
+            read_kwds={'usecols': ['A', 'B']}, merge_apply=True,
+            outfile='parapply_files/out.tsv'
+        )
+        assert out == os.path.abspath('parapply_files/out.tsv')
+        # The index restarts in every piece of a CSV file
+        written = pd.read_csv(out, sep='\t', index_col=0)
+        assert (written.values == df[:60][['A', 'B']].values*4).all()
+        with pytest.raises(ValueError):
+            fyrd.helpers.parapply(2, 'parapply_files/a.csv', double,
+                                  steal=True)
+        if fyrd.helpers._pa is not None:
+            df.index += 100
+            df.to_parquet('parapply_files/c.parquet', row_group_size=10)
+            for shard_format in ['pickle', 'parquet']:
+                out = fyrd.helpers.parapply(
+                    4, 'parapply_files/c.parquet', double, qtype='inline',
+                    read_kwds={'columns': ['A', 'B']},
+                    shard_format=shard_format
+                )
+                assert out.equals(df[['A', 'B']]*2)
+        assert not [i for i in os.listdir(fyrd.conf.get_job_paths({})[3])
+                    if '.part_' in i or '.combine_' in i]
+    finally:
+        shutil.rmtree('parapply_files')
+
+
+@pytest.mark.skipif(canrun is not True,
+                    reason="Need pandas and numpy installed")
+def test_parapply_summary_reducers():
+    """Merge exact summaries with a tree of combine jobs."""
+    df = make_df()
+    num = df[list('ABCD')]
+    # A mean of the means of uneven pieces is not the mean
+    out = fyrd.helpers.parapply_summary(7, df, 'mean', qtype='inline',
+                                        fan_in=3)
+    assert ((out - num.mean()).abs() < 1e-9).all()
+    for reducer, expected in [('sum', num.sum()), ('count', df.count()),
+                              ('min', df.min()), ('max', df.max())]:
+        out = fyrd.helpers.parapply_summary(3, df, reducer, qtype='inline',
+                                            fan_in=2)
+        assert out.equals(expected)
+    rows = fyrd.helpers.Reducer(row_count, add_all)
+    assert fyrd.helpers.parapply_summary(
+        'auto', df, rows, qtype='inline', fan_in=2
+    )['rows'] == len(df)
+    with pytest.raises(ValueError):
+        fyrd.helpers.parapply_summary(2, df, 'median')
+    with pytest.raises(ValueError):
+        fyrd.helpers.parapply_summary(2, df, 'sum', speculate=True)
+    assert not [i for i in os.listdir(fyrd.conf.get_job_paths({})[3])
+                if '.part_' in i or '.combine_' in i]
+
+
 @pytest.mark.skip()
 def main(argv=None):
     """Get arguments and run tests."""
@@ -1,5 +1,7 @@
 """Test things in run.py that are not used often."""
 import os
+import subprocess
+import pytest
 import fyrd
 fyrd.logme.MIN_LEVEL = 'debug'
 
@@ -25,3 +27,139 @@ def test_which():
     """Test getting paths."""
     ls = fyrd.run.which('ls')
     ls = fyrd.run.which(ls)
+
+def test_split_ranges():
+    """Byte ranges cover the file at line boundaries."""
+    lines = ['header\n'] + ['{0}\t{1}\n'.format(i, 'x'*(i % 17))
+                            for i in range(500)]
+    with open('ranges.txt', 'w') as fout:
+        fout.write(''.join(lines))
+    ranges = fyrd.run.split_ranges('ranges.txt', 7, keep_header=True)
+    assert len(ranges) == 7
+    body = []
+    for spec in ranges:
+        with fyrd.run.open_zipped(spec) as fin:
+            part = fin.readlines()
+        assert part[0] == 'header\n'
+        body += part[1:]
+    assert body == lines[1:]
+    path, segments = fyrd.run.parse_range(ranges[3])
+    assert path == 'ranges.txt'
+    assert segments[0] == (0, len('header\n'))
+    assert fyrd.run.parse_range('ranges.txt') is None
+    out = subprocess.check_output(
+        ['bash', '-c', 'cat ' + fyrd.run.range_command(ranges[3])]
+    )
+    with fyrd.run.open_range(ranges[3], 'rb') as fin:
+        assert out == fin.read()
+    os.remove('ranges.txt')
+
+def test_split_file():
+    """Gzipped inputs are split into BGZF files, lines spread evenly."""
+    infile = os.path.join('tests', 'test.txt.gz')
+    with fyrd.run.open_zipped(infile) as fin:
+        lines = fin.readlines()
+    files = fyrd.run.split_file(infile, 3, threads=2)
+    assert len(files) == 3
+    split = []
+    for fl in files:
+        with open(fl, 'rb') as fin:
+            assert fin.read(4) == b'\x1f\x8b\x08\x04'
+        assert fl.endswith('.gz')
+        with fyrd.run.open_zipped(fl) as fin:
+            split.append(fin.readlines())
+        os.remove(fl)
+    assert sum(split, []) == lines
+    assert max([len(i) for i in split]) - min([len(i) for i in split]) <= 1
+
+def test_record_splitters():
+    """FASTQ and quoted CSV records are never cut, in both split modes."""
+    fastq = ''.join(['@read{0}\nACGT\n+\n@@II\n'.format(i) for i in range(99)])
+    csv = 'id,text\n' + ''.join(
+        ['{0},"two\nlines"\n'.format(i) if i % 2 else '{0},one\n'.format(i)
+         for i in range(99)]
+    )
+    for name, text, header in [('test.fastq', fastq, False),
+                               ('test.csv', csv, True)]:
+        with open(name, 'w') as fout:
+            fout.write(text)
+        splitter = name.split('.')[-1]
+        files = fyrd.run.split_file(name, 4, keep_header=header,
+                                    splitter=splitter)
+        ranges = fyrd.run.split_ranges(name, 4, keep_header=header,
+                                       splitter=splitter)
+        for splits in [files, ranges]:
+            parts = []
+            for split in splits:
+                with fyrd.run.open_zipped(split) as fin:
+                    part = fin.read()
+                if header:
+                    assert part.startswith('id,text\n')
+                    part = part[8:]
+                if splitter == 'fastq':
+                    assert part.startswith('@read')
+                    assert part.count('\n') % 4 == 0
+                else:
+                    assert part.count('"') % 2 == 0
+                parts.append(part)
+            assert ''.join(parts) == (text[8:] if header else text)
+        for split in files:
+            os.remove(split)
+        os.remove(name)
+
+def test_append_and_merge_sorted():
+    """Append files without reading them and k-way merge sorted files."""
+    files = ['merge_{0}.txt'.format(i) for i in range(3)]
+    for i, fl in enumerate(files):
+        with open(fl, 'w') as fout:
+            fout.write('head\n' + ''.join(
+                ['{0}\n'.format(j) for j in range(i, 30, 3)]
+            ))
+    try:
+        with open('merge.out', 'wb') as fout:
+            fout.write(b'start\n')
+            for fl in files:
+                fyrd.run.append_file(fout, fl, skip_lines=1)
+        with open('merge.out') as fin:
+            lines = fin.read().split()
+        assert lines[0] == 'start'
+        assert len(lines) == 31
+        assert sorted(lines[1:], key=int) == [str(i) for i in range(30)]
+        with open('merge.out', 'w') as fout:
+            assert fyrd.run.merge_sorted(files, fout, key=int,
+                                         skip_lines=1) == 30
+        with open('merge.out') as fin:
+            assert fin.read().split() == [str(i) for i in range(30)]
+    finally:
+        for fl in files + ['merge.out']:
+            os.remove(fl)
+
+def test_count_lines():
+    """Count newlines in plain and compressed files, with threads."""
+    import gzip
+    text = b'one\ttwo\n' * 5000 + b'no newline'
+    with open('count test.txt', 'wb') as fout:
+        fout.write(text)
+    with gzip.open('count_test.gz', 'wb') as fout:
+        fout.write(text)
+    # Two gzip members, like bgzip output
+    with open('count_test.gz', 'rb') as fin:
+        data = fin.read()
+    with open('count_test2.gz', 'wb') as fout:
+        fout.write(data + data)
+    block = fyrd.run._COUNT_BLOCK
+    fyrd.run._COUNT_BLOCK = 512
+    try:
+        assert fyrd.run.count_lines('count test.txt') == 5000
+        assert fyrd.run.count_lines('count test.txt', threads=3) == 5000
+        assert fyrd.run.count_lines('count test.txt', True) == 5000
+        assert fyrd.run.count_lines('count_test.gz') == 5000
+        assert fyrd.run.count_lines('count_test2.gz') == 10000
+        with open('count_test2.gz', 'wb') as fout:
+            fout.write(data[:len(data)//2])
+        with pytest.raises(EOFError):
+            fyrd.run.count_lines('count_test2.gz')
+    finally:
+        fyrd.run._COUNT_BLOCK = block
+        for fl in ['count test.txt', 'count_test.gz', 'count_test2.gz']:
+            os.remove(fl)
@@ -0,0 +1,132 @@
+"""Test the function pickle files."""
+import os
+import sys
+import dill
+import pytest
+sys.path.append(os.path.abspath('.'))
+from fyrd import serialize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def test_roundtrip():
+    """Objects and closures survive dump and load, old files still load."""
+    power = 3
+    serialize.dump((lambda x: x**power, (2,), {}), 'test.pickle')
+    func, args, kwargs = serialize.load('test.pickle')
+    assert func(*args, **kwargs) == 8
+    assert serialize.buffer_files('test.pickle') == []
+    serialize.remove('test.pickle')
+    assert not os.path.exists('test.pickle')
+    with open('test.pickle', 'wb') as fout:
+        dill.dump({'a': 1}, fout)
+    assert serialize.load('test.pickle') == {'a': 1}
+    serialize.remove('test.pickle')
+
+
+@pytest.mark.skipif(np is None or not serialize.OOB,
+                    reason="Needs numpy and pickle protocol 5")
+def test_out_of_band():
+    """Large arrays are written to buffer files and mapped on load."""
+    big = np.arange(500000, dtype=float)
+    small = np.arange(10)
+    buffers = serialize.dump((big, small), 'test.pickle', buffer_dir='.')
+    assert len(buffers) == 1
+    assert os.path.getsize('test.pickle') < 1000
+    assert serialize.buffer_files('test.pickle') == buffers
+    big2, small2 = serialize.load('test.pickle', delete_buffers=True)
+    assert not os.path.exists(buffers[0])
+    assert (big2 == big).all()
+    assert (small2 == small).all()
+    base = big2
+    while getattr(base, 'base', None) is not None:
+        base = base.base
+    assert isinstance(base.obj, serialize._mmap.mmap)
+    # Copy-on-write
+    big2[0] = 7
+    assert big2[0] == 7
+    serialize.remove('test.pickle')
+
+
+@pytest.mark.skipif(np is None or not serialize.OOB,
+                    reason="Needs numpy and pickle protocol 5")
+def test_sidecar_cleaning():
+    """clean_dir removes out-of-band sidecar files with their pickles."""
+    import fyrd
+    os.mkdir('sidecar_test')
+    pfile = os.path.join('sidecar_test', 'bob_func.cluster.py.pickle.in')
+    buffers = serialize.dump(np.arange(500000, dtype=float), pfile,
+                             buffer_dir='sidecar_test')
+    assert len(buffers) == 1
+    deleted = fyrd.clean_dir('sidecar_test', suffix='cluster',
+                             delete_outputs=False)
+    assert sorted(deleted) == sorted([os.path.abspath(pfile), buffers[0]])
+    assert not os.listdir('sidecar_test')
+    os.rmdir('sidecar_test')
+
+
+def test_serializers():
+    """Every registered serializer round trips, unsupported objects use dill."""
+    data = {'a': list(range(100)), 'b': 'hi'}
+    for name in serialize.SERIALIZERS:
+        serialize.dump(data, 'test.pickle', serializer=name)
+        with open('test.pickle', 'rb') as fin:
+            header = serialize.read_header(fin)
+        assert header['serializer'] == ('dill' if name == 'arrow' else name)
+        assert serialize.load('test.pickle') == data
+    power = 2
+    serialize.dump(lambda x: x**power, 'test.pickle', serializer='pickle')
+    with open('test.pickle', 'rb') as fin:
+        assert serialize.read_header(fin)['serializer'] == 'dill'
+    assert serialize.load('test.pickle')(3) == 9
+    serialize.remove('test.pickle')
+    with pytest.raises(ValueError):
+        serialize.dump(data, 'test.pickle', serializer='bob')
+
+
+def test_compression():
+    """Large pickles are compressed with the chosen codec, small ones not."""
+    data = ['fyrd'] * 100000
+    for codec in list(serialize.CODECS) + ['auto']:
+        serialize.dump(data, 'test.pickle', compression=codec,
+                       buffer_dir='.')
+        with open('test.pickle', 'rb') as fin:
+            header = serialize.read_header(fin)
+        assert header['codec'] == serialize.get_codec(codec)
+        assert header['buffers'] == []
+        assert os.path.getsize('test.pickle') < 10000
+        assert serialize.load('test.pickle') == data
+    serialize.dump(data[:10], 'test.pickle', compression='gzip')
+    with open('test.pickle', 'rb') as fin:
+        assert 'codec' not in serialize.read_header(fin)
+    assert serialize.load('test.pickle') == data[:10]
+    serialize.remove('test.pickle')
+    with pytest.raises(ValueError):
+        serialize.dump(data, 'test.pickle', compression='bob')
+
+
+def test_blobs():
+    """Shared objects are stored once and released with their last pickle."""
+    blob_dir = os.path.join('blob_test', serialize.BLOB_DIR)
+    os.mkdir('blob_test')
+    shared = list(range(50000))
+    pfiles = [os.path.join('blob_test', 'job{0}.pickle.in'.format(i))
+              for i in range(3)]
+    for i, pfile in enumerate(pfiles):
+        serialize.dump((shared, i), pfile, blobs=[shared, i],
+                       blob_dir=blob_dir)
+        assert os.path.getsize(pfile) < 1000
+    assert len(os.listdir(blob_dir)) == 1
+    blob = os.path.join(blob_dir, os.listdir(blob_dir)[0])
+    assert os.stat(blob).st_nlink == 4
+    assert serialize.load(pfiles[1]) == (shared, 1)
+    serialize.remove(pfiles[0])
+    assert os.stat(blob).st_nlink == 3
+    for pfile in pfiles[1:]:
+        serialize.remove(pfile)
+    # The emptied store is removed too
+    assert not os.path.exists(blob_dir)
+    os.rmdir('blob_test')